@@ -4,30 +4,67 @@ from app.utils.cache import cache
 from app.config import Config
 from app.utils.worker import AsyncWorker
 from app.utils.zmq_logger import ZMQLogger
+from app.utils.jobs import JobManager
+from app.utils.lookup_table import LookupTables
+from app.utils.write_behind import WriteBehindQueue
+from app.utils.stats import StreamingStats
+from app.utils.result_store import ResultStore
+from app.utils.single_flight import SingleFlight
+from app.utils.admission import AdmissionController
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
 db = SQLAlchemy()
-worker = AsyncWorker(max_workers=5)
-logger = ZMQLogger()
+worker = AsyncWorker(
+    max_workers=Config.WORKER_THREADS,
+    backend=Config.WORKER_BACKEND,
+    process_workers=Config.WORKER_PROCESSES,
+    inline_cost=Config.WORKER_INLINE_COST,
+    process_cost=Config.WORKER_PROCESS_COST,
+    start_method=Config.WORKER_START_METHOD,
+    interactive_cost=Config.WORKER_INTERACTIVE_COST,
+    bulk_cost=Config.WORKER_BULK_COST,
+    lane_limits={"standard": Config.WORKER_STANDARD_CONCURRENCY or None,
+                 "bulk": Config.WORKER_BULK_CONCURRENCY or None},
+    aging=Config.WORKER_AGING,
+)
+jobs = JobManager(worker)
+lookup_tables = LookupTables()
+persistence = WriteBehindQueue(db)
+stats = StreamingStats()
+results = ResultStore()
+flights = SingleFlight(cache)
+admission = AdmissionController(db)
+logger = ZMQLogger(Config.LOG_FRONTEND_ADDRESS)
 limiter = Limiter(
     key_func=get_remote_address
 )
 
 
-def create_app():
+def create_app(config: dict = None):
     """
     Create and configure the Flask application.
     This function initializes the Flask app, configures it with settings from Config,
     initializes the database and cache, and registers the API routes.
+    :param config: Settings overriding Config, applied before the extensions
+        are initialized
     :return: Configured Flask application instance
     """
     app = Flask(__name__)
     app.config.from_object(Config)
+    app.config.update(config or {})
 
     db.init_app(app)
     cache.init_app(app)
     limiter.init_app(app)
+    jobs.init_app(app)
+    lookup_tables.init_app(app)
+    persistence.init_app(app)
+    stats.init_app(app)
+    results.init_app(app)
+    logger.init_app(app)
+    flights.init_app(app)
+    admission.init_app(app)
 
     from app.routes.api_routes import register_routes
     register_routes(app)
@@ -0,0 +1,125 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from werkzeug.exceptions import HTTPException
+from app import limiter, worker
+from app.routes.api_routes import controller
+
+
+class _PooledWsgiInstance(WsgiToAsgiInstance):
+    """
+    WsgiToAsgiInstance running the WSGI application on a thread pool. The
+    asgiref wrapper runs it with thread_sensitive=True, which serializes every
+    delegated request on one shared thread.
+    """
+    def __init__(self, wsgi_application, executor: ThreadPoolExecutor):
+        super().__init__(wsgi_application)
+        self.executor = executor
+
+    async def run_wsgi_app(self, body):
+        run = sync_to_async(WsgiToAsgiInstance.__dict__["run_wsgi_app"].func,
+                            thread_sensitive=False, executor=self.executor)
+        await run(self, body)
+
+
+class AsyncMathApp:
+    """
+    ASGI application that serves the math endpoints natively on the event loop.
+    A computation is awaited on the AsyncWorker instead of holding a server
+    thread, so slow requests do not starve /ping and cheap requests. Every
+    other route is delegated to the Flask application, run on a pool of
+    ASGI_WSGI_THREADS threads so that a slow delegated request does not hold
+    up the others either.
+    """
+    def __init__(self, flask_app):
+        """
+        Initialize the ASGI application.
+        :param flask_app: The configured Flask application
+        """
+        self.flask_app = flask_app
+        self.wsgi_executor = ThreadPoolExecutor(
+            max_workers=flask_app.config.get("ASGI_WSGI_THREADS", 16),
+            thread_name_prefix="asgi-wsgi")
+        self.routes = {
+            "/api/fibonacci": controller.fibonacci_async,
+            "/api/power": controller.power_async,
+            "/api/factorial": controller.factorial_async,
+        }
+
+    async def __call__(self, scope, receive, send):
+        """
+        ASGI entry point.
+        """
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+
+        handler = None
+        if scope["type"] == "http" and scope["method"] == "POST":
+            handler = self.routes.get(scope["path"])
+        if handler is None:
+            return await _PooledWsgiInstance(self.flask_app, self.wsgi_executor)(
+                scope, receive, send)
+
+        body = await self._read_body(receive)
+        environ = self._build_environ(scope, body)
+        with self.flask_app.request_context(environ):
+            try:
+                limiter.check()
+                rv = await handler()
+            except HTTPException as e:
+                rv = self.flask_app.handle_user_exception(e)
+            response = self.flask_app.make_response(rv)
+            response = self.flask_app.process_response(response)
+            await self._send_response(send, response)
+
+    def _build_environ(self, scope, body: bytes) -> dict:
+        """
+        Build a WSGI environ from the ASGI scope, reusing the asgiref translation
+        so both paths see identical requests.
+        """
+        instance = WsgiToAsgiInstance(self.flask_app)
+        instance.scope = scope
+        environ = instance.build_environ(scope, io.BytesIO(body))
+        # The body is fully buffered, so its length is known even when chunked
+        environ["CONTENT_LENGTH"] = str(len(body))
+        return environ
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        """
+        Read the full request body from the ASGI receive channel.
+        """
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        return b"".join(chunks)
+
+    @staticmethod
+    async def _send_response(send, response):
+        """
+        Send a Flask response over the ASGI send channel.
+        """
+        headers = [(name.lower().encode("latin1"), value.encode("latin1"))
+                   for name, value in response.headers.items()]
+        await send({"type": "http.response.start",
+                    "status": response.status_code,
+                    "headers": headers})
+        await send({"type": "http.response.body", "body": response.get_data()})
+
+    async def _lifespan(self, receive, send):
+        """
+        Handle the ASGI lifespan protocol, shutting the worker down on exit.
+        """
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                worker.shutdown(wait=False)
+                self.wsgi_executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
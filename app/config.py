@@ -13,5 +13,82 @@ class Config:
     SECRET_KEY = os.getenv("SECRET_KEY")  # not used, just for example
     SQLALCHEMY_DATABASE_URI = os.getenv("DATABASE_URL")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    CACHE_TYPE = "SimpleCache"
+    # Shared by every process on the host, see app/utils/shared_cache.py
+    CACHE_TYPE = os.getenv("CACHE_TYPE", "app.utils.shared_cache.SharedMemoryCache")
     CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_SHARED_PATH = os.getenv("CACHE_SHARED_PATH")
+    CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    # Compute time in seconds assumed for cached values without a cost hint
+    CACHE_DEFAULT_COST = float(os.getenv("CACHE_DEFAULT_COST", 1e-3))
+    # Identical computations in flight are deduplicated, see app/utils/single_flight.py
+    SINGLE_FLIGHT_SHARED = os.getenv("SINGLE_FLIGHT_SHARED", "true").lower() == "true"
+    SINGLE_FLIGHT_LOCK_TIMEOUT = int(os.getenv("SINGLE_FLIGHT_LOCK_TIMEOUT", 600))
+    SINGLE_FLIGHT_POLL_INTERVAL = float(os.getenv("SINGLE_FLIGHT_POLL_INTERVAL", 0.05))
+    # Compute budget in estimated seconds in flight, see app/utils/admission.py
+    ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_BUDGET = float(os.getenv("ADMISSION_BUDGET", 30.0))
+    ADMISSION_CHEAP_COST = float(os.getenv("ADMISSION_CHEAP_COST", 0.05))
+    ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", 2.0))
+    ADMISSION_HISTORY = int(os.getenv("ADMISSION_HISTORY", 5000))
+    # Per-client limit in cost units of ADMISSION_COST_UNIT estimated seconds
+    ADMISSION_COST_UNIT = float(os.getenv("ADMISSION_COST_UNIT", 0.1))
+    RATELIMIT_COST_LIMIT = os.getenv("RATELIMIT_COST_LIMIT", "3000/hour")
+    # Threads serving the routes the ASGI entry point delegates to Flask
+    ASGI_WSGI_THREADS = int(os.getenv("ASGI_WSGI_THREADS", 16))
+    WORKER_BACKEND = os.getenv("WORKER_BACKEND", "hybrid")
+    WORKER_THREADS = int(os.getenv("WORKER_THREADS", 5))
+    WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", os.cpu_count() or 1))
+    WORKER_START_METHOD = os.getenv("WORKER_START_METHOD", "spawn")
+    # Estimated result size in bits, see MathService.estimate_cost
+    WORKER_INLINE_COST = float(os.getenv("WORKER_INLINE_COST", 20_000))
+    WORKER_PROCESS_COST = float(os.getenv("WORKER_PROCESS_COST", 500_000))
+    # Scheduling lanes by estimated cost, see AsyncWorker; 0 means no limit
+    WORKER_INTERACTIVE_COST = float(os.getenv("WORKER_INTERACTIVE_COST", 200_000))
+    WORKER_BULK_COST = float(os.getenv("WORKER_BULK_COST", 2_000_000))
+    WORKER_STANDARD_CONCURRENCY = int(os.getenv("WORKER_STANDARD_CONCURRENCY", 0))
+    WORKER_BULK_CONCURRENCY = int(os.getenv("WORKER_BULK_CONCURRENCY",
+                                            max(WORKER_PROCESSES - 1, 1)))
+    WORKER_AGING = float(os.getenv("WORKER_AGING", 2.0))
+    JOBS_MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", 16))
+    JOBS_RESULT_TTL = int(os.getenv("JOBS_RESULT_TTL", 3600))
+    # Per-process checkpoints of Fibonacci and factorial values, see MathService
+    CHECKPOINT_MAX_BYTES = int(os.getenv("CHECKPOINT_MAX_BYTES", 64 * 1024 * 1024))
+    CHECKPOINT_MIN_N = int(os.getenv("CHECKPOINT_MIN_N", 1000))
+    # Precomputed values for small inputs, memory-mapped at startup
+    LOOKUP_TABLE_ENABLED = os.getenv("LOOKUP_TABLE_ENABLED", "true").lower() == "true"
+    LOOKUP_TABLE_PATH = os.getenv("LOOKUP_TABLE_PATH")
+    LOOKUP_FIBONACCI_COUNT = int(os.getenv("LOOKUP_FIBONACCI_COUNT", 10_000))
+    LOOKUP_FACTORIAL_COUNT = int(os.getenv("LOOKUP_FACTORIAL_COUNT", 2_000))
+    # Write-behind persistence of MathRequest rows, see app/utils/write_behind.py
+    PERSIST_WRITE_BEHIND = os.getenv("PERSIST_WRITE_BEHIND", "true").lower() == "true"
+    PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", 200))
+    PERSIST_FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", 1.0))
+    PERSIST_MAX_QUEUE = int(os.getenv("PERSIST_MAX_QUEUE", 10_000))
+    # Results larger than this are stored out-of-line, see app/utils/result_store.py
+    RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH")
+    RESULT_INLINE_BITS = int(os.getenv("RESULT_INLINE_BITS", 800))
+    # Log ingestion: LogBroker addresses and consumer processes, see app/consumers
+    LOG_FRONTEND_ADDRESS = os.getenv("LOG_FRONTEND_ADDRESS", "tcp://localhost:5555")
+    LOG_BACKEND_ADDRESS = os.getenv("LOG_BACKEND_ADDRESS", "tcp://localhost:5556")
+    LOG_CONSUMER_WORKERS = int(os.getenv("LOG_CONSUMER_WORKERS", 2))
+    LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 500))
+    # Non-blocking ZMQLogger queue and overflow policy, see app/utils/zmq_logger.py
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10_000))
+    LOG_SNDHWM = int(os.getenv("LOG_SNDHWM", 100_000))
+    LOG_DROP_POLICY = os.getenv("LOG_DROP_POLICY", "drop_new")
+    LOG_SAMPLE_RATE = int(os.getenv("LOG_SAMPLE_RATE", 10))
+    # "batch" packs many records per message, see app/utils/log_wire.py
+    LOG_WIRE_FORMAT = os.getenv("LOG_WIRE_FORMAT", "json")
+    LOG_SEND_BATCH_SIZE = int(os.getenv("LOG_SEND_BATCH_SIZE", 500))
+    LOG_SEND_LINGER = float(os.getenv("LOG_SEND_LINGER", 0.05))
+    # Raw rows older than this are rolled into hourly aggregates and pruned
+    RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "true").lower() == "true"
+    RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", 30))
+    RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 5000))
+    RETENTION_BATCH_PAUSE = float(os.getenv("RETENTION_BATCH_PAUSE", 0.05))
+    RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", 3600))
+    # In-memory request statistics merged across workers, see app/utils/stats.py
+    STATS_SHARED = os.getenv("STATS_SHARED", "true").lower() == "true"
+    STATS_SHARED_PATH = os.getenv("STATS_SHARED_PATH")
+    STATS_PUBLISH_INTERVAL = float(os.getenv("STATS_PUBLISH_INTERVAL", 1.0))
+    STATS_RELATIVE_ACCURACY = float(os.getenv("STATS_RELATIVE_ACCURACY", 0.01))
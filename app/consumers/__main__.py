@@ -0,0 +1,45 @@
+"""
+Standalone log ingestion entry point.
+
+    python -m app.consumers                  # broker + LOG_CONSUMER_WORKERS consumers
+    python -m app.consumers --workers 4      # broker + 4 consumers
+    python -m app.consumers --connect tcp://broker-host:5556   # one consumer only
+
+Stops gracefully on SIGTERM or SIGINT.
+"""
+import argparse
+import signal
+import threading
+from app.config import Config
+from app.consumers.log_broker import LogIngestion, run_consumer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the ZMQ log ingestion workers.")
+    parser.add_argument("--workers", type=int, default=Config.LOG_CONSUMER_WORKERS,
+                        help="number of consumer processes started with the broker")
+    parser.add_argument("--connect", metavar="ADDRESS",
+                        help="run a single consumer pulling from an existing broker")
+    parser.add_argument("--batch-size", type=int, default=Config.LOG_BATCH_SIZE,
+                        help="maximum number of messages per bulk insert")
+    args = parser.parse_args()
+
+    if args.connect:
+        run_consumer(args.connect, args.batch_size)
+        return
+
+    ingestion = LogIngestion(workers=args.workers,
+                             frontend=Config.LOG_FRONTEND_ADDRESS,
+                             backend=Config.LOG_BACKEND_ADDRESS,
+                             batch_size=args.batch_size)
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+    ingestion.start()
+    stopped.wait()
+    print("Stopping log ingestion...")
+    ingestion.stop()
+
+
+if __name__ == "__main__":
+    main()
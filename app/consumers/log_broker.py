@@ -0,0 +1,189 @@
+import multiprocessing
+import signal
+import threading
+import zmq
+from app.consumers.zmq_log_consumer import ZMQLogConsumer
+
+
+class LogBroker:
+    """
+    ZMQ device between the log publishers and the consumer workers.
+    It binds a SUB socket where the ZMQLogger instances publish, and a PUSH
+    socket that the consumers connect to with PULL. PUSH hands each message to
+    exactly one connected consumer, so adding consumers spreads the load
+    without duplicating messages.
+    """
+    def __init__(self, frontend="tcp://localhost:5555", backend="tcp://localhost:5556",
+                 topics=None, linger=2000, hwm=100_000):
+        """
+        Initializes the broker.
+        :param frontend: Address the loggers publish to
+        :param backend: Address the consumers connect to
+        :param topics: List of topics to forward. Defaults to ["INFO", "ERROR"],
+            which also match the batch frames of these levels ("INFO.BATCH").
+        :param linger: Milliseconds to keep delivering queued messages to the
+            consumers after the broker is stopped
+        :param hwm: Messages queued per socket before new ones are dropped, to
+            absorb bursts larger than the consumers can take at once
+        """
+        self.frontend = frontend
+        self.backend = backend
+        self.topics = topics or ["INFO", "ERROR"]
+        self.linger = linger
+        self.hwm = hwm
+        self.context = zmq.Context()
+        self._control = f"inproc://log-broker-control-{id(self)}"
+        self._ready = threading.Event()
+
+    def run(self):
+        """
+        Runs the device until stop() is called.
+        """
+        frontend = self.context.socket(zmq.SUB)
+        backend = self.context.socket(zmq.PUSH)
+        control = self.context.socket(zmq.PAIR)
+        backend.setsockopt(zmq.LINGER, self.linger)
+        frontend.setsockopt(zmq.RCVHWM, self.hwm)
+        backend.setsockopt(zmq.SNDHWM, self.hwm)
+        try:
+            frontend.bind(self.frontend)
+            for topic in self.topics:
+                frontend.setsockopt_string(zmq.SUBSCRIBE, topic)
+            backend.bind(self.backend)
+            control.bind(self._control)
+            self._ready.set()
+            print(f"ZMQ Log Broker forwarding {self.frontend} to {self.backend}")
+            self._forward(frontend, backend, control)
+        finally:
+            frontend.close(linger=0)
+            control.close(linger=0)
+            backend.close()
+            # Blocks until the messages still queued for the consumers are
+            # delivered, for at most linger milliseconds
+            self.context.term()
+            self._ready.set()
+
+    @staticmethod
+    def _forward(frontend, backend, control):
+        """
+        Forward messages from frontend to backend until control receives a
+        message. zmq.proxy_steerable could miss the TERMINATE command right
+        after a burst of messages, so the loop is explicit.
+        """
+        poller = zmq.Poller()
+        poller.register(frontend, zmq.POLLIN)
+        poller.register(control, zmq.POLLIN)
+        while True:
+            events = dict(poller.poll())
+            if control in events:
+                return
+            # Bounded, so a steady stream cannot delay the stop command
+            for _ in range(1000):
+                try:
+                    frames = frontend.recv_multipart(zmq.NOBLOCK, copy=False)
+                except zmq.Again:
+                    break
+                backend.send_multipart(frames, copy=False)
+
+    def start(self) -> threading.Thread:
+        """
+        Runs the device in a daemon thread and waits until it is bound.
+        """
+        thread = threading.Thread(target=self.run, daemon=True, name="log-broker")
+        thread.start()
+        self._ready.wait()
+        return thread
+
+    def stop(self):
+        """
+        Stops the device. Called from another thread than run().
+        """
+        control = self.context.socket(zmq.PAIR)
+        control.connect(self._control)
+        control.send(b"STOP")
+        control.close()
+
+
+def run_consumer(address: str, batch_size: int = 500, handle_sigint: bool = True):
+    """
+    Entry point of a consumer worker process: pulls from the broker until it
+    receives SIGTERM (or SIGINT), then stores what it already received and exits.
+    :param handle_sigint: If False, SIGINT is ignored so that a parent process
+        can stop the broker before its consumers
+    """
+    consumer = ZMQLogConsumer(address=address, batch_size=batch_size, mode="pull",
+                              poll_timeout=200)
+    signal.signal(signal.SIGTERM, lambda signum, frame: consumer.stop())
+    signal.signal(signal.SIGINT, (lambda signum, frame: consumer.stop())
+                  if handle_sigint else signal.SIG_IGN)
+    consumer.run()
+
+
+class LogIngestion:
+    """
+    Log ingestion topology: one LogBroker thread and a number of consumer
+    worker processes pulling from it.
+    """
+    def __init__(self, workers: int = 2, frontend="tcp://localhost:5555",
+                 backend="tcp://localhost:5556", batch_size: int = 500,
+                 start_method: str = "spawn"):
+        """
+        Initializes the topology.
+        :param workers: Number of consumer processes
+        :param frontend: Address the loggers publish to
+        :param backend: Address the consumers pull from
+        :param batch_size: Maximum number of messages per bulk insert
+        :param start_method: multiprocessing start method of the consumers
+        """
+        self.broker = LogBroker(frontend, backend)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.start_method = start_method
+        self.processes = []
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Builds the topology from the LOG_* settings of a configuration.
+        """
+        return cls(workers=config.get("LOG_CONSUMER_WORKERS", 2),
+                   frontend=config.get("LOG_FRONTEND_ADDRESS", "tcp://localhost:5555"),
+                   backend=config.get("LOG_BACKEND_ADDRESS", "tcp://localhost:5556"),
+                   batch_size=config.get("LOG_BATCH_SIZE", 500))
+
+    def start(self):
+        """
+        Starts the broker and the consumer processes.
+        """
+        self._thread = self.broker.start()
+        context = multiprocessing.get_context(self.start_method)
+        for i in range(self.workers):
+            process = context.Process(target=run_consumer,
+                                      args=(self.broker.backend, self.batch_size,
+                                            False),
+                                      name=f"log-consumer-{i}", daemon=True)
+            process.start()
+            self.processes.append(process)
+
+    def stop(self, timeout: float = 10):
+        """
+        Stops the broker first so no new messages are accepted, then asks every
+        consumer to store what it received and exit.
+        """
+        if self._thread is not None:
+            self.broker.stop()
+            self._thread.join(timeout)
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout)
+        self.processes = []
+
+    def wait(self):
+        """
+        Blocks until the consumer processes exit.
+        """
+        for process in self.processes:
+            process.join()
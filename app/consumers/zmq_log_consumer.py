@@ -1,71 +1,213 @@
 import zmq
 import orjson
+from datetime import datetime
 from app.database import db
 from app.models.log import LogEntry
+from app.utils.log_wire import decode_batch, is_batch_topic
+from app.utils.formatting import clip
 from app import create_app
 
+MESSAGE_LENGTH = LogEntry.message.type.length
+
 
 class ZMQLogConsumer:
     """
     ZMQ Log Consumer that listens for log messages on a specified ZMQ address.
+    The Flask app and its context are created once; messages are drained from the
+    socket in batches and each batch is stored with a single bulk insert.
+
+    In "sub" mode the consumer binds a SUB socket and receives from the loggers
+    directly. In "pull" mode it connects a PULL socket to a LogBroker, which
+    hands every message to exactly one of its consumers, so several consumer
+    processes can share the load.
+
+    Both wire formats of ZMQLogger are accepted: one JSON record per message,
+    and batch frames of many records under the "<LEVEL>.BATCH" topics.
     """
-    def __init__(self, address="tcp://localhost:5555", topics=None):
+    def __init__(self, address="tcp://localhost:5555", topics=None, app=None,
+                 batch_size=500, poll_timeout=1000, echo=False, mode="sub"):
         """
         Initializes the ZMQ Log Consumer.
-        :param address: The ZMQ address to bind the subscriber socket.
-        :param topics: List of topics to subscribe to. Defaults to ["INFO", "ERROR"].
+        :param address: The ZMQ address to bind the subscriber socket, or the
+            broker address to connect to in "pull" mode.
+        :param topics: List of topics to subscribe to. Defaults to ["INFO", "ERROR"],
+            which also match the batch frames of these levels ("INFO.BATCH").
+        :param app: Flask application used for database access. Created on first
+            use if not given.
+        :param batch_size: Maximum number of messages stored per bulk insert.
+        :param poll_timeout: Milliseconds to wait for messages before checking
+            whether the consumer was stopped.
+        :param echo: If True, print every message to the console.
+        :param mode: "sub" to bind a SUB socket, or "pull" to connect to a broker
         """
+        if mode not in ("sub", "pull"):
+            raise ValueError(f"Unknown consumer mode: {mode}")
+        self.mode = mode
         self.context = zmq.Context()
-        self.subscriber = self.context.socket(zmq.SUB)
+        self.subscriber = self.context.socket(zmq.SUB if mode == "sub" else zmq.PULL)
         self.address = address
         self.topics = topics or ["INFO", "ERROR"]
+        self.app = app
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.echo = echo
+        self.received = 0
+        self.stored = 0
+        self._running = False
 
     def setup(self):
         """
         Sets up the ZMQ subscriber socket. Binds to the specified address and subscribes
-        to the given topics.
+        to the given topics, or connects to the broker in "pull" mode.
         """
+        if self.mode == "pull":
+            self.subscriber.connect(self.address)
+            print(f"ZMQ Log Consumer connected to broker at {self.address}")
+            return
         self.subscriber.bind(self.address)
         for topic in self.topics:
             self.subscriber.setsockopt_string(zmq.SUBSCRIBE, topic)
         print(f"ZMQ Log Consumer bound to {self.address} and listening "
               f"for topics: {self.topics}")
 
-    def handle_message(self, topic: bytes, payload: bytes):
+    @staticmethod
+    def normalize_operation(operation):
         """
-        Handles incoming messages from the ZMQ subscriber. Parses the message and prints
-        it to the console.
+        Stores operation labels in lowercase, as math_requests and the rollups
+        name operations, so /api/logs can filter them with the operation index.
         """
+        return operation.lower() if isinstance(operation, str) else operation
 
+    def parse_message(self, topic: bytes, payload: bytes):
+        """
+        Parses an incoming message into the column values of a LogEntry.
+        :return: A dict of LogEntry values, or None if the message is invalid.
+        """
         try:
-
             log = orjson.loads(payload)
             level = log.get('level', 'INFO').upper()
             message = log.get('message', 'No message provided')
             source = log.get('source', 'Unknown source')
             context = log.get('context', {})
             operation = log.get('operation', None)
+        except Exception as e:
+            print(f"[ZMQ Consumer Error] Failed to parse message: {e}")
+            return None
+
+        if self.echo:
             print(f"[{level}] {message} (Source: {source}, Context: {context})")
+        return {
+            "level": level,
+            "message": clip(str(message), MESSAGE_LENGTH),
+            "details": context,
+            "operation": self.normalize_operation(operation),
+            "created_at": datetime.utcnow(),
+        }
 
-            with create_app().app_context():
-                log_entry = LogEntry(
-                    level=level,
-                    message=message,
-                    details=context,
-                    operation=operation,
-                )
+    def parse_batch(self, payload: bytes) -> list:
+        """
+        Parses a batch frame into the column values of its LogEntry rows, keeping
+        the time each record was logged.
+        :return: A list of dicts of LogEntry values, empty if the frame is invalid.
+        """
+        try:
+            records = decode_batch(payload)
+        except ValueError as e:
+            print(f"[ZMQ Consumer Error] Failed to parse batch: {e}")
+            return []
 
-                db.session.add(log_entry)
-                db.session.commit()
+        rows = []
+        for record in records:
+            if self.echo:
+                print(f"[{record['level']}] {record['message']} "
+                      f"(Source: {record['source']}, Context: {record['context']})")
+            rows.append({
+                "level": record["level"],
+                "message": clip(record["message"], MESSAGE_LENGTH),
+                "details": record["context"],
+                "operation": self.normalize_operation(record["operation"]),
+                "created_at": datetime.utcfromtimestamp(record["timestamp"]),
+            })
+        return rows
 
+    def handle_messages(self, messages):
+        """
+        Parses a batch of (topic, payload) messages and stores them with one bulk
+        insert. Must run inside the application context. Counts the records
+        received, so a batch frame counts once per record it holds.
+        """
+        rows = []
+        for topic, payload in messages:
+            if is_batch_topic(topic):
+                batch = self.parse_batch(payload)
+                self.received += len(batch)
+                rows += batch
+                continue
+            self.received += 1
+            row = self.parse_message(topic, payload)
+            if row is not None:
+                rows.append(row)
+        if not rows:
+            return
+        try:
+            db.session.execute(db.insert(LogEntry), rows)
+            db.session.commit()
+            self.stored += len(rows)
         except Exception as e:
-            print(f"[ZMQ Consumer Error] Failed to parse message: {e}")
+            db.session.rollback()
+            print(f"[ZMQ Consumer Error] Failed to store {len(rows)} messages: {e}")
+
+    def handle_message(self, topic: bytes, payload: bytes):
+        """
+        Handles a single incoming message and stores it.
+        """
+        with self._app().app_context():
+            self.handle_messages([(topic, payload)])
+
+    def _app(self):
+        if self.app is None:
+            self.app = create_app()
+        return self.app
+
+    def drain(self):
+        """
+        Receives the messages already queued on the socket without blocking, up
+        to batch_size.
+        """
+        messages = []
+        while len(messages) < self.batch_size:
+            try:
+                topic, payload = self.subscriber.recv_multipart(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            messages.append((topic, payload))
+        return messages
 
     def run(self):
         """
-        Starts the ZMQ Log Consumer. It will run indefinitely, listening for messages
+        Starts the ZMQ Log Consumer. It runs until stop() is called, waiting for
+        messages and storing them in batches. Messages already received when it
+        is stopped are stored before the socket is closed.
         """
         self.setup()
-        while True:
-            topic, payload = self.subscriber.recv_multipart()
-            self.handle_message(topic, payload)
+        self._running = True
+        poller = zmq.Poller()
+        poller.register(self.subscriber, zmq.POLLIN)
+        with self._app().app_context():
+            while self._running:
+                if not poller.poll(self.poll_timeout):
+                    continue
+                messages = self.drain()
+                if messages:
+                    self.handle_messages(messages)
+            while messages := self.drain():
+                self.handle_messages(messages)
+        self.subscriber.close(linger=0)
+        self.context.term()
+
+    def stop(self):
+        """
+        Asks the consumer to stop after the batch it is handling. Safe to call
+        from a signal handler.
+        """
+        self._running = False
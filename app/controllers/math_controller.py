@@ -1,17 +1,36 @@
-from flask import request, jsonify
+from flask import current_app, request, jsonify
 from app.schemas.request_schema import (FibonacciRequest, PowerRequest,
-                                        FactorialRequest, ResultResponse,)
+                                        FactorialRequest, ResultResponse,
+                                        JobRequest, BatchRequest, RequestQuery,
+                                        LogQuery, RollupQuery, OutputQuery)
 from app.services.math_service import MathService
 from app import worker
-from app import db
+from app import persistence
+from app.utils.worker import timed
 from app.models.request import MathRequest
 from app.models.log import LogEntry
+from app.models.rollup import HourlyRollup
 from pydantic import ValidationError
-from app.utils.cache import cache
-from app.utils.errors import (ValidationAppError,
-                              CalculationAppError, AppError)
+from app.utils.cache import cache, hint_cost
+from app.utils.pagination import paginate
+from app.utils.formatting import (format_result, int_to_decimal, to_text, clip,
+                                  DECIMAL_CUTOFF_BITS)
+from sqlalchemy import select
+from limits import parse as parse_limit
+from app.utils.errors import (ValidationAppError, CalculationAppError,
+                              AppError, NotFoundAppError, ConflictAppError,
+                              OverloadedAppError)
+import asyncio
+import math
 import time
+from datetime import datetime
 from app import logger
+from app import jobs
+from app import lookup_tables
+from app import stats
+from app import results
+from app import flights
+from app import admission
 
 
 class MathController:
@@ -19,192 +38,716 @@ class MathController:
     Controller for handling math operations like Fibonacci, Power, and Factorial.
     It uses asynchronous processing and caching for performance.
     """
+    HELPERS = {
+        "fibonacci": "_get_cached_fibonacci",
+        "power": "_get_cached_power",
+        "factorial": "_get_cached_factorial",
+    }
+    SERVICES = {
+        "fibonacci": MathService.calculate_fibonacci,
+        "power": MathService.power,
+        "factorial": MathService.factorial,
+    }
+    LABELS = {"fibonacci": "Fibonacci", "power": "Power", "factorial": "Factorial"}
+    MESSAGES = {
+        "fibonacci": "Fibonacci({}) calculated in {:.4f}s",
+        "power": "Power({}) calculated in {:.4f}s",
+        "factorial": "Factorial of {} calculated in {:.4f}s",
+    }
+
+    @staticmethod
+    def _compute(operation, *args):
+        """
+        Run an operation on the worker once admitted into the compute budget, and
+        pass its compute time to the cache as the cost of the result and to the
+        admission cost model.
+        :raises OverloadedAppError: If the budget cannot admit the operation
+        """
+        cost = MathService.estimate_cost(operation, *args)
+        with admission.admit(admission.estimate(operation, *args)):
+            future = worker.run(timed, MathController.SERVICES[operation], *args,
+                                cost=cost, operation=operation)
+            result, duration = future.result()
+        hint_cost(duration)
+        admission.observe(operation, args, duration)
+        return result
+
     @staticmethod
     @cache.memoize()
     def _get_cached_fibonacci(n):
-        return worker.run(MathService.calculate_fibonacci, n).result()
+        return MathController._compute("fibonacci", n)
 
     @staticmethod
     @cache.memoize()
-    def _get_cached_power(base, exponent):
-        return worker.run(MathService.power, base, exponent).result()
+    def _get_cached_power(base, exponent, exact=False):
+        return MathController._compute("power", base, exponent, exact)
 
     @staticmethod
     @cache.memoize()
     def _get_cached_factorial(n):
-        return worker.run(MathService.factorial, n).result()
+        return MathController._compute("factorial", n)
 
     def _save_request(self, operation, input_value, result, processing_time):
         """
-        Save the math request to the database.
+        Queue the math request for write-behind persistence to the database.
         """
-        record = MathRequest(
-            operation=operation,
-            input_value=input_value,
-            result=str(result),
-            processing_time=processing_time
-        )
-        db.session.add(record)
-        db.session.commit()
+        self._save_requests([(operation, input_value, result, processing_time)])
+
+    def _save_requests(self, records):
+        """
+        Queue many math requests for persistence. They are written with bulk
+        inserts by the write-behind queue, which also converts the results to
+        their stored form (inline, or in the result store when too large).
+        :param records: Tuples (operation, input_value, result, processing_time)
+        """
+        timestamp = datetime.utcnow()
+        for operation, _, _, processing_time in records:
+            stats.record(operation, processing_time)
+        # Integer bases are unbounded, the column is not
+        length = MathRequest.input_value.type.length
+        persistence.add_many(MathRequest, [
+            {"operation": operation, "input_value": clip(input_value, length),
+             "value": result, "processing_time": processing_time,
+             "timestamp": timestamp}
+            for operation, input_value, result, processing_time in records
+        ], prepare=results.prepare_row)
 
-    def _build_response(self, operation, input_value, result, processing_time):
+    def _build_response(self, operation, args, input_value, result, processing_time,
+                        fmt="decimal"):
         """
         Build a standardized response for the math operations, verified by Pydantic.
         """
+        text, fmt = self._format(operation, args, result, fmt)
         return ResultResponse(
             operation=operation,
             input_value=input_value,
-            result=str(result),
+            result=text,
+            format=fmt,
             processing_time=processing_time
         )
 
-    def factorial(self):
+    def _format(self, operation, args, result, fmt):
         """
-        Handle the factorial operation. Validates input, calculates factorial,
-        caches the result, and returns a standardized response.
+        Format a result for the response (see app.utils.formatting). The decimal
+        text of a huge integer is cached next to the value, under its memoize
+        key, so that cache hits do not pay for the conversion again.
+        :return: A tuple (text, format actually used)
         """
-        try:
-            data = FactorialRequest(**request.json)
+        if fmt != "decimal" or not isinstance(result, int) \
+                or result.bit_length() <= DECIMAL_CUTOFF_BITS:
+            return format_result(result, fmt)
+        key, timeout = self._cache_key(operation, args)
+        key = f"{key}:decimal"
+        text = cache.get(key)
+        if text is None:
             start = time.perf_counter()
-            result = self._get_cached_factorial(data.n)
-            duration = time.perf_counter() - start
+            text = int_to_decimal(result)
+            hint_cost(time.perf_counter() - start)
+            cache.set(key, text, timeout=timeout)
+        return text, "decimal"
+
+    @staticmethod
+    def _output_format():
+        """
+        Return the result format requested with the format query parameter.
+        :raises ValidationError: If the format is unknown
+        """
+        return OutputQuery(**request.args.to_dict()).format
 
-            self._save_request("factorial", str(data.n), result, duration)
-            logger.log("info", f"Factorial of {data.n} calculated in {duration:.4f}s",
-                       context={"n": data.n}, operation="Factorial")
+    def _parse(self, operation, payload):
+        """
+        Validate the payload of a math operation.
+        :return: A tuple (helper arguments, input string, log context)
+        :raises ValidationError: If the payload does not match the schema
+        """
+        if operation == "fibonacci":
+            data = FibonacciRequest(**payload)
+            return (data.n,), str(data.n), {"n": data.n}
+        if operation == "factorial":
+            data = FactorialRequest(**payload)
+            return (data.n,), str(data.n), {"n": data.n}
+        data = PowerRequest(**payload)
+        # Only exact mode computes with integers, floats keep huge exponents cheap
+        base = data.base
+        if not data.exact:
+            try:
+                base = float(base)
+            except OverflowError:
+                raise ValueError("Base is too large for a float, use exact mode")
+        return ((base, data.exponent, data.exact),
+                f"{to_text(data.base)}^{data.exponent}",
+                {"base": data.base, "exponent": data.exponent, "exact": data.exact})
+
+    def _complete(self, operation, args, input_value, result, duration, context,
+                  fmt):
+        """
+        Persist, log and build the response of a successful math operation.
+        """
+        self._save_request(operation, input_value, result, duration)
+        logger.log("info", self.MESSAGES[operation].format(input_value, duration),
+                   context=context, operation=self.LABELS[operation])
 
-            response = self._build_response("factorial", str(data.n), result, duration)
-            return jsonify(response.dict()), 200
+        response = self._build_response(operation, args, input_value, result,
+                                        duration, fmt)
+        return jsonify(response.dict()), 200
 
-        except ValidationError as e:
+    def _error_response(self, label, error):
+        """
+        Log an error raised while handling a request and convert it into
+        the matching error response.
+        """
+        stats.record_error(label.lower())
+        if isinstance(error, AppError):
+            logger.log("ERROR", f"{error.error_type.capitalize()} error",
+                       {"error": error.details, "input": request.get_json(silent=True)},
+                       operation=label)
+            return error.to_response()
+        if isinstance(error, ValidationError):
             logger.log("ERROR", "Validation error",
-                       {"errors": e.errors(), "input": request.json}, "Factorial")
-            return ValidationAppError(e.errors).to_response()
-
-        except ValueError as e:
+                       {"errors": error.errors(), "input": request.json}, label)
+            return ValidationAppError(error.errors).to_response()
+        if isinstance(error, ValueError):
             logger.log("ERROR", "Calculation error",
-                       {"error": str(e), "input": request.json}, operation="Factorial")
-            return CalculationAppError(str(e)).to_response()
+                       {"error": str(error), "input": request.json}, operation=label)
+            return CalculationAppError(str(error)).to_response()
+        logger.log("ERROR", "Internal error",
+                   {"error": str(error), "input": request.json}, operation=label)
+        return AppError(str(error)).to_response()
 
+    def _handle(self, operation):
+        """
+        Handle a math operation on the request thread: validate input, compute the
+        cached result, and return a standardized response.
+        """
+        try:
+            args, input_value, context = self._parse(operation, request.json)
+            fmt = self._output_format()
+            helper = getattr(self, self.HELPERS[operation])
+            start = time.perf_counter()
+            result = lookup_tables.get(operation, *args)
+            if result is None:
+                key, _ = self._cache_key(operation, args)
+                result = flights.do(key, helper, *args)
+            duration = time.perf_counter() - start
+            return self._complete(operation, args, input_value, result, duration,
+                                  context, fmt)
         except Exception as e:
-            logger.log("ERROR", "Internal error",
-                       {"error": str(e), "input": request.json}, operation="Factorial")
-            return AppError(str(e)).to_response()
+            return self._error_response(self.LABELS[operation], e)
 
-    def fibonacci(self):
+    async def _handle_async(self, operation):
         """
-        Handle the Fibonacci operation. Validates input, calculates Fibonacci number,
-        caches the result, and returns a standardized response.
+        Handle a math operation without blocking the calling thread: the
+        computation is awaited on the worker, so the event loop keeps serving
+        other requests in the meantime. Results share the memoize cache of
+        the synchronous path. Formatting and persisting the result also run
+        off the event loop, since both are linear or worse in its size.
         """
         try:
-            data = FibonacciRequest(**request.json)
+            args, input_value, context = self._parse(operation, request.json)
+            fmt = self._output_format()
             start = time.perf_counter()
-            result = self._get_cached_fibonacci(data.n)
+            result = await self._compute_async(operation, args)
             duration = time.perf_counter() - start
+            return await asyncio.to_thread(self._complete, operation, args,
+                                           input_value, result, duration,
+                                           context, fmt)
+        except Exception as e:
+            return self._error_response(self.LABELS[operation], e)
 
-            self._save_request("fibonacci", str(data.n), result, duration)
-            logger.log("info", f"Fibonacci({data.n}) calculated in {duration:.4f}s",
-                       context={"n": data.n}, operation="Fibonacci")
+    async def _compute_async(self, operation, args):
+        """
+        Look up the result of an operation in the lookup tables, then in the
+        memoize cache, computing it on the worker and storing it under the same
+        cache key on a miss. Identical requests in flight share one computation.
+        """
+        result = lookup_tables.get(operation, *args)
+        if result is not None:
+            return result
+        key, timeout = self._cache_key(operation, args)
+        return await flights.do_async(
+            key, lambda: self._fill_async(operation, args, key, timeout))
 
-            response = self._build_response("fibonacci", str(data.n), result, duration)
-            return jsonify(response.dict()), 200
+    async def _fill_async(self, operation, args, key, timeout):
+        # Cached values are pickled in the shared cache, so access it off the loop
+        result = await asyncio.to_thread(cache.get, key)
+        if result is None:
+            seconds = admission.estimate(operation, *args)
+            try:
+                ticket = admission.acquire(seconds, timeout=0)
+            except OverloadedAppError:
+                # Wait for the budget off the event loop
+                ticket = await asyncio.to_thread(admission.acquire, seconds)
+            try:
+                cost = MathService.estimate_cost(operation, *args)
+                future = worker.run(timed, self.SERVICES[operation], *args,
+                                    cost=cost, operation=operation)
+                result, duration = await asyncio.wrap_future(future)
+            finally:
+                admission.release(ticket)
+            hint_cost(duration)
+            admission.observe(operation, args, duration)
+            await asyncio.to_thread(cache.set, key, result, timeout=timeout)
+        return result
 
-        except ValidationError as e:
-            logger.log("ERROR", "Validation error",
-                       {"errors": e.errors(), "input": request.json}, "Fibonacci")
-            return ValidationAppError(e.errors).to_response()
+    def _cache_key(self, operation, args):
+        """
+        Return the memoize cache key and timeout the _get_cached_* helper of an
+        operation uses for the given arguments, so other paths share its cache.
+        """
+        helper = getattr(self, self.HELPERS[operation])
+        return helper.make_cache_key(helper.uncached, *args), helper.cache_timeout
 
-        except ValueError as e:
-            logger.log("ERROR", "Calculation error",
-                       {"error": str(e), "input": request.json}, operation="Fibonacci")
-            return CalculationAppError(str(e)).to_response()
+    def _record_job(self, job, result, args, context):
+        """
+        Cache, persist and log the result of a finished job.
+        """
+        key, timeout = self._cache_key(job.operation, args)
+        hint_cost(job.processing_time)
+        admission.observe(job.operation, args, job.processing_time)
+        cache.set(key, result, timeout=timeout)
+        self._save_request(job.operation, job.input_value, result, job.processing_time)
+        logger.log("info", f"Job {job.id} finished in {job.processing_time:.4f}s",
+                   context=context, operation=self.LABELS[job.operation])
 
+    def submit_job(self):
+        """
+        Submit a math operation as a job. The computation runs on the worker and
+        the job id is returned right away, so clients poll for the result instead
+        of holding the connection open.
+        """
+        try:
+            data = JobRequest(**request.json)
+            args, input_value, context = self._parse(data.operation, data.params)
+            cost = MathService.estimate_cost(data.operation, *args)
+            job = jobs.submit(
+                data.operation, input_value, self.SERVICES[data.operation], *args,
+                cost=cost,
+                on_complete=lambda job, result: self._record_job(job, result, args,
+                                                                 context))
+            logger.log("info", f"Job {job.id} submitted",
+                       context=context, operation="Jobs")
+            return jsonify(jobs.describe(job)), 202, {"Location": f"/api/jobs/{job.id}"}
         except Exception as e:
-            logger.log("ERROR", "Internal error",
-                       {"error": str(e), "input": request.json}, operation="Fibonacci")
-            return AppError(str(e)).to_response()
+            return self._error_response("Jobs", e)
 
-    def power(self):
+    def _compute_many(self, keys):
         """
-        Handle the power operation. Validates input, calculates power,
-        caches the result, and returns a standardized response.
+        Compute many distinct (operation, args) pairs at once. Cached results are
+        used directly and misses are fanned out across the worker together.
+        Misses already being computed by another request of this process are
+        awaited instead of computed again. The misses computed here are admitted
+        into the compute budget together, with the sum of their estimates.
+        :return: A dict mapping each key to a tuple (result, error, duration)
+        :raises OverloadedAppError: If the budget cannot admit the misses
         """
+        outcomes = {}
+        misses = {}
+        pending = {}
+        shared = {}
+        for operation, args in keys:
+            start = time.perf_counter()
+            result = lookup_tables.get(operation, *args)
+            if result is not None:
+                outcomes[(operation, args)] = (result, None,
+                                               time.perf_counter() - start)
+                continue
+            key, timeout = self._cache_key(operation, args)
+            result = cache.get(key)
+            if result is not None:
+                outcomes[(operation, args)] = (result, None,
+                                               time.perf_counter() - start)
+                continue
+            flight, leader = flights.claim(key)
+            if not leader:
+                shared[(operation, args)] = (start, flight)
+                continue
+            misses[(operation, args)] = (key, timeout, flight)
+
+        try:
+            ticket = admission.acquire(sum(admission.estimate(operation, *args)
+                                           for operation, args in misses))
+        except Exception as e:
+            for key, _, flight in misses.values():
+                flights.release(key, flight, error=e)
+            raise
         try:
-            data = PowerRequest(**request.json)
+            for (operation, args), (key, timeout, flight) in misses.items():
+                try:
+                    cost = MathService.estimate_cost(operation, *args)
+                    future = worker.run(timed, self.SERVICES[operation], *args,
+                                        cost=cost, operation=operation)
+                except Exception as e:
+                    for item, (other, _, other_flight) in misses.items():
+                        if item not in pending:
+                            flights.release(other, other_flight, error=e)
+                    raise
+                self._release_when_done(key, flight, future)
+                pending[(operation, args)] = (key, timeout, future)
+
+            for (operation, args), (key, timeout, future) in pending.items():
+                try:
+                    result, duration = future.result()
+                except Exception as e:
+                    outcomes[(operation, args)] = (None, e, 0.0)
+                    continue
+                hint_cost(duration)
+                admission.observe(operation, args, duration)
+                cache.set(key, result, timeout=timeout)
+                outcomes[(operation, args)] = (result, None, duration)
+        finally:
+            admission.release(ticket)
+
+        for item, (start, flight) in shared.items():
+            try:
+                outcomes[item] = (flight.result(), None, time.perf_counter() - start)
+            except Exception as e:
+                outcomes[item] = (None, e, 0.0)
+        return outcomes
+
+    @staticmethod
+    def _release_when_done(key, flight, future):
+        """
+        Hand the result of a worker future to the requests waiting on a claimed
+        key as soon as it is computed.
+        """
+        def done(future):
+            try:
+                result, _ = future.result()
+            except BaseException as e:
+                flights.release(key, flight, error=e)
+            else:
+                flights.release(key, flight, result)
+        future.add_done_callback(done)
+
+    def batch(self):
+        """
+        Handle many operations in one request. All items are validated in one
+        pass, identical inputs are computed once, and the results are persisted
+        and logged with a single bulk write each. Results keep the request order.
+        """
+        try:
+            data = BatchRequest(**request.json)
+            fmt = self._output_format()
+            parsed = []
+            errors = []
+            for index, item in enumerate(data.operations):
+                try:
+                    args, input_value, _ = self._parse(item.operation, item.params)
+                    parsed.append((item.operation, args, input_value))
+                except ValidationError as e:
+                    errors.append({"index": index,
+                                   "errors": e.errors(include_url=False)})
+            if errors:
+                raise ValidationAppError(errors)
+
             start = time.perf_counter()
-            result = self._get_cached_power(data.base, data.exponent)
+            outcomes = self._compute_many(dict.fromkeys(
+                (operation, args) for operation, args, _ in parsed))
+
+            results = []
+            records = []
+            failed = 0
+            for operation, args, input_value in parsed:
+                result, error, duration = outcomes[(operation, args)]
+                if error is not None:
+                    failed += 1
+                    error_type = "calculation" if isinstance(error, ValueError) \
+                        else "internal"
+                    results.append({"operation": operation, "input_value": input_value,
+                                    "status": "error", "type": error_type,
+                                    "details": str(error)})
+                    continue
+                response = self._build_response(operation, args, input_value, result,
+                                                duration, fmt)
+                results.append(response.dict())
+                records.append((operation, input_value, result, duration))
+
+            self._save_requests(records)
             duration = time.perf_counter() - start
+            logger.log("info", f"Batch of {len(parsed)} operations calculated in "
+                               f"{duration:.4f}s",
+                       context={"size": len(parsed), "unique": len(outcomes),
+                                "errors": failed},
+                       operation="Batch")
+            return jsonify({"results": results, "processing_time": duration}), 200
+
+        except Exception as e:
+            return self._error_response("Batch", e)
+
+    def request_cost(self):
+        """
+        Return the cost of the current request for the cost-weighted rate limit,
+        in units of ADMISSION_COST_UNIT estimated compute seconds. Results served
+        from the lookup tables or the cache cost one unit, and so do requests
+        that fail validation (the view rejects them). Computations too large for
+        the compute budget cost nothing, since admission rejects them before they
+        run, and no request costs more than the whole limit: limits counts a hit
+        before checking it, so a larger charge would lock the client out for the
+        rest of the window.
+        """
+        try:
+            payload = request.get_json(silent=True) or {}
+            cached = True
+            if request.path == "/api/batch":
+                items = [(item.operation, item.params)
+                         for item in BatchRequest(**payload).operations]
+            elif request.path == "/api/jobs":
+                data = JobRequest(**payload)
+                items = [(data.operation, data.params)]
+                # Jobs always compute
+                cached = False
+            else:
+                items = [(request.path.rsplit("/", 1)[-1], payload)]
 
-            input_str = f"{data.base}^{data.exponent}"
-            self._save_request("power", input_str, result, duration)
-            logger.log("info", f"Power({input_str}) calculated in {duration:.4f}s",
-                       {"base": data.base, "exponent": data.exponent}, "Power")
+            seconds = 0.0
+            for operation, args in dict.fromkeys(
+                    (operation, self._parse(operation, params)[0])
+                    for operation, params in items):
+                if cached and (lookup_tables.get(operation, *args) is not None
+                               or cache.has(self._cache_key(operation, args)[0])):
+                    continue
+                seconds += admission.estimate(operation, *args)
+            if cached and admission.rejects(seconds):
+                return 0
+            unit = current_app.config["ADMISSION_COST_UNIT"]
+            limit = parse_limit(current_app.config["RATELIMIT_COST_LIMIT"]).amount
+            return min(max(1, math.ceil(seconds / unit)), limit)
+        except Exception:
+            return 1
 
-            response = self._build_response("power", input_str, result, duration)
-            return jsonify(response.dict()), 200
+    def get_job(self, job_id):
+        """
+        Report the status, progress and, once finished, the result of a job.
+        """
+        job = jobs.get(job_id)
+        if job is None:
+            return NotFoundAppError(f"Job {job_id} not found").to_response()
+        return jsonify(jobs.describe(job)), 200
 
-        except ValidationError as e:
-            logger.log("ERROR", "Validation error",
-                       {"errors": e.errors(), "input": request.json}, operation="Power")
-            return ValidationAppError(e.errors).to_response()
+    def cancel_job(self, job_id):
+        """
+        Cancel a job that has not started running yet.
+        """
+        job = jobs.get(job_id)
+        if job is None:
+            return NotFoundAppError(f"Job {job_id} not found").to_response()
+        if not jobs.cancel(job_id):
+            return ConflictAppError(
+                f"Job {job_id} is {job.status} and cannot be cancelled").to_response()
+        logger.log("info", f"Job {job_id} cancelled", operation="Jobs")
+        return jsonify(jobs.describe(job)), 200
 
-        except ValueError as e:
-            logger.log("ERROR", "Calculation error",
-                       {"error": str(e), "input": request.json}, operation="Power")
-            return CalculationAppError(str(e)).to_response()
+    def factorial(self):
+        """
+        Handle the factorial operation. Validates input, calculates factorial,
+        caches the result, and returns a standardized response.
+        """
+        return self._handle("factorial")
 
-        except Exception as e:
-            logger.log("ERROR", "Internal error",
-                       {"error": str(e), "input": request.json}, operation="Power")
-            return AppError(str(e)).to_response()
+    def fibonacci(self):
+        """
+        Handle the Fibonacci operation. Validates input, calculates Fibonacci number,
+        caches the result, and returns a standardized response.
+        """
+        return self._handle("fibonacci")
+
+    def power(self):
+        """
+        Handle the power operation. Validates input, calculates power,
+        caches the result, and returns a standardized response.
+        """
+        return self._handle("power")
+
+    async def factorial_async(self):
+        """
+        Asynchronous variant of factorial, used by the ASGI entry point.
+        """
+        return await self._handle_async("factorial")
+
+    async def fibonacci_async(self):
+        """
+        Asynchronous variant of fibonacci, used by the ASGI entry point.
+        """
+        return await self._handle_async("fibonacci")
+
+    async def power_async(self):
+        """
+        Asynchronous variant of power, used by the ASGI entry point.
+        """
+        return await self._handle_async("power")
+
+    def get_persistence_stats(self):
+        """
+        Report the queue depth and flush latency of the write-behind persistence.
+        """
+        return jsonify(persistence.stats()), 200
+
+    def get_logger_stats(self):
+        """
+        Report the queue depth and the sent and dropped counters of the logger.
+        """
+        return jsonify(logger.stats()), 200
+
+    def get_worker_stats(self):
+        """
+        Report the queued and running tasks per lane of the worker and the queue
+        wait and run time histograms per operation.
+        """
+        return jsonify(worker.stats()), 200
+
+    def get_admission_stats(self):
+        """
+        Report the compute budget use, the admission counters and the fitted
+        cost model of this worker.
+        """
+        return jsonify(admission.stats()), 200
+
+    def get_cache_stats(self):
+        """
+        Report the hit/miss counters and size of the result cache.
+        """
+        backend = cache.cache
+        if hasattr(backend, "stats"):
+            report = backend.stats()
+        else:
+            report = {"backend": type(backend).__name__}
+        report["single_flight"] = flights.stats()
+        return jsonify(report), 200
 
     def get_requests(self):
+        """
+        Retrieve past math requests, one keyset page at a time or streamed as
+        NDJSON (see app.utils.pagination).
+        """
         try:
-            op = request.args.get("operation")
-            query = MathRequest.query
-            if op:
-                query = query.filter_by(operation=op)
-            rows = query.all()
-
-            result = [{
-                "id": r.id,
-                "operation": r.operation,
-                "input_value": r.input_value,
-                "result": r.result,
-                "processing_time": r.processing_time,
-                "timestamp": r.timestamp.isoformat() if r.timestamp else None
-            } for r in rows]
-
-            return jsonify(result), 200
+            query = RequestQuery(**request.args.to_dict())
+            statement = select(MathRequest.id, MathRequest.operation,
+                               MathRequest.input_value, MathRequest.result,
+                               MathRequest.result_ref, MathRequest.result_digits,
+                               MathRequest.result_hash, MathRequest.processing_time,
+                               MathRequest.timestamp)
+            if query.operation:
+                statement = statement.where(MathRequest.operation == query.operation)
+            return paginate(statement, MathRequest.id, MathRequest.timestamp, query,
+                            self._request_row)
 
+        except ValidationError as e:
+            return ValidationAppError(e.errors(include_url=False)).to_response()
         except Exception as e:
             logger.log("ERROR", "Failed to retrieve requests",
                        {"error": str(e)}, operation="GetRequests")
             return AppError(str(e)).to_response()
 
+    @staticmethod
+    def _request_row(r):
+        return {
+            "id": r.id,
+            "operation": r.operation,
+            "input_value": r.input_value,
+            "result": r.result,
+            "result_ref": r.result_ref,
+            "result_digits": r.result_digits,
+            "result_hash": r.result_hash,
+            "processing_time": r.processing_time,
+            "timestamp": r.timestamp.isoformat() if r.timestamp else None
+        }
+
+    def get_result(self, digest):
+        """
+        Return a result stored out-of-line, by the result_hash of its request.
+        """
+        try:
+            fmt = self._output_format()
+            value = results.get(digest)
+            if value is None:
+                return NotFoundAppError(f"Result {digest} not found").to_response()
+            text, fmt = format_result(value, fmt)
+            return jsonify({"result_hash": digest, "result": text, "format": fmt}), 200
+        except ValidationError as e:
+            return ValidationAppError(e.errors(include_url=False)).to_response()
+        except Exception as e:
+            logger.log("ERROR", "Failed to retrieve result",
+                       {"error": str(e)}, operation="GetResult")
+            return AppError(str(e)).to_response()
+
     def get_logs(self):
         """
-        Retrieve logs from the database.
+        Retrieve logs from the database, one keyset page at a time or streamed as
+        NDJSON (see app.utils.pagination). Filters: level, operation, since, until.
         """
         try:
-            level = request.args.get("level")
-            if level:
-                level = level.upper()
-                logs = LogEntry.query.filter_by(level=level).all()
-            else:
-                logs = LogEntry.query.all()
-
-            result = [{
-                "id": log.id,
-                "level": log.level,
-                "message": log.message,
-                "details": log.details,
-                "operation": log.operation,
-                "created_at": log.created_at.isoformat()
-            } for log in logs]
-
-            return jsonify(result), 200
+            query = LogQuery(**request.args.to_dict())
+            statement = select(LogEntry.id, LogEntry.level, LogEntry.message,
+                               LogEntry.details, LogEntry.operation,
+                               LogEntry.created_at)
+            if query.level:
+                statement = statement.where(LogEntry.level == query.level.upper())
+            if query.operation:
+                # The log consumer stores operation labels in lowercase
+                statement = statement.where(
+                    LogEntry.operation == query.operation.lower())
+            return paginate(statement, LogEntry.id, LogEntry.created_at, query,
+                            self._log_row)
+        except ValidationError as e:
+            return ValidationAppError(e.errors(include_url=False)).to_response()
         except Exception as e:
             logger.log("ERROR", "Failed to retrieve logs",
                        {"error": str(e)}, operation="GetLogs")
             return AppError(str(e)).to_response()
+
+    @staticmethod
+    def _log_row(log):
+        return {
+            "id": log.id,
+            "level": log.level,
+            "message": log.message,
+            "details": log.details,
+            "operation": log.operation,
+            "created_at": log.created_at.isoformat()
+        }
+
+    def get_hourly_stats(self):
+        """
+        Retrieve the hourly per-operation aggregates kept for the rows removed by
+        the retention (see app.utils.retention), paginated like /api/requests.
+        Filters: operation, since, until (on the hour).
+        """
+        try:
+            query = RollupQuery(**request.args.to_dict())
+            statement = select(HourlyRollup)
+            if query.operation:
+                statement = statement.where(
+                    HourlyRollup.operation == query.operation.lower())
+            return paginate(statement, HourlyRollup.id, HourlyRollup.hour, query,
+                            self._rollup_row)
+        except ValidationError as e:
+            return ValidationAppError(e.errors(include_url=False)).to_response()
+        except Exception as e:
+            logger.log("ERROR", "Failed to retrieve hourly stats",
+                       {"error": str(e)}, operation="GetStats")
+            return AppError(str(e)).to_response()
+
+    @staticmethod
+    def _rollup_row(row):
+        rollup = row.HourlyRollup
+        requests = rollup.requests
+        return {
+            "id": rollup.id,
+            "hour": rollup.hour.isoformat(),
+            "operation": rollup.operation,
+            "requests": rollup.requests,
+            "errors": rollup.errors,
+            "logs": rollup.logs,
+            "avg_time": rollup.total_time / requests if requests else None,
+            "p50": rollup.p50,
+            "p95": rollup.p95,
+            "p99": rollup.p99,
+            "max_time": rollup.max_time,
+        }
+
+    def get_stats(self):
+        """
+        Retrieve per-operation request counts, error rates and latency percentiles
+        from the in-memory statistics, merged over every worker process.
+        """
+        return jsonify(stats.summary()), 200
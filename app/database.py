@@ -1,3 +1,4 @@
+from sqlalchemy import inspect, text
 from app import db
 
 
@@ -9,4 +10,40 @@ def init_db(app):
     """
     with app.app_context():
         db.create_all()
+        created = upgrade_db()
         print("Database initialized successfully.")
+        if created:
+            print(f"Created columns and indexes: {', '.join(created)}")
+
+
+def upgrade_db():
+    """
+    Creates the nullable columns and the indexes declared on the models that
+    an existing database is missing. db.create_all() only adds missing tables,
+    so databases created before a column or an index was added to a model
+    need this step. It is idempotent and must run inside the application
+    context.
+    On large tables building an index can take a while and blocks writes to
+    the table until it is done.
+    :return: The names of the columns and indexes created.
+    """
+    created = []
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE {table.name} '
+                                        f'ADD COLUMN {column.name} {column_type}'))
+            created.append(f"{table.name}.{column.name}")
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine)
+                created.append(index.name)
+    return created
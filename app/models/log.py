@@ -8,6 +8,14 @@ class LogEntry(db.Model):
     Represents a log entry in the database.
     """
     __tablename__ = 'log_entries'
+    # Match the /api/logs query shapes: pages keyed on id, optionally filtered
+    # by level or operation and by a created_at range
+    __table_args__ = (
+        db.Index("ix_log_entries_level_id", "level", "id"),
+        db.Index("ix_log_entries_level_created_at", "level", "created_at"),
+        db.Index("ix_log_entries_operation_id", "operation", "id"),
+        db.Index("ix_log_entries_created_at", "created_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     level = db.Column(db.String(20), nullable=False)
@@ -6,11 +6,23 @@ class MathRequest(db.Model):
     Represents a mathematical operation request in the database.
     """
     __tablename__ = 'math_requests'
+    # Match the /api/requests query shapes: pages keyed on id, optionally
+    # filtered by operation and by a timestamp range
+    __table_args__ = (
+        db.Index("ix_math_requests_operation_id", "operation", "id"),
+        db.Index("ix_math_requests_operation_timestamp", "operation", "timestamp"),
+        db.Index("ix_math_requests_timestamp", "timestamp"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     operation = db.Column(db.String(50), nullable=False)
     input_value = db.Column(db.String(255), nullable=False)
     result = db.Column(db.String(255), nullable=True)
+    # Results too large for the column live in the ResultStore
+    # (app/utils/result_store.py); the row keeps where, how long and their hash
+    result_ref = db.Column(db.String(255), nullable=True)
+    result_digits = db.Column(db.Integer, nullable=True)
+    result_hash = db.Column(db.String(64), nullable=True)
     timestamp = db.Column(db.DateTime, server_default=db.func.now(), nullable=False)
     processing_time = db.Column(db.Float, nullable=True)
 
@@ -0,0 +1,30 @@
+from app import db
+
+
+class HourlyRollup(db.Model):
+    """
+    Aggregates of one hour of math requests and log entries for one operation,
+    kept after the raw rows are pruned (see app/utils/retention.py).
+    """
+    __tablename__ = 'hourly_rollups'
+    __table_args__ = (
+        db.UniqueConstraint("hour", "operation",
+                            name="uq_hourly_rollups_hour_operation"),
+        db.Index("ix_hourly_rollups_operation_hour", "operation", "hour"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    hour = db.Column(db.DateTime, nullable=False)
+    operation = db.Column(db.String(50), nullable=False)
+    requests = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Integer, nullable=False, default=0)
+    logs = db.Column(db.Integer, nullable=False, default=0)
+    total_time = db.Column(db.Float, nullable=False, default=0.0)
+    p50 = db.Column(db.Float, nullable=True)
+    p95 = db.Column(db.Float, nullable=True)
+    p99 = db.Column(db.Float, nullable=True)
+    max_time = db.Column(db.Float, nullable=True)
+
+    def __repr__(self):
+        return (f"<HourlyRollup {self.hour.isoformat()} {self.operation}: "
+                f"{self.requests} requests, {self.errors} errors>")
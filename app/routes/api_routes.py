@@ -1,11 +1,30 @@
-from flask import jsonify, render_template
+import time
+from flask import current_app, jsonify, render_template
 from app.controllers import math_controller
+from app.utils.errors import RateLimitedAppError
 from app import limiter
 
 controller = math_controller.MathController()
 
 
+# Per-client budget of estimated compute, shared by the computing endpoints
+compute_limit = limiter.shared_limit(
+    lambda: current_app.config["RATELIMIT_COST_LIMIT"], scope="compute",
+    cost=controller.request_cost)
+
+
 def register_routes(app):
+    @app.errorhandler(429)
+    def rate_limited(e):
+        """
+        Report an exceeded rate limit, with when the client may retry.
+        """
+        retry_after = None
+        if limiter.current_limit is not None:
+            retry_after = max(1, int(limiter.current_limit.reset_at - time.time()))
+        return RateLimitedAppError(f"Rate limit exceeded: {e.description}",
+                                   retry_after=retry_after).to_response()
+
     @app.route("/ping", methods=["GET"])
     def ping():
         """
@@ -15,6 +34,7 @@ def register_routes(app):
 
     @app.route("/api/fibonacci", methods=["POST"])
     @limiter.limit("100/hour")
+    @compute_limit
     def fibonacci():
         """
         Endpoint to calculate the Fibonacci number for a given input.
@@ -23,6 +43,7 @@ def register_routes(app):
 
     @app.route("/api/power", methods=["POST"])
     @limiter.limit("100/hour")
+    @compute_limit
     def power():
         """
         Endpoint to calculate the power of a base raised to an exponent.
@@ -31,20 +52,118 @@ def register_routes(app):
 
     @app.route("/api/factorial", methods=["POST"])
     @limiter.limit("100/hour")
+    @compute_limit
     def factorial():
         """
         Endpoint to calculate the factorial of a given input.
         """
         return controller.factorial()
 
+    @app.route("/api/batch", methods=["POST"])
+    @limiter.limit("100/hour")
+    @compute_limit
+    def batch():
+        """
+        Endpoint to evaluate many operations in one request.
+        Example body: {"operations": [{"operation": "fibonacci", "params": {"n": 10}}]}
+        """
+        return controller.batch()
+
+    @app.route("/api/jobs", methods=["POST"])
+    @limiter.limit("100/hour")
+    @compute_limit
+    def submit_job():
+        """
+        Endpoint to submit an expensive computation as an asynchronous job.
+        Example body: {"operation": "factorial", "params": {"n": 100000}}
+        """
+        return controller.submit_job()
+
+    @app.route("/api/jobs/<job_id>", methods=["GET"])
+    def get_job(job_id):
+        """
+        Endpoint to poll the status, progress and result of a job.
+        """
+        return controller.get_job(job_id)
+
+    @app.route("/api/jobs/<job_id>", methods=["DELETE"])
+    def cancel_job(job_id):
+        """
+        Endpoint to cancel a job that has not started yet.
+        """
+        return controller.cancel_job(job_id)
+
+    @app.route("/api/cache/stats", methods=["GET"])
+    def get_cache_stats():
+        """
+        Endpoint to retrieve the hit/miss counters of the result cache.
+        """
+        return controller.get_cache_stats()
+
+    @app.route("/api/worker/stats", methods=["GET"])
+    def get_worker_stats():
+        """
+        Endpoint to retrieve the lane queues of the worker and the queue wait and
+        run time histograms of each operation.
+        """
+        return controller.get_worker_stats()
+
+    @app.route("/api/admission/stats", methods=["GET"])
+    def get_admission_stats():
+        """
+        Endpoint to retrieve the compute budget use, admission counters and
+        cost model of this worker.
+        """
+        return controller.get_admission_stats()
+
+    @app.route("/api/persistence/stats", methods=["GET"])
+    def get_persistence_stats():
+        """
+        Endpoint to retrieve the queue depth and flush metrics of the
+        write-behind persistence.
+        """
+        return controller.get_persistence_stats()
+
+    @app.route("/api/logs/stats", methods=["GET"])
+    def get_logger_stats():
+        """
+        Get the queue depth and the sent/dropped record counters of this
+        worker's log sender.
+        """
+        return controller.get_logger_stats()
+
+    @app.route("/api/stats", methods=["GET"])
+    def get_stats():
+        """
+        Get per-operation counts, error rates and latency percentiles of the
+        requests served since the workers started.
+        """
+        return controller.get_stats()
+
+    @app.route("/api/stats/hourly", methods=["GET"])
+    def get_hourly_stats():
+        """
+        Get the hourly per-operation aggregates of rolled up requests and logs.
+        Example: /api/stats/hourly?operation=fibonacci&since=2024-01-01T00:00:00
+        """
+        return controller.get_hourly_stats()
+
     @app.route("/api/requests", methods=["GET"])
     def get_all_requests():
         """
-        Get all API request records (optional: filter by operation).
-        Example: /requests?operation=fibonacci
+        Get API request records, paginated by cursor (optional: filter by operation,
+        since/until, limit, order; format=ndjson streams every matching row).
+        Example: /requests?operation=fibonacci&limit=100&cursor=2500
         """
         return controller.get_requests()
 
+    @app.route("/api/results/<digest>", methods=["GET"])
+    def get_result(digest):
+        """
+        Get a result too large for /api/requests, by its result_hash.
+        """
+        return controller.get_result(digest)
+
     @app.route("/", methods=["GET"])
     def index():
         """
@@ -55,6 +174,8 @@ def register_routes(app):
     @app.route("/api/logs", methods=["GET"])
     def get_logs():
         """
-        Endpoint to retrieve logs from the database.
+        Endpoint to retrieve logs from the database, paginated by cursor (optional:
+        filter by level, operation, since/until; format=ndjson streams every row).
+        Example: /api/logs?level=error&since=2024-01-01T12:00:00Z&order=desc
         """
         return controller.get_logs()
@@ -1,4 +1,6 @@
-from pydantic import BaseModel, conint
+from datetime import datetime
+from typing import Literal, Optional, Union
+from pydantic import BaseModel, StrictInt, conint, conlist
 
 
 class FibonacciRequest(BaseModel):
@@ -10,10 +12,12 @@ class FibonacciRequest(BaseModel):
 
 class PowerRequest(BaseModel):
     """
-    Schema for validating Power request data.
+    Schema for validating Power request data. Integer bases stay int, so
+    exact mode is exact for bases beyond the precision of a float.
     """
-    base: float
+    base: Union[StrictInt, float]
     exponent: int
+    exact: bool = False
 
 
 class FactorialRequest(BaseModel):
@@ -23,6 +27,72 @@ class FactorialRequest(BaseModel):
     n: conint(ge=0)
 
 
+class OperationRequest(BaseModel):
+    """
+    Schema for an operation given by name. The params are validated against the
+    schema of the chosen operation.
+    """
+    operation: Literal["fibonacci", "power", "factorial"]
+    params: dict
+
+
+class JobRequest(OperationRequest):
+    """
+    Schema for validating job submissions.
+    """
+
+
+class BatchRequest(BaseModel):
+    """
+    Schema for validating batch requests containing many operations.
+    """
+    operations: conlist(OperationRequest, min_length=1, max_length=1000)
+
+
+class PageQuery(BaseModel):
+    """
+    Schema for the query parameters of paginated listings.
+    The cursor is the id of the last row of the previous page; since and until
+    bound the row time as [since, until).
+    """
+    limit: Optional[conint(ge=1)] = None
+    cursor: Optional[conint(ge=0)] = None
+    order: Literal["asc", "desc"] = "asc"
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    format: Literal["json", "ndjson"] = "json"
+
+
+class RequestQuery(PageQuery):
+    """
+    Schema for the query parameters of /api/requests.
+    """
+    operation: Optional[str] = None
+
+
+class LogQuery(PageQuery):
+    """
+    Schema for the query parameters of /api/logs.
+    """
+    level: Optional[str] = None
+    operation: Optional[str] = None
+
+
+class RollupQuery(PageQuery):
+    """
+    Schema for the query parameters of /api/stats/hourly.
+    """
+    operation: Optional[str] = None
+
+
+class OutputQuery(BaseModel):
+    """
+    Schema for the query parameters choosing how results are written, see
+    app.utils.formatting.
+    """
+    format: Literal["decimal", "hex", "base64"] = "decimal"
+
+
 class ResultResponse(BaseModel):
     """
     Schema for the response containing the result of an operation.
@@ -30,4 +100,5 @@ class ResultResponse(BaseModel):
     operation: str
     input_value: str
     result: str
+    format: str = "decimal"
     processing_time: float
@@ -0,0 +1,89 @@
+import sys
+import threading
+from bisect import bisect_right, insort
+from collections import OrderedDict
+
+
+class CheckpointStore:
+    """
+    Memory-capped index of previously computed values keyed by n.
+    Used by MathService to resume Fibonacci and factorial computations from the
+    nearest known value instead of starting from zero. Entries are evicted in
+    least-recently-used order once the total size exceeds max_bytes.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, min_n: int = 1000):
+        """
+        Initialize the store.
+        :param max_bytes: Maximum total size of the stored values in bytes
+        :param min_n: Smallest n worth storing; smaller values are cheap to
+            recompute
+        """
+        self.max_bytes = max_bytes
+        self.min_n = min_n
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._keys = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(value) -> int:
+        if isinstance(value, tuple):
+            return sum(sys.getsizeof(item) for item in value)
+        return sys.getsizeof(value)
+
+    def get(self, n: int):
+        """
+        Return the value stored for n, or None.
+        """
+        with self._lock:
+            value = self._entries.get(n)
+            if value is not None:
+                self._entries.move_to_end(n)
+            return value
+
+    def floor(self, n: int):
+        """
+        Return the entry with the largest key not greater than n.
+        :return: A tuple (key, value), or (None, None) if there is none
+        """
+        with self._lock:
+            index = bisect_right(self._keys, n)
+            if index == 0:
+                return None, None
+            key = self._keys[index - 1]
+            self._entries.move_to_end(key)
+            return key, self._entries[key]
+
+    def put(self, n: int, value):
+        """
+        Store a value for n, evicting the least recently used entries to stay
+        within max_bytes.
+        """
+        if n < self.min_n:
+            return
+        size = self._size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if n in self._entries:
+                self._entries.move_to_end(n)
+                return
+            self._entries[n] = value
+            insort(self._keys, n)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                key, evicted = self._entries.popitem(last=False)
+                self._keys.remove(key)
+                self.bytes -= self._size(evicted)
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,41 +1,216 @@
-from math import factorial
+from decimal import Decimal
+from fractions import Fraction
+from math import copysign, factorial, inf, isfinite, log2
+from app.config import Config
+from app.services.checkpoints import CheckpointStore
+
 
 class MathService:
+    # Previously computed values, used to resume new computations
+    fibonacci_checkpoints = CheckpointStore(Config.CHECKPOINT_MAX_BYTES,
+                                            Config.CHECKPOINT_MIN_N)
+    factorial_checkpoints = CheckpointStore(Config.CHECKPOINT_MAX_BYTES,
+                                            Config.CHECKPOINT_MIN_N)
+    # Up to this distance, stepping forward from a checkpoint beats doubling
+    FIBONACCI_STEP_LIMIT = 64
 
     @staticmethod
     def calculate_fibonacci(n: int) -> int:
         """
-        Calculate the nth Fibonacci number using an iterative approach.
+        Calculate the nth Fibonacci number using the fast-doubling method.
+        It needs O(log n) big-integer multiplications instead of n additions.
         :param n: The position in the Fibonacci sequence (0-indexed).
         :return: The nth Fibonacci number.
         """
-        if n <= 1:
-            return n
-        a, b = 0, 1
-        for _ in range(2, n + 1):
-            a, b = b, a + b
-        return b
+        return MathService.fibonacci_pair(n)[0]
+
+    @staticmethod
+    def fibonacci_pair(n: int) -> tuple:
+        """
+        Calculate the pair (F(n), F(n+1)) using the fast-doubling identities
+        F(2k) = F(k) * (2 * F(k+1) - F(k)) and F(2k+1) = F(k)^2 + F(k+1)^2.
+        The bits of n are consumed from the most significant one down. When a
+        checkpoint is close below n, the computation steps forward from it;
+        when a checkpoint matches a prefix of n's bits, doubling resumes there.
+        :param n: The position in the Fibonacci sequence (0-indexed).
+        :return: A tuple (F(n), F(n+1)).
+        :raises ValueError: If n is negative.
+        """
+        if n < 0:
+            raise ValueError("n must be a non-negative integer")
+        store = MathService.fibonacci_checkpoints
+        k, pair = store.floor(n)
+        if pair is not None and n - k <= MathService.FIBONACCI_STEP_LIMIT:
+            a, b = pair
+            for _ in range(n - k):
+                a, b = b, a + b
+        else:
+            shift, (a, b) = MathService._fibonacci_prefix(n)
+            for position in range(shift - 1, -1, -1):
+                c = a * ((b << 1) - a)
+                d = a * a + b * b
+                if (n >> position) & 1:
+                    a, b = d, c + d
+                else:
+                    a, b = c, d
+        store.put(n, (a, b))
+        return a, b
+
+    @staticmethod
+    def _fibonacci_prefix(n: int) -> tuple:
+        """
+        Find the longest prefix of n's bits with a stored checkpoint.
+        :return: A tuple (number of remaining bits, (F(prefix), F(prefix+1)))
+        """
+        store = MathService.fibonacci_checkpoints
+        for shift in range(1, n.bit_length()):
+            prefix = n >> shift
+            if prefix < store.min_n:
+                break
+            pair = store.get(prefix)
+            if pair is not None:
+                return shift, pair
+        return n.bit_length(), (0, 1)
+
+    @staticmethod
+    def power(base: float, exponent: int, exact: bool = False):
+        """
+        Calculate the power of a base raised to an exponent using iterative
+        exponentiation by squaring, which needs O(log exponent) multiplications.
+        :param base: The base number.
+        :param exponent: The exponent to raise the base to.
+        :param exact: If True, compute an exact result (see exact_power).
+        :return: The result of base raised to the exponent. Float results out
+            of range become infinite (or zero), as float arithmetic does.
+        :raises ValueError: If zero is raised to a negative exponent.
+        """
+        if exact:
+            return MathService.exact_power(base, exponent)
+        if exponent < 0 and base == 0:
+            raise ValueError("Zero cannot be raised to a negative exponent")
+
+        result = 1
+        square = base
+        remaining = abs(exponent)
+        while remaining:
+            if remaining & 1:
+                result *= square
+            remaining >>= 1
+            if remaining:
+                square *= square
+
+        if exponent < 0:
+            if result == 0:
+                # base ** -exponent underflowed, so its inverse overflows
+                return copysign(inf, result)
+            return 1 / result
+        return result
 
     @staticmethod
-    def power(base: float, exponent: int) -> float:
+    def exact_power(base, exponent: int):
         """
-        Calculate the power of a base raised to an exponent using recursion.
+        Calculate base raised to an exponent without any loss of precision.
+        Integer bases give an exact int, while decimal or fractional bases
+        (float, Decimal, Fraction or a string such as "0.1" or "1/3") give an
+        exact Fraction. Floats are read by their shortest decimal repr, so 0.1
+        is treated as 1/10 rather than its binary approximation.
         :param base: The base number.
         :param exponent: The exponent to raise the base to.
-        :return: The result of base raised to the exponent.
+        :return: An int when the result is integral, otherwise a Fraction.
+        :raises ValueError: If the base is not a valid number or zero is raised
+            to a negative exponent.
         """
-        if exponent == 0:
-            return 1
-        elif exponent < 0:
-            return 1 / MathService.power(base, -exponent)
+        if isinstance(base, int) and not isinstance(base, bool):
+            value = base
+        elif isinstance(base, float):
+            if not isfinite(base):
+                raise ValueError("Base must be a finite number")
+            value = Fraction(repr(base))
+        elif isinstance(base, (Fraction, Decimal, str)):
+            try:
+                value = Fraction(base)
+            except (ValueError, ArithmeticError) as e:
+                raise ValueError(f"Invalid base for exact power: {base!r}") from e
         else:
-            return base * MathService.power(base, exponent - 1)
+            raise ValueError(f"Unsupported base type: {type(base).__name__}")
+
+        if exponent < 0:
+            if value == 0:
+                raise ValueError("Zero cannot be raised to a negative exponent")
+            value = Fraction(value)
+
+        # int and Fraction powers already use binary exponentiation in C
+        result = value ** exponent
+        if isinstance(result, Fraction) and result.denominator == 1:
+            return result.numerator
+        return result
+
+    @staticmethod
+    def estimate_cost(operation: str, *args) -> float:
+        """
+        Estimate the cost of an operation as the approximate size of its result
+        in bits. Big-integer work grows with the operand size, so this is a
+        cheap proxy used to route and schedule computations.
+        :param operation: One of "fibonacci", "factorial" or "power".
+        :param args: The arguments the operation will be called with.
+        :return: The estimated result size in bits.
+        :raises ValueError: If the operation is not recognized.
+        """
+        if operation == "fibonacci":
+            return 0.6943 * args[0]
+        if operation == "factorial":
+            n = args[0]
+            return n * log2(n) if n > 1 else 1
+        if operation == "power":
+            base, exponent = args[0], args[1]
+            exact = args[2] if len(args) > 2 else False
+            if not exact:
+                return abs(exponent).bit_length()
+            try:
+                size = Fraction(repr(base) if isinstance(base, float) else base)
+            except (ValueError, TypeError, ArithmeticError):
+                return 1
+            bits = size.numerator.bit_length() + size.denominator.bit_length()
+            return abs(exponent) * bits
+        raise ValueError(f"Unknown operation: {operation}")
 
     @staticmethod
     def factorial(n: int) -> int:
         """
-        Calculate the factorial of a non-negative integer n.
+        Calculate the factorial of a non-negative integer n. If a checkpoint
+        k! with n/2 <= k <= n is stored, the result continues from it with a
+        range product, otherwise math.factorial is used.
         :param n: A non-negative integer.
         :return: The factorial of n.
+        :raises ValueError: If n is negative.
+        """
+        if n < 0:
+            raise ValueError("factorial() not defined for negative values")
+        store = MathService.factorial_checkpoints
+        k, value = store.floor(n)
+        if k == n:
+            return value
+        if value is not None and n - k <= n // 2:
+            result = value * MathService.range_product(k + 1, n)
+        else:
+            result = factorial(n)
+        store.put(n, result)
+        return result
+
+    @staticmethod
+    def range_product(low: int, high: int) -> int:
+        """
+        Calculate the product of all integers from low to high (inclusive) by
+        binary splitting, so the big multiplications have balanced operands.
+        :param low: The first factor.
+        :param high: The last factor.
+        :return: The product, or 1 for an empty range.
         """
-        return factorial(n)
+        if high - low < 16:
+            result = 1
+            for i in range(low, high + 1):
+                result *= i
+            return result
+        middle = (low + high) // 2
+        return (MathService.range_product(low, middle)
+                * MathService.range_product(middle + 1, high))
@@ -0,0 +1,343 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from flask import current_app, has_app_context
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from app.services.math_service import MathService
+from app.utils.errors import OverloadedAppError
+
+
+class _PowerLawFit:
+    """
+    Online fit of seconds = scale * bits ** exponent, by exponentially weighted
+    linear regression of log(seconds) on log(bits).
+    """
+    def __init__(self, scale: float, exponent: float, decay: float):
+        self.prior_scale = scale
+        self.prior_exponent = exponent
+        self.decay = decay
+        self.count = 0
+        self.mean_x = 0.0
+        self.mean_y = 0.0
+        self.var_x = 0.0
+        self.cov_xy = 0.0
+
+    def observe(self, bits: float, seconds: float):
+        x, y = math.log(bits), math.log(seconds)
+        self.count += 1
+        # Plain running means until there are enough samples for the decay
+        weight = max(self.decay, 1 / self.count)
+        dx, dy = x - self.mean_x, y - self.mean_y
+        self.mean_x += weight * dx
+        self.mean_y += weight * dy
+        self.var_x = (1 - weight) * (self.var_x + weight * dx * dx)
+        self.cov_xy = (1 - weight) * (self.cov_xy + weight * dx * dy)
+
+    @property
+    def exponent(self) -> float:
+        # The slope needs inputs of different sizes, otherwise only the scale
+        # is calibrated
+        if self.count < 5 or self.var_x < 0.25:
+            return self.prior_exponent
+        return min(max(self.cov_xy / self.var_x, 1.0), 2.2)
+
+    @property
+    def log_scale(self) -> float:
+        if self.count == 0:
+            return math.log(self.prior_scale)
+        return self.mean_y - self.exponent * self.mean_x
+
+    def predict(self, bits: float) -> float:
+        return math.exp(self.log_scale + self.exponent * math.log(max(bits, 2)))
+
+
+class CostModel:
+    """
+    Estimate of the compute time of an operation from the size of its result
+    (MathService.estimate_cost, in bits), as a power law per operation.
+    The priors were measured on one core; every computation that takes longer
+    than min_seconds recalibrates the fit of its operation, so the estimates
+    follow the actual hardware and load.
+    """
+    # (seconds per bit ** exponent, exponent) of the big-integer algorithms
+    PRIORS = {
+        "fibonacci": (1e-11, 1.7),
+        "factorial": (7e-11, 1.54),
+        "power": (2.9e-11, 1.5),
+    }
+
+    def __init__(self, decay: float = 0.05, min_seconds: float = 1e-3,
+                 min_bits: float = 10_000):
+        """
+        Initialize the model.
+        :param decay: Weight of each new observation in the fits
+        :param min_seconds: Shorter computations are dominated by overhead and
+            not used for calibration
+        :param min_bits: Smaller results are dominated by overhead as well
+        """
+        self.min_seconds = min_seconds
+        self.min_bits = min_bits
+        self._fits = {operation: _PowerLawFit(scale, exponent, decay)
+                      for operation, (scale, exponent) in self.PRIORS.items()}
+        self._lock = threading.Lock()
+
+    def estimate(self, operation: str, *args) -> float:
+        """
+        Return the estimated compute time of an operation in seconds.
+        """
+        bits = MathService.estimate_cost(operation, *args)
+        with self._lock:
+            return self._fits[operation].predict(bits)
+
+    def observe(self, operation: str, args: tuple, seconds: float):
+        """
+        Calibrate the model with the measured compute time of an operation.
+        """
+        if seconds is None or seconds < self.min_seconds:
+            return
+        bits = MathService.estimate_cost(operation, *args)
+        if bits < self.min_bits:
+            return
+        with self._lock:
+            self._fits[operation].observe(bits, seconds)
+
+    def calibrate(self, rows) -> int:
+        """
+        Calibrate the model with recorded requests, such as the MathRequest
+        history. Only Fibonacci and factorial rows are used: their input_value
+        is the argument itself.
+        :param rows: Tuples (operation, input_value, processing_time)
+        :return: The number of rows used
+        """
+        used = 0
+        for operation, input_value, seconds in rows:
+            if operation not in ("fibonacci", "factorial"):
+                continue
+            try:
+                args = (int(input_value),)
+            except (TypeError, ValueError):
+                continue
+            self.observe(operation, args, seconds)
+            used += 1
+        return used
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {operation: {"observations": fit.count,
+                                "exponent": fit.exponent,
+                                "scale": math.exp(fit.log_scale)}
+                    for operation, fit in self._fits.items()}
+
+
+class AdmissionController:
+    """
+    Admission control of computations against a compute budget.
+    Each computation is admitted with its estimated compute time, and the
+    estimated time of the admitted computations still running may not exceed
+    the budget. A computation that does not fit waits up to max_wait seconds
+    for running ones to finish, then is rejected with a Retry-After estimate;
+    one larger than the whole budget is rejected at once, since it belongs in
+    the job API. Computations estimated under cheap_cost bypass the budget, so
+    interactive requests are never queued behind expensive ones.
+    """
+    def __init__(self, db=None, model: CostModel = None, budget: float = 30.0,
+                 cheap_cost: float = 0.05, max_wait: float = 2.0,
+                 enabled: bool = True, history: int = 5000):
+        """
+        Initialize the controller.
+        :param db: The SQLAlchemy instance holding the MathRequest history the
+            cost model is first calibrated with
+        :param model: The cost model (a new CostModel by default)
+        :param budget: Estimated compute seconds that may be in flight at once
+        :param cheap_cost: Computations estimated under this many seconds are
+            always admitted
+        :param max_wait: Seconds a computation may wait for the budget
+        :param enabled: If False, every computation is admitted
+        :param history: Number of recorded inputs to calibrate with, 0 to skip
+        """
+        self.db = db
+        self.history = history
+        self._calibrated = db is None or not history
+        self._calibration = None
+        self.model = model or CostModel()
+        self.budget = budget
+        self.cheap_cost = cheap_cost
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self._tickets = {}
+        self._in_flight = 0.0
+        self._next_ticket = 0
+        self._condition = threading.Condition()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.bypassed = 0
+
+    def init_app(self, app):
+        """
+        Read the ADMISSION_* settings of a Flask application.
+        """
+        self.enabled = app.config.get("ADMISSION_ENABLED", self.enabled)
+        self.budget = app.config.get("ADMISSION_BUDGET", self.budget)
+        self.cheap_cost = app.config.get("ADMISSION_CHEAP_COST", self.cheap_cost)
+        self.max_wait = app.config.get("ADMISSION_MAX_WAIT", self.max_wait)
+        self.history = app.config.get("ADMISSION_HISTORY", self.history)
+        self._calibrated = self.db is None or not self.history
+
+    def estimate(self, operation: str, *args) -> float:
+        """
+        Return the estimated compute time of an operation in seconds.
+        The first call in an application context starts calibrating the cost
+        model with the recorded requests in the background; estimates use the
+        priors until it is done.
+        """
+        if not self._calibrated and has_app_context():
+            self._calibrated = True
+            self._calibration = threading.Thread(
+                target=self.calibrate, args=(current_app._get_current_object(),),
+                name="admission-calibration", daemon=True)
+            self._calibration.start()
+        return self.model.estimate(operation, *args)
+
+    def calibrate(self, app) -> int:
+        """
+        Calibrate the cost model with the slowest recorded processing_time of
+        each input among the latest `history` requests of every operation;
+        faster records of an input are cache hits. Each query reads a bounded
+        range of the (operation, id) index.
+        :param app: The Flask application whose database holds the requests
+        :return: The number of distinct inputs used
+        """
+        from app.models.request import MathRequest
+
+        slowest = {}
+        with app.app_context():
+            try:
+                for operation in ("fibonacci", "factorial"):
+                    rows = self.db.session.execute(
+                        select(MathRequest.operation, MathRequest.input_value,
+                               MathRequest.processing_time)
+                        .where(MathRequest.operation == operation)
+                        .order_by(MathRequest.id.desc())
+                        .limit(self.history)).all()
+                    # Oldest first, so the latest records weigh the most
+                    for row in reversed(rows):
+                        key = (row.operation, row.input_value)
+                        slowest[key] = max(slowest.pop(key, 0.0),
+                                           row.processing_time or 0.0)
+            except SQLAlchemyError:
+                self.db.session.rollback()
+                return 0
+        return self.model.calibrate(
+            (operation, input_value, seconds)
+            for (operation, input_value), seconds in slowest.items())
+
+    def observe(self, operation: str, args: tuple, seconds: float):
+        """
+        Calibrate the cost model with a measured compute time.
+        """
+        self.model.observe(operation, args, seconds)
+
+    def acquire(self, seconds: float, timeout: float = None):
+        """
+        Admit a computation, waiting for the budget if needed.
+        :param seconds: Estimated compute time of the computation
+        :param timeout: Seconds to wait for the budget (defaults to max_wait)
+        :return: A ticket to pass to release(), None for untracked computations
+        :raises OverloadedAppError: If the computation cannot be admitted
+        """
+        if not self.enabled or seconds < self.cheap_cost:
+            self.bypassed += 1
+            return None
+        if self.rejects(seconds):
+            self.rejected += 1
+            raise OverloadedAppError(
+                f"Estimated compute time of {seconds:.1f}s exceeds the budget of "
+                f"{self.budget:.1f}s, submit it with POST /api/jobs instead")
+
+        deadline = time.monotonic() + (self.max_wait if timeout is None else timeout)
+        with self._condition:
+            waited = False
+            while self._in_flight + seconds > self.budget:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    raise OverloadedAppError(
+                        f"Compute budget exhausted ({self._in_flight:.1f}s of "
+                        f"{self.budget:.1f}s in flight), try again later",
+                        retry_after=self._retry_after(seconds))
+                waited = True
+                self._condition.wait(remaining)
+            self.queued += waited
+            self.admitted += 1
+            self._next_ticket += 1
+            ticket = self._next_ticket
+            self._tickets[ticket] = (time.monotonic(), seconds)
+            self._in_flight += seconds
+        return ticket
+
+    def rejects(self, seconds: float) -> bool:
+        """
+        Return True if a computation of this estimated time is too large for the
+        budget and would be rejected without waiting.
+        """
+        return self.enabled and seconds > self.budget
+
+    def release(self, ticket):
+        """
+        Return the budget of a finished computation.
+        """
+        if ticket is None:
+            return
+        with self._condition:
+            _, seconds = self._tickets.pop(ticket)
+            self._in_flight = max(self._in_flight - seconds, 0.0) \
+                if self._tickets else 0.0
+            self._condition.notify_all()
+
+    @contextmanager
+    def admit(self, seconds: float):
+        """
+        Context manager admitting a computation for the duration of the block.
+        """
+        ticket = self.acquire(seconds)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def _retry_after(self, seconds: float) -> int:
+        """
+        Estimate in whole seconds when enough running computations will have
+        finished for one of the given cost to fit. Must hold the condition.
+        """
+        needed = self._in_flight + seconds - self.budget
+        now = time.monotonic()
+        wait = 0.0
+        for start, cost in sorted(self._tickets.values(), key=sum):
+            needed -= cost
+            wait = start + cost - now
+            if needed <= 0:
+                break
+        return max(1, math.ceil(wait))
+
+    def stats(self) -> dict:
+        """
+        Return the budget use, the admission counters and the cost model fits.
+        """
+        with self._condition:
+            in_flight = self._in_flight
+            running = len(self._tickets)
+        return {
+            "enabled": self.enabled,
+            "budget": self.budget,
+            "in_flight": in_flight,
+            "running": running,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "bypassed": self.bypassed,
+            "model": self.model.stats(),
+        }
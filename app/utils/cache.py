@@ -1,3 +1,24 @@
+import threading
 from flask_caching import Cache
 
 cache = Cache()
+_cost_hints = threading.local()
+
+
+def hint_cost(seconds: float):
+    """
+    Record how long the value about to be cached in this thread took to compute.
+    Cost-aware backends such as SharedMemoryCache read it on the next set, so
+    the memoized helpers can pass a cost without changing the memoize API.
+    :param seconds: The compute time of the value
+    """
+    _cost_hints.value = seconds
+
+
+def take_cost_hint() -> float:
+    """
+    Return and clear the cost recorded by hint_cost in this thread, if any.
+    """
+    seconds = getattr(_cost_hints, "value", None)
+    _cost_hints.value = None
+    return seconds
@@ -53,3 +53,70 @@ class CalculationAppError(AppError):
             "type": self.error_type,
             "details": self.details
         }), self.status_code
+
+
+class NotFoundAppError(AppError):
+    """
+    Exception raised when a requested resource does not exist.
+    """
+    status_code = 404
+    error_type = "not_found"
+
+    def __init__(self, message="Resource not found"):
+        super().__init__(details=message)
+
+
+class ConflictAppError(AppError):
+    """
+    Exception raised when a resource is not in a state allowing the operation.
+    """
+    status_code = 409
+    error_type = "conflict"
+
+    def __init__(self, message="Operation conflicts with the resource state"):
+        super().__init__(details=message)
+
+
+class QueueFullAppError(AppError):
+    """
+    Exception raised when the service cannot accept more work for now.
+    """
+    status_code = 503
+    error_type = "unavailable"
+
+    def __init__(self, message="Service is busy, try again later"):
+        super().__init__(details=message)
+
+
+class OverloadedAppError(QueueFullAppError):
+    """
+    Exception raised when a computation does not fit in the compute budget.
+    """
+    def __init__(self, message="Compute budget exhausted, try again later",
+                 retry_after: int = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    def to_response(self):
+        body, status = super().to_response()
+        if self.retry_after is None:
+            return body, status
+        return body, status, {"Retry-After": str(self.retry_after)}
+
+
+class RateLimitedAppError(AppError):
+    """
+    Exception raised when a client exceeds its rate limit.
+    """
+    status_code = 429
+    error_type = "rate_limited"
+
+    def __init__(self, message="Rate limit exceeded", retry_after: int = None):
+        super().__init__(details=message)
+        self.retry_after = retry_after
+
+    def to_response(self):
+        body, status = super().to_response()
+        if self.retry_after is None:
+            return body, status
+        return body, status, {"Retry-After": str(self.retry_after)}
@@ -0,0 +1,107 @@
+import base64
+import decimal
+from fractions import Fraction
+
+FORMATS = ("decimal", "hex", "base64")
+# Below this size str() is as fast as the divide-and-conquer conversion
+DECIMAL_CUTOFF_BITS = 12_000
+# Size of the pieces converted by Decimal(int) directly
+DECIMAL_LEAF_BITS = 2048
+
+
+def _decimal_power2(width: int, powers: dict) -> decimal.Decimal:
+    """
+    Return 2**width as an exact Decimal, memoizing the powers of two needed by
+    int_to_decimal in powers.
+    """
+    result = powers.get(width)
+    if result is None:
+        if width <= DECIMAL_LEAF_BITS:
+            result = decimal.Decimal(2) ** width
+        elif width - 1 in powers:
+            result = powers[width - 1] * 2
+        else:
+            half = width >> 1
+            result = _decimal_power2(half, powers) * _decimal_power2(width - half,
+                                                                     powers)
+        powers[width] = result
+    return result
+
+
+def _int_to_decimal(value: int, width: int, powers: dict) -> decimal.Decimal:
+    if width <= DECIMAL_LEAF_BITS:
+        return decimal.Decimal(value)
+    half = width >> 1
+    high = value >> half
+    low = value - (high << half)
+    high = _int_to_decimal(high, width - half, powers)
+    return _int_to_decimal(low, half, powers) + high * _decimal_power2(half, powers)
+
+
+def int_to_decimal(value: int) -> str:
+    """
+    Convert an integer to its decimal string in subquadratic time.
+    CPython's str(int) is quadratic in the number of digits, so for results of
+    hundreds of thousands of digits it costs more than computing them. Above
+    DECIMAL_CUTOFF_BITS the integer is split in binary halves (free shifts) and
+    reassembled as high * 2**half + low with exact Decimal arithmetic, whose
+    multiplication is subquadratic (libmpdec uses Karatsuba and number-theoretic
+    transforms); printing the resulting Decimal is linear.
+    Unlike str(), this is not bounded by sys.get_int_max_str_digits(), whose
+    purpose is to guard against the quadratic conversion.
+    """
+    if abs(value) < 1 << DECIMAL_CUTOFF_BITS:
+        return str(value)
+    magnitude = abs(value)
+    with decimal.localcontext() as context:
+        context.prec = decimal.MAX_PREC
+        context.Emax = decimal.MAX_EMAX
+        context.Emin = decimal.MIN_EMIN
+        context.traps[decimal.Inexact] = True
+        text = str(_int_to_decimal(magnitude, magnitude.bit_length(), {}))
+    return "-" + text if value < 0 else text
+
+
+def to_text(value) -> str:
+    """
+    Decimal text of a result, using int_to_decimal for integers and for both
+    terms of exact fractions.
+    """
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, int):
+        return int_to_decimal(value)
+    if isinstance(value, Fraction):
+        return f"{int_to_decimal(value.numerator)}/{int_to_decimal(value.denominator)}"
+    return str(value)
+
+
+def clip(text: str, length: int) -> str:
+    """
+    Shorten text to at most length characters for a bounded column, ending it
+    with "..." when it is cut.
+    """
+    if len(text) <= length:
+        return text
+    return text[:length - 3] + "..."
+
+
+def format_result(value, fmt: str = "decimal") -> tuple:
+    """
+    Format a result for a response.
+    Integers can also be returned without any decimal conversion: "hex" gives
+    Python's hex() notation (e.g. "-0x1f") and "base64" the standard Base64 of
+    the minimal big-endian two's complement bytes. Other results are always
+    returned in decimal.
+    :param value: The result of an operation
+    :param fmt: One of FORMATS
+    :return: A tuple (text, format actually used)
+    """
+    if fmt == "decimal" or not isinstance(value, int) or isinstance(value, bool):
+        return to_text(value), "decimal"
+    if fmt == "hex":
+        return hex(value), "hex"
+    if fmt == "base64":
+        data = value.to_bytes(value.bit_length() // 8 + 1, "big", signed=True)
+        return base64.b64encode(data).decode("ascii"), "base64"
+    raise ValueError(f"Unknown result format: {fmt!r}")
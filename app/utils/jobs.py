@@ -0,0 +1,209 @@
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from app.utils.errors import QueueFullAppError
+from app.utils.formatting import to_text
+from app.utils.worker import timed
+
+
+class Job:
+    """
+    A computation submitted through the job API.
+    """
+    def __init__(self, operation: str, input_value: str, future: Future,
+                 cost: float = None):
+        """
+        Initialize a job around the future of its computation.
+        :param operation: The operation name (e.g. "factorial")
+        :param input_value: The formatted input of the operation
+        :param future: Future returning a (result, duration) tuple
+        :param cost: Estimated cost of the computation
+        """
+        self.id = uuid.uuid4().hex
+        self.operation = operation
+        self.input_value = input_value
+        self.future = future
+        self.cost = cost
+        self.created_at = time.time()
+        self.finished_at = None
+        self.result = None
+        self.processing_time = None
+        self.error = None
+
+    @property
+    def started_at(self) -> float:
+        """
+        When the computation started running, None while it is queued.
+        """
+        return getattr(self.future, "started_at", None)
+
+    @property
+    def status(self) -> str:
+        """
+        The job status: pending, running, done, failed or cancelled.
+        """
+        if self.future.cancelled():
+            return "cancelled"
+        if self.finished_at is not None:
+            return "failed" if self.error is not None else "done"
+        if self.future.running() or self.future.done():
+            return "running"
+        return "pending"
+
+    def to_dict(self, seconds_per_cost: float = None) -> dict:
+        """
+        Serialize the job for the API.
+        :param seconds_per_cost: Calibrated time per unit of cost, used to
+            estimate the progress of a running job
+        """
+        status = self.status
+        if status in ("done", "failed", "cancelled"):
+            progress = 1.0
+        elif status == "pending":
+            progress = 0.0
+        elif seconds_per_cost and self.cost:
+            # Time spent queued is not part of the estimated cost
+            elapsed = time.time() - (self.started_at or self.created_at)
+            progress = min(0.99, elapsed / (self.cost * seconds_per_cost))
+        else:
+            progress = None
+
+        return {
+            "job_id": self.id,
+            "operation": self.operation,
+            "input_value": self.input_value,
+            "status": status,
+            "progress": progress,
+            "result": self.result,
+            "error": self.error,
+            "processing_time": self.processing_time,
+        }
+
+
+class JobManager:
+    """
+    Runs long computations on the AsyncWorker and keeps track of their state
+    so clients can submit, poll, fetch and cancel them.
+    """
+    def __init__(self, worker, max_pending: int = 16, result_ttl: float = 3600):
+        """
+        Initialize the JobManager.
+        :param worker: The AsyncWorker running the computations
+        :param max_pending: Maximum number of unfinished jobs
+        :param result_ttl: Seconds a finished job is kept before being purged
+        """
+        self.worker = worker
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.app = None
+        self.seconds_per_cost = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """
+        Bind the manager to a Flask application. Completion callbacks run
+        inside its application context.
+        """
+        self.app = app
+        self.max_pending = app.config.get("JOBS_MAX_PENDING", self.max_pending)
+        self.result_ttl = app.config.get("JOBS_RESULT_TTL", self.result_ttl)
+
+    def submit(self, operation, input_value, func, *args, cost: float = None,
+               on_complete=None) -> Job:
+        """
+        Submit a computation as a job.
+        :param operation: The operation name
+        :param input_value: The formatted input of the operation
+        :param func: Function to run
+        :param args: Positional arguments for the function
+        :param cost: Estimated cost, used for routing and progress
+        :param on_complete: Callback receiving the finished job and its raw
+            result, called inside the application context
+        :return: The created job
+        :raises QueueFullAppError: If too many jobs are unfinished
+        """
+        with self._lock:
+            self._purge()
+            pending = sum(1 for job in self._jobs.values() if not job.future.done())
+            if pending >= self.max_pending:
+                raise QueueFullAppError(
+                    f"Too many pending jobs ({pending}), try again later")
+            future = self.worker.run(timed, func, *args, cost=cost,
+                                     operation=operation)
+            job = Job(operation, input_value, future, cost)
+            self._jobs[job.id] = job
+
+        future.add_done_callback(lambda f: self._finish(job, on_complete))
+        return job
+
+    def get(self, job_id: str) -> Job:
+        """
+        Return a job by id, or None if it does not exist or was purged.
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a job that has not started yet.
+        :return: True if the job is cancelled, False if it is already running
+            or finished
+        """
+        job = self.get(job_id)
+        return job is not None and job.future.cancel()
+
+    def describe(self, job: Job) -> dict:
+        """
+        Serialize a job using the current progress calibration.
+        """
+        return job.to_dict(self.seconds_per_cost)
+
+    def _finish(self, job: Job, on_complete):
+        """
+        Record the outcome of a job once its future is resolved.
+        """
+        try:
+            self._record(job, on_complete)
+        finally:
+            job.finished_at = time.time()
+
+    def _record(self, job: Job, on_complete):
+        """
+        Store the result or error of a resolved job and run its callback.
+        """
+        if job.future.cancelled():
+            return
+        error = job.future.exception()
+        if error is not None:
+            job.error = str(error)
+            return
+
+        result, job.processing_time = job.future.result()
+        if job.cost:
+            rate = job.processing_time / job.cost
+            self.seconds_per_cost = rate if self.seconds_per_cost is None \
+                else 0.8 * self.seconds_per_cost + 0.2 * rate
+        try:
+            job.result = to_text(result)
+        except ValueError as e:
+            job.error = str(e)
+            return
+        if on_complete is not None:
+            if self.app is None:
+                on_complete(job, result)
+            else:
+                with self.app.app_context():
+                    on_complete(job, result)
+
+    def _purge(self):
+        """
+        Drop finished jobs older than the result TTL. Must hold the lock.
+        """
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None
+                   and now - job.finished_at > self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,140 @@
+import json
+import struct
+import orjson
+
+# Batch frames of a level are sent under "<LEVEL>.BATCH", so subscriptions to
+# a level topic receive its JSON and batch messages alike
+BATCH_SUFFIX = b".BATCH"
+MAGIC = b"LB\x02"
+LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
+LEVEL_CODES = {level: code for code, level in enumerate(LEVELS)}
+NO_STRING = 0xFFFF
+# Magic, first timestamp in microseconds, source string, strings, records
+_HEADER = struct.Struct("<3sqHHI")
+_STRING = struct.Struct("<H")
+# Level, microseconds since the previous record, operation string,
+# message length, context length
+_RECORD = struct.Struct("<HqHII")
+
+
+def batch_topic(level: str) -> bytes:
+    """
+    Return the topic of the batch frames of a level.
+    """
+    return level.upper().encode() + BATCH_SUFFIX
+
+
+def is_batch_topic(topic: bytes) -> bool:
+    return topic.endswith(BATCH_SUFFIX)
+
+
+def dump_json(value) -> bytes:
+    """
+    Encode a value as JSON. orjson rejects some values, such as integers
+    beyond 64 bits, which are then encoded by the json module, with str() for
+    any type it does not support either.
+    :raises ValueError: If the value cannot be encoded at all
+    """
+    try:
+        return orjson.dumps(value)
+    except orjson.JSONEncodeError:
+        try:
+            return json.dumps(value, default=str).encode()
+        except (TypeError, ValueError, RecursionError) as e:
+            raise ValueError(f"Cannot encode as JSON: {e}") from e
+
+
+def encode_batch(records: list, source: str) -> tuple:
+    """
+    Pack log records into one batch frame.
+    The frame starts with a table of the distinct source, operation and
+    non-standard level strings, which records refer to by index; standard
+    levels are numeric codes and timestamps are deltas from the previous
+    record. Messages are UTF-8 and contexts JSON, as in JSON frames. Records
+    whose context cannot be encoded are left out.
+    :param records: Tuples (timestamp, level, message, context, operation)
+    :param source: Name of the sending host
+    :return: A tuple (encoded frame, number of records left out)
+    """
+    strings = {}
+
+    def intern(value: str) -> int:
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    source_index = intern(source)
+    base = previous = int(records[0][0] * 1_000_000) if records else 0
+    body = []
+    skipped = 0
+    for timestamp, level, message, context, operation in records:
+        try:
+            context = dump_json(context) if context else b""
+        except ValueError:
+            skipped += 1
+            continue
+        level = level.upper()
+        code = LEVEL_CODES.get(level)
+        if code is None:
+            code = len(LEVELS) + intern(level)
+        micros = int(timestamp * 1_000_000)
+        message = message.encode()
+        body += (_RECORD.pack(code, micros - previous,
+                              NO_STRING if operation is None else intern(operation),
+                              len(message), len(context)),
+                 message, context)
+        previous = micros
+
+    table = []
+    for value in strings:
+        data = value.encode()
+        table += (_STRING.pack(len(data)), data)
+    return b"".join([_HEADER.pack(MAGIC, base, source_index, len(strings),
+                                  len(records) - skipped), *table, *body]), skipped
+
+
+def decode_batch(frame: bytes) -> list:
+    """
+    Unpack a batch frame.
+    :return: A list of dicts with the level, message, context, source,
+        operation and timestamp (seconds since the epoch) of each record
+    :raises ValueError: If the frame is not a valid batch frame
+    """
+    try:
+        magic, micros, source_index, string_count, record_count = \
+            _HEADER.unpack_from(frame)
+        if magic != MAGIC:
+            raise ValueError(f"Unknown batch frame version: {magic!r}")
+        offset = _HEADER.size
+        strings = []
+        for _ in range(string_count):
+            (length,) = _STRING.unpack_from(frame, offset)
+            offset += _STRING.size
+            strings.append(frame[offset:offset + length].decode())
+            offset += length
+        source = strings[source_index]
+
+        records = []
+        for _ in range(record_count):
+            code, delta, operation, message_length, context_length = \
+                _RECORD.unpack_from(frame, offset)
+            offset += _RECORD.size
+            message = frame[offset:offset + message_length].decode()
+            offset += message_length
+            context = orjson.loads(frame[offset:offset + context_length]) \
+                if context_length else {}
+            offset += context_length
+            micros += delta
+            records.append({
+                "level": LEVELS[code] if code < len(LEVELS)
+                else strings[code - len(LEVELS)],
+                "message": message,
+                "context": context,
+                "source": source,
+                "operation": None if operation == NO_STRING else strings[operation],
+                "timestamp": micros / 1_000_000,
+            })
+    except (struct.error, IndexError, UnicodeDecodeError, orjson.JSONDecodeError) as e:
+        raise ValueError(f"Invalid batch frame: {e}") from e
+    return records
@@ -0,0 +1,141 @@
+import mmap
+import os
+import struct
+import tempfile
+
+MAGIC = b"MTBL"
+VERSION = 1
+# magic, version, fibonacci count, factorial count
+HEADER = struct.Struct("<4sIII")
+OFFSETS = struct.Struct("<QQ")
+
+
+def build_table(path: str, fibonacci_count: int, factorial_count: int):
+    """
+    Build the lookup table file. Each table stores its values as little-endian
+    unsigned bytes, preceded by an array of uint64 offsets so value n spans
+    [offsets[n], offsets[n + 1]). The file is written to a temporary name and
+    renamed, so concurrent workers never see a partial file.
+    :param path: Destination path of the table file
+    :param fibonacci_count: Number of Fibonacci values (n < fibonacci_count)
+    :param factorial_count: Number of factorial values (n < factorial_count)
+    """
+    def fibonacci_values():
+        a, b = 0, 1
+        for _ in range(fibonacci_count):
+            yield a
+            a, b = b, a + b
+
+    def factorial_values():
+        value = 1
+        for n in range(factorial_count):
+            if n > 1:
+                value *= n
+            yield value
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, fibonacci_count, factorial_count))
+            for values, count in ((fibonacci_values(), fibonacci_count),
+                                  (factorial_values(), factorial_count)):
+                blobs = [v.to_bytes((v.bit_length() + 7) // 8, "little")
+                         for v in values]
+                offsets = [0]
+                for blob in blobs:
+                    offsets.append(offsets[-1] + len(blob))
+                f.write(struct.pack(f"<{count + 1}Q", *offsets))
+                f.writelines(blobs)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class LookupTables:
+    """
+    Precomputed Fibonacci and factorial values for small inputs, memory-mapped
+    from a compact binary file so lookups skip the cache and the worker.
+    """
+    OPERATIONS = ("fibonacci", "factorial")
+
+    def __init__(self):
+        self.path = None
+        self.counts = {operation: 0 for operation in self.OPERATIONS}
+        self._mmap = None
+        self._tables = {}
+
+    def init_app(self, app):
+        """
+        Load the tables configured for the application, building the file first
+        if it is missing or was built for different ranges.
+        """
+        if not app.config.get("LOOKUP_TABLE_ENABLED", True):
+            return
+        path = app.config.get("LOOKUP_TABLE_PATH") or os.path.join(
+            app.instance_path, "lookup_tables.bin")
+        counts = (app.config.get("LOOKUP_FIBONACCI_COUNT", 10_000),
+                  app.config.get("LOOKUP_FACTORIAL_COUNT", 2_000))
+        if self._header(path) != counts:
+            build_table(path, *counts)
+        self.load(path)
+
+    @staticmethod
+    def _header(path: str):
+        """
+        Return the (fibonacci count, factorial count) of a table file, or None
+        if it is missing or invalid.
+        """
+        try:
+            with open(path, "rb") as f:
+                magic, version, *counts = HEADER.unpack(f.read(HEADER.size))
+        except (OSError, struct.error):
+            return None
+        if magic != MAGIC or version != VERSION:
+            return None
+        return tuple(counts)
+
+    def load(self, path: str):
+        """
+        Memory-map a table file built by build_table.
+        """
+        self.close()
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, _, *counts = HEADER.unpack_from(self._mmap)
+        position = HEADER.size
+        for operation, count in zip(self.OPERATIONS, counts):
+            data_start = position + 8 * (count + 1)
+            self._tables[operation] = (position, data_start)
+            self.counts[operation] = count
+            data_size = struct.unpack_from("<Q", self._mmap, position + 8 * count)[0]
+            position = data_start + data_size
+        self.path = path
+
+    def get(self, operation: str, *args):
+        """
+        Return the precomputed result of an operation, or None if it is not
+        covered by the tables.
+        """
+        if self.counts.get(operation, 0) == 0 or len(args) != 1:
+            return None
+        n = args[0]
+        if not 0 <= n < self.counts[operation]:
+            return None
+        offsets_start, data_start = self._tables[operation]
+        start, end = OFFSETS.unpack_from(self._mmap, offsets_start + 8 * n)
+        return int.from_bytes(self._mmap[data_start + start:data_start + end],
+                              "little")
+
+    def close(self):
+        """
+        Release the memory map.
+        """
+        self._tables = {}
+        self.counts = {operation: 0 for operation in self.OPERATIONS}
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
@@ -0,0 +1,87 @@
+from datetime import timezone
+from urllib.parse import urlencode
+import orjson
+from flask import Response, jsonify, request, stream_with_context
+from app import db
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_CHUNK_SIZE = 1000
+
+
+def _utc(value):
+    """
+    Convert a datetime to the naive UTC form the tables store.
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def keyset(statement, id_column, time_column, query):
+    """
+    Apply the time range, the cursor and the ordering of a PageQuery to a
+    select statement. Rows are ordered by id, so a page continues strictly
+    after the id of the previous one and never has to skip over rows.
+    """
+    if query.since is not None:
+        statement = statement.where(time_column >= _utc(query.since))
+    if query.until is not None:
+        statement = statement.where(time_column < _utc(query.until))
+    if query.order == "desc":
+        if query.cursor is not None:
+            statement = statement.where(id_column < query.cursor)
+        return statement.order_by(id_column.desc())
+    if query.cursor is not None:
+        statement = statement.where(id_column > query.cursor)
+    return statement.order_by(id_column)
+
+
+def paginate(statement, id_column, time_column, query, serialize):
+    """
+    Return one page of rows as a JSON list, or every matching row as NDJSON if
+    the query asks for it.
+    The cursor of the next page is sent in the X-Next-Cursor header, along with
+    a Link header to it; both are absent on the last page.
+    :param statement: A select of the columns to return
+    :param id_column: The unique, increasing column the pages are keyed on
+    :param time_column: The column filtered by since and until
+    :param query: The PageQuery parsed from the request
+    :param serialize: Function turning a result row into a dict with an "id"
+    """
+    statement = keyset(statement, id_column, time_column, query)
+    if query.format == "ndjson" or \
+            request.accept_mimetypes.best == "application/x-ndjson":
+        if query.limit is not None:
+            statement = statement.limit(query.limit)
+        return stream_ndjson(statement, serialize), 200
+
+    limit = min(query.limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    rows = db.session.execute(statement.limit(limit + 1)).all()
+    items = [serialize(row) for row in rows[:limit]]
+    response = jsonify(items)
+    if len(rows) > limit:
+        cursor = items[-1]["id"]
+        args = request.args.to_dict()
+        args["cursor"] = cursor
+        response.headers["X-Next-Cursor"] = str(cursor)
+        response.headers["Link"] = f'<{request.base_url}?{urlencode(args)}>; rel="next"'
+    return response, 200
+
+
+def stream_ndjson(statement, serialize, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Stream the rows of a statement as newline-delimited JSON.
+    Rows are fetched chunk_size at a time from a server-side cursor where the
+    database driver supports one, and each chunk is sent as soon as it is
+    encoded, so memory use does not grow with the number of rows.
+    """
+    def generate():
+        result = db.session.execute(statement.execution_options(yield_per=chunk_size))
+        try:
+            for rows in result.partitions():
+                yield b"".join(orjson.dumps(serialize(row)) + b"\n" for row in rows)
+        finally:
+            result.close()
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
@@ -0,0 +1,198 @@
+import hashlib
+import math
+import os
+import tempfile
+import time
+from fractions import Fraction
+
+INT_TAG = b"i"
+FRACTION_TAG = b"f"
+STR_TAG = b"s"
+_LENGTH_BYTES = 8
+
+
+def decimal_digits(value: int) -> int:
+    """
+    Number of decimal digits of an integer, without converting it to decimal.
+    math.log10 gives the count in constant time; only values within rounding
+    error of a power of ten are settled by comparing with that power, which is
+    costly for large values and holds the GIL while it is computed.
+    """
+    value = abs(value)
+    if value < 10 ** 18:
+        return len(str(value))
+    logarithm = math.log10(value)
+    power = round(logarithm)
+    if abs(logarithm - power) > 1e-6:
+        return int(logarithm) + 1
+    return power + 1 if value >= 10 ** power else power
+
+
+class ResultStore:
+    """
+    Content-addressed file store for results too large for the result column
+    of math_requests.
+    Integers are stored as their signed little-endian bytes, so storing them
+    costs no decimal conversion, and exact fractions as the bytes of their
+    numerator and denominator; other values as UTF-8 text. Each value lives
+    in a file named by the SHA-256 of its encoding, so identical results are
+    stored once and concurrent writers never conflict.
+    Files no longer referenced by any row are removed by collect(), which the
+    retention runs after pruning.
+    """
+    def __init__(self, path: str = None, inline_bits: int = 800,
+                 inline_chars: int = 255):
+        """
+        Initialize the store.
+        :param path: Directory of the result files
+        :param inline_bits: Integers up to this many bits (about 240 digits)
+            are kept inline in the result column
+        :param inline_chars: Other results up to this length are kept inline
+        """
+        self.path = path
+        self.inline_bits = inline_bits
+        self.inline_chars = inline_chars
+
+    def init_app(self, app):
+        """
+        Read the RESULT_STORE_* settings of a Flask application.
+        """
+        self.path = app.config.get("RESULT_STORE_PATH") or os.path.join(
+            app.instance_path, "results")
+        self.inline_bits = app.config.get("RESULT_INLINE_BITS", self.inline_bits)
+
+    @staticmethod
+    def _int_bytes(value: int) -> bytes:
+        return value.to_bytes(value.bit_length() // 8 + 1, "little", signed=True)
+
+    @staticmethod
+    def encode(value) -> bytes:
+        if isinstance(value, int):
+            return INT_TAG + ResultStore._int_bytes(value)
+        if isinstance(value, Fraction):
+            numerator = ResultStore._int_bytes(value.numerator)
+            return b"".join([FRACTION_TAG,
+                             len(numerator).to_bytes(_LENGTH_BYTES, "little"),
+                             numerator, ResultStore._int_bytes(value.denominator)])
+        return STR_TAG + str(value).encode()
+
+    @staticmethod
+    def decode(data: bytes):
+        if data[:1] == INT_TAG:
+            return int.from_bytes(data[1:], "little", signed=True)
+        if data[:1] == FRACTION_TAG:
+            end = 1 + _LENGTH_BYTES + int.from_bytes(data[1:1 + _LENGTH_BYTES],
+                                                     "little")
+            return Fraction(int.from_bytes(data[1 + _LENGTH_BYTES:end], "little",
+                                           signed=True),
+                            int.from_bytes(data[end:], "little", signed=True))
+        return data[1:].decode()
+
+    def _file(self, digest: str) -> str:
+        return os.path.join(self.path, digest[:2], digest[2:4], f"{digest}.bin")
+
+    def put(self, value) -> str:
+        """
+        Store a value and return its SHA-256 hex digest, which is also its
+        reference in the store.
+        """
+        data = self.encode(value)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._file(digest)
+        try:
+            # Mark the file as fresh, so collect() keeps it until its row exists
+            os.utime(path)
+            return digest
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return digest
+
+    def get(self, digest: str):
+        """
+        Return the value stored under a digest, or None if there is none.
+        """
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            return None
+        try:
+            with open(self._file(digest), "rb") as f:
+                return self.decode(f.read())
+        except FileNotFoundError:
+            return None
+
+    def collect(self, referenced, grace: float = 3600) -> int:
+        """
+        Delete the files whose digest is not referenced, along with temporary
+        files left by interrupted writes.
+        :param referenced: Set of the digests still referenced by rows
+        :param grace: Files written or reused in the last grace seconds are
+            kept, since the row referencing them may not be inserted yet
+        :return: The number of files deleted
+        """
+        if not self.path or not os.path.isdir(self.path):
+            return 0
+        cutoff = time.time() - grace
+        deleted = 0
+        for directory, _, names in os.walk(self.path):
+            for name in names:
+                digest, ext = os.path.splitext(name)
+                if ext == ".bin" and digest in referenced:
+                    continue
+                if ext not in (".bin", ".tmp"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.unlink(path)
+                        deleted += 1
+                except FileNotFoundError:
+                    pass
+        return deleted
+
+    def prepare_row(self, row: dict) -> dict:
+        """
+        Turn the raw "value" of a math_requests row into its stored columns:
+        small results go inline in "result", large ones into the store with
+        the row holding the reference, the digit count and the hash.
+        Called by the write-behind queue right before the insert, so the
+        conversion stays off the request path. Rows already prepared are
+        returned unchanged.
+        """
+        if "value" not in row:
+            return row
+        row = dict(row)
+        value = row.pop("value")
+        if isinstance(value, int) and not isinstance(value, bool):
+            if value.bit_length() <= self.inline_bits:
+                row["result"] = str(value)
+                return row
+            row["result_digits"] = decimal_digits(value)
+        elif isinstance(value, Fraction):
+            # Length of "numerator/denominator", without converting either
+            length = decimal_digits(value.numerator) + (value.numerator < 0) + \
+                1 + decimal_digits(value.denominator)
+            if length <= self.inline_chars:
+                row["result"] = str(value)
+                return row
+            row["result_digits"] = length
+        else:
+            text = str(value)
+            if len(text) <= self.inline_chars:
+                row["result"] = text
+                return row
+            row["result_digits"] = len(text)
+        digest = self.put(value)
+        row["result"] = None
+        row["result_hash"] = digest
+        row["result_ref"] = os.path.relpath(self._file(digest), self.path)
+        return row
@@ -0,0 +1,236 @@
+import argparse
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select
+from app.models.log import LogEntry
+from app.models.request import MathRequest
+from app.models.rollup import HourlyRollup
+
+HOUR = timedelta(hours=1)
+
+
+def floor_hour(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def percentile(values: list, q: float):
+    """
+    Nearest-rank percentile of sorted values, or None if there are none.
+    """
+    if not values:
+        return None
+    return values[max(math.ceil(q * len(values)) - 1, 0)]
+
+
+class RetentionManager:
+    """
+    Retention of the math_requests and log_entries tables.
+    Rows older than retention_days are first rolled up into one HourlyRollup
+    row per hour and operation (request count, processing time percentiles,
+    log and error counts), then deleted in batches of batch_size with a pause
+    between batches, so that writers are never locked out for long.
+
+    Hours are rolled up in order and only once: a run starts after the latest
+    hour already rolled up, so a run interrupted between rollup and prune is
+    safely resumed by the next one. Rows that arrive for an hour after it was
+    rolled up are pruned without being counted.
+
+    After pruning, the files of the result store that no remaining row
+    references are deleted.
+    """
+    def __init__(self, db, retention_days: int = 30, batch_size: int = 5000,
+                 batch_pause: float = 0.05, interval: int = 3600, results=None):
+        """
+        Initialize the manager.
+        :param db: The SQLAlchemy extension instance
+        :param retention_days: Age in days after which raw rows are rolled up
+        :param batch_size: Maximum number of rows deleted per transaction
+        :param batch_pause: Seconds to wait between delete batches
+        :param interval: Seconds between runs of the background thread
+        :param results: The ResultStore of the out-of-line results (defaults to
+            the one of the application)
+        """
+        self.db = db
+        self.results = results
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.interval = interval
+        self.app = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        """
+        Bind the manager to a Flask application and read its RETENTION_* settings.
+        """
+        self.app = app
+        self.retention_days = app.config.get("RETENTION_DAYS", self.retention_days)
+        self.batch_size = app.config.get("RETENTION_BATCH_SIZE", self.batch_size)
+        self.batch_pause = app.config.get("RETENTION_BATCH_PAUSE", self.batch_pause)
+        self.interval = app.config.get("RETENTION_INTERVAL", self.interval)
+        if self.results is None:
+            from app import results
+            self.results = results
+
+    def run_once(self, now: datetime = None) -> dict:
+        """
+        Roll up and prune every row older than the retention period.
+        :param now: Current UTC time (defaults to datetime.utcnow())
+        :return: The number of hours rolled up and of rows pruned per table
+        """
+        cutoff = floor_hour((now or datetime.utcnow())
+                            - timedelta(days=self.retention_days))
+        with self.app.app_context():
+            hours = self.rollup(cutoff)
+            requests = self.prune(MathRequest, MathRequest.timestamp, cutoff)
+            logs = self.prune(LogEntry, LogEntry.created_at, cutoff)
+            collected = self.collect_results()
+        return {"cutoff": cutoff.isoformat(), "hours_rolled_up": hours,
+                "requests_pruned": requests, "logs_pruned": logs,
+                "results_collected": collected}
+
+    def rollup(self, cutoff: datetime) -> int:
+        """
+        Aggregate every hour before cutoff that was not rolled up yet.
+        :return: The number of hours rolled up
+        """
+        session = self.db.session
+        latest = session.scalar(select(func.max(HourlyRollup.hour)))
+        start = latest + HOUR if latest is not None else datetime.min
+        hours = 0
+        while (hour := self._next_hour(start, cutoff)) is not None:
+            session.add_all(self._aggregate(hour))
+            session.commit()
+            hours += 1
+            start = hour + HOUR
+        return hours
+
+    def _next_hour(self, start: datetime, cutoff: datetime):
+        """
+        Return the first hour at or after start and before cutoff that has rows
+        in either table, skipping empty hours with one index lookup per table.
+        """
+        candidates = [self.db.session.scalar(
+            select(func.min(column)).where(column >= start, column < cutoff))
+            for column in (MathRequest.timestamp, LogEntry.created_at)]
+        candidates = [value for value in candidates if value is not None]
+        return floor_hour(min(candidates)) if candidates else None
+
+    def _aggregate(self, hour: datetime) -> list:
+        """
+        Build the HourlyRollup rows of one hour.
+        """
+        session = self.db.session
+        end = hour + HOUR
+        times = {}
+        rows = session.execute(
+            select(MathRequest.operation, MathRequest.processing_time)
+            .where(MathRequest.timestamp >= hour, MathRequest.timestamp < end))
+        for operation, processing_time in rows:
+            times.setdefault(operation.lower(), []).append(processing_time)
+
+        logs = {}
+        rows = session.execute(
+            select(LogEntry.operation, LogEntry.level, func.count())
+            .where(LogEntry.created_at >= hour, LogEntry.created_at < end)
+            .group_by(LogEntry.operation, LogEntry.level))
+        for operation, level, count in rows:
+            counts = logs.setdefault((operation or "unknown").lower(), [0, 0])
+            counts[0] += count
+            if level == "ERROR":
+                counts[1] += count
+
+        rollups = []
+        for operation in sorted(times.keys() | logs.keys()):
+            values = sorted(t for t in times.get(operation, []) if t is not None)
+            log_count, errors = logs.get(operation, (0, 0))
+            rollups.append(HourlyRollup(
+                hour=hour, operation=operation,
+                requests=len(times.get(operation, [])), errors=errors,
+                logs=log_count, total_time=sum(values),
+                p50=percentile(values, 0.50), p95=percentile(values, 0.95),
+                p99=percentile(values, 0.99),
+                max_time=values[-1] if values else None,
+            ))
+        return rollups
+
+    def prune(self, model, column, cutoff: datetime) -> int:
+        """
+        Delete the rows of a model older than cutoff, batch_size rows per
+        transaction.
+        :return: The number of rows deleted
+        """
+        session = self.db.session
+        deleted = 0
+        while True:
+            ids = session.scalars(select(model.id).where(column < cutoff)
+                                  .order_by(model.id).limit(self.batch_size)).all()
+            if not ids:
+                break
+            session.execute(delete(model).where(model.id.in_(ids)))
+            session.commit()
+            deleted += len(ids)
+            if len(ids) < self.batch_size:
+                break
+            time.sleep(self.batch_pause)
+        return deleted
+
+    def collect_results(self) -> int:
+        """
+        Delete the result files no math_requests row references anymore.
+        :return: The number of files deleted
+        """
+        if self.results is None:
+            return 0
+        referenced = set(self.db.session.scalars(
+            select(MathRequest.result_hash).where(MathRequest.result_hash.isnot(None))
+            .distinct()))
+        return self.results.collect(referenced)
+
+    def start(self):
+        """
+        Run the retention every interval seconds in a daemon thread. Only one
+        process per database should do this.
+        """
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="retention")
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                result = self.run_once()
+                print(f"[Retention] {result}")
+            except Exception as e:
+                print(f"[Retention Error] {e}")
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        """
+        Stop the background thread after the current run.
+        """
+        self._stopped.set()
+
+
+def main():
+    """
+    Run the retention once, for example from cron:
+        python -m app.utils.retention
+    """
+    from app import create_app, db
+
+    parser = argparse.ArgumentParser(description="Roll up and prune old rows.")
+    parser.add_argument("--days", type=int, help="override RETENTION_DAYS")
+    args = parser.parse_args()
+    manager = RetentionManager(db)
+    manager.init_app(create_app())
+    if args.days is not None:
+        manager.retention_days = args.days
+    print(manager.run_once())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from flask_caching.backends.base import BaseCache
+from app.utils.cache import take_cost_hint
+
+
+def default_shared_path(name: str, scope: str = None) -> str:
+    """
+    Default location of a database shared by the processes of one instance: a
+    tmpfs-backed file under /dev/shm when available, so every process maps the
+    same memory pages. A hash of scope (such as the instance path of the
+    application) is part of the file name, so that separate instances on one
+    host do not share it.
+    :param name: Name of the database, such as "cache" or "stats"
+    :param scope: Identifier of the instance
+    """
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    if scope:
+        name = f"{name}-{hashlib.sha1(scope.encode()).hexdigest()[:12]}"
+    return os.path.join(directory, f"math-service-{name}.sqlite3")
+
+
+def default_cache_path(scope: str = None) -> str:
+    """
+    Default location of the shared cache (see default_shared_path).
+    """
+    return default_shared_path("cache", scope)
+
+
+class SharedMemoryCache(BaseCache):
+    """
+    Flask-Caching backend shared by every process on one host.
+    Entries live in a memory-mapped SQLite database on tmpfs, so all gunicorn
+    workers see the same results. Hit and miss counters are kept in the same
+    database, so they cover all processes.
+
+    The store is bounded by total pickled size with a GreedyDual-Size policy:
+    each entry has priority L + cost / size, where cost is the time it took to
+    compute (see app.utils.cache.hint_cost) and L an inflation value raised to
+    the priority of each evicted entry. The lowest priority is evicted first,
+    so results that are expensive to recompute and cheap to store survive, and
+    entries that are not hit again age out. A new entry is only admitted if it
+    is worth more than the entries it would push out.
+
+    Named locks (see lock()) are kept in a table of their own, outside the size
+    bound and the admission policy.
+
+    Reads do not take the write lock: with WAL they run concurrently with each
+    other and with writers. The priority refreshes and hit and miss counts of
+    the reads are kept in memory and written in one transaction with the next
+    write, or after touch_batch distinct hits or touch_interval seconds.
+    """
+    SCHEMA_VERSION = 3
+
+    def __init__(self, path: str = None, max_bytes: int = 256 * 1024 * 1024,
+                 default_timeout: int = 300, default_cost: float = 1e-3,
+                 touch_batch: int = 256, touch_interval: float = 1.0):
+        """
+        Initialize the cache and create its tables if needed.
+        :param path: Path of the database file (defaults to default_cache_path())
+        :param max_bytes: Maximum total size of the stored values in bytes
+        :param default_timeout: Default entry lifetime in seconds (0 = no expiry)
+        :param default_cost: Cost in seconds assumed for entries stored without
+            a cost hint, such as the memoize version keys
+        :param touch_batch: Distinct keys hit before their priorities are
+            refreshed without waiting for a write
+        :param touch_interval: Seconds after which the pending refreshes and
+            counts of the reads are written without waiting for a write
+        """
+        super().__init__(default_timeout=default_timeout)
+        self.path = path or default_cache_path()
+        self.max_bytes = max_bytes
+        self.default_cost = default_cost
+        self.touch_batch = touch_batch
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        self._pending_lock = threading.Lock()
+        self._reset_pending()
+        with self._transaction() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version != self.SCHEMA_VERSION:
+                # Cached data is disposable, so older layouts are simply dropped
+                conn.execute("DROP TABLE IF EXISTS entries")
+                conn.execute("DROP TABLE IF EXISTS stats")
+                conn.execute("DROP TABLE IF EXISTS locks")
+                conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                         "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                         "size INTEGER NOT NULL, expires REAL NOT NULL, "
+                         "cost REAL NOT NULL, priority REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_priority "
+                         "ON entries (priority)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats ("
+                         "name TEXT PRIMARY KEY, value NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS locks ("
+                         "key TEXT PRIMARY KEY, owner NOT NULL, "
+                         "expires REAL NOT NULL)")
+            conn.executemany("INSERT OR IGNORE INTO stats VALUES (?, 0)",
+                             [("hits",), ("misses",), ("bytes",), ("evictions",),
+                              ("rejections",), ("inflation",)])
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(
+            path=config.get("CACHE_SHARED_PATH")
+            or default_cache_path(app.instance_path),
+            max_bytes=config.get("CACHE_MAX_BYTES", 256 * 1024 * 1024),
+            default_cost=config.get("CACHE_DEFAULT_COST", 1e-3),
+        )
+        return cls(*args, **kwargs)
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+        Return the connection of the current thread, reopening it after a fork.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.execute("PRAGMA mmap_size=268435456")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self):
+        """
+        Open a write transaction, taking the database lock up front so that
+        concurrent processes serialize instead of failing on upgrade. The
+        pending effects of the reads are written with it.
+        """
+        return _Transaction(self._connection(), self._flush)
+
+    def _reset_pending(self):
+        self._pending_pid = os.getpid()
+        self._touched = set()
+        self._expired = set()
+        self._hits = 0
+        self._misses = 0
+        self._flushed = time.monotonic()
+
+    def _record(self, key: str, hit: bool, expired: bool = False):
+        """
+        Count a read for the next write: a hit refreshes the priority of its
+        key, and an expired entry is deleted.
+        """
+        with self._pending_lock:
+            if self._pending_pid != os.getpid():
+                # Reads counted by the parent are the parent's to write
+                self._reset_pending()
+            if hit:
+                self._hits += 1
+                self._touched.add(key)
+            else:
+                self._misses += 1
+            if expired:
+                self._expired.add(key)
+            due = len(self._touched) >= self.touch_batch or \
+                time.monotonic() - self._flushed >= self.touch_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the pending effects of the reads of this process now.
+        """
+        # Every write transaction starts with them
+        with self._transaction():
+            pass
+
+    def _flush(self, conn):
+        """
+        Write the pending effects of the reads. Runs in a write transaction.
+        """
+        with self._pending_lock:
+            if self._pending_pid != os.getpid():
+                self._reset_pending()
+            touched, expired = self._touched, self._expired
+            hits, misses = self._hits, self._misses
+            self._reset_pending()
+        if not (hits or misses or expired):
+            return
+        now = time.time()
+        for key in expired:
+            row = conn.execute("SELECT expires FROM entries WHERE key = ?",
+                               (key,)).fetchone()
+            if row is not None and row[0] and row[0] <= now:
+                self._remove(conn, key)
+        if touched:
+            inflation = self._stat(conn, "inflation")
+            conn.executemany("UPDATE entries SET priority = ? + cost / size "
+                             "WHERE key = ?", [(inflation, key) for key in touched])
+        self._bump(conn, "hits", hits)
+        self._bump(conn, "misses", misses)
+
+    @staticmethod
+    def _bump(conn, name: str, delta: int):
+        conn.execute("UPDATE stats SET value = value + ? WHERE name = ?", (delta, name))
+
+    def _expires(self, timeout) -> float:
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout > 0 else 0
+
+    def _remove(self, conn, key: str) -> bool:
+        row = conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return False
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self._bump(conn, "bytes", -row[0])
+        return True
+
+    @staticmethod
+    def _stat(conn, name: str):
+        return conn.execute("SELECT value FROM stats WHERE name = ?",
+                            (name,)).fetchone()[0]
+
+    def _store(self, conn, key: str, value, timeout, cost: float = None) -> bool:
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        size = len(blob)
+        if size > self.max_bytes:
+            self._bump(conn, "rejections", 1)
+            return False
+        if cost is None:
+            cost = self.default_cost
+        self._remove(conn, key)
+        priority = self._stat(conn, "inflation") + cost / size
+        if not self._make_room(conn, size, priority):
+            self._bump(conn, "rejections", 1)
+            return False
+        conn.execute("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                     (key, blob, size, self._expires(timeout), cost, priority))
+        self._bump(conn, "bytes", size)
+        return True
+
+    def _make_room(self, conn, size: int, priority: float) -> bool:
+        """
+        Free enough space for a new entry of the given size and priority.
+        Expired entries go first, then the lowest priorities. If that would
+        evict an entry worth at least as much as the new one, nothing is evicted
+        and the new entry is not admitted.
+        """
+        total = self._stat(conn, "bytes")
+        if total + size <= self.max_bytes:
+            return True
+        now = time.time()
+        expired = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries "
+                               "WHERE expires > 0 AND expires <= ?",
+                               (now,)).fetchone()[0]
+        if expired:
+            conn.execute("DELETE FROM entries WHERE expires > 0 AND expires <= ?",
+                         (now,))
+            self._bump(conn, "bytes", -expired)
+            total -= expired
+
+        victims = []
+        freed = 0
+        inflation = None
+        rows = conn.execute("SELECT key, size, priority FROM entries "
+                            "ORDER BY priority")
+        for key, victim_size, victim_priority in rows:
+            if total - freed + size <= self.max_bytes:
+                break
+            if victim_priority >= priority:
+                return False
+            victims.append((key,))
+            freed += victim_size
+            inflation = victim_priority
+
+        conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        self._bump(conn, "bytes", -freed)
+        self._bump(conn, "evictions", len(victims))
+        if inflation is not None:
+            conn.execute("UPDATE stats SET value = ? WHERE name = 'inflation'",
+                         (inflation,))
+        return True
+
+    @staticmethod
+    def _lookup(conn, key: str, now: float):
+        """
+        Return the value of an entry and whether it expired. Only reads, so it
+        needs no write transaction.
+        """
+        row = conn.execute("SELECT value, expires FROM entries WHERE key = ?",
+                           (key,)).fetchone()
+        if row is None:
+            return None, False
+        if row[1] and row[1] <= now:
+            return None, True
+        return row[0], False
+
+    def get(self, key: str):
+        blob, expired = self._lookup(self._connection(), key, time.time())
+        self._record(key, blob is not None, expired)
+        return None if blob is None else pickle.loads(blob)
+
+    def get_many(self, *keys: str) -> list:
+        # Not counted in the hit/miss statistics: Flask-Caching uses it for
+        # its internal memoize version keys.
+        conn = self._connection()
+        now = time.time()
+        blobs = [self._lookup(conn, key, now)[0] for key in keys]
+        return [None if blob is None else pickle.loads(blob) for blob in blobs]
+
+    def set(self, key: str, value, timeout=None) -> bool:
+        cost = take_cost_hint()
+        with self._transaction() as conn:
+            return self._store(conn, key, value, timeout, cost)
+
+    def set_many(self, mapping, timeout=None) -> list:
+        with self._transaction() as conn:
+            return [key for key, value in mapping.items()
+                    if self._store(conn, key, value, timeout)]
+
+    def add(self, key: str, value, timeout=None) -> bool:
+        cost = take_cost_hint()
+        with self._transaction() as conn:
+            if self._lookup(conn, key, time.time())[0] is not None:
+                return False
+            return self._store(conn, key, value, timeout, cost)
+
+    def delete(self, key: str) -> bool:
+        with self._transaction() as conn:
+            return self._remove(conn, key)
+
+    def delete_many(self, *keys: str) -> list:
+        with self._transaction() as conn:
+            return [key for key in keys if self._remove(conn, key)]
+
+    def has(self, key: str) -> bool:
+        return self._lookup(self._connection(), key, time.time())[0] is not None
+
+    def lock(self, key: str, owner, timeout: int) -> bool:
+        """
+        Take a named lock, unless another holder has it and it has not expired.
+        Unlike add(), taking a free lock never fails for lack of room.
+        :param key: Name of the lock
+        :param owner: Value identifying the holder, such as its PID
+        :param timeout: Seconds after which the lock expires
+        :return: True if the lock was taken
+        """
+        with self._transaction() as conn:
+            now = time.time()
+            conn.execute("DELETE FROM locks WHERE key = ? AND expires <= ?",
+                         (key, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO locks VALUES (?, ?, ?)",
+                                  (key, owner, now + timeout))
+            return cursor.rowcount == 1
+
+    def unlock(self, key: str) -> bool:
+        """
+        Release a named lock.
+        :return: True if the lock was held
+        """
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM locks WHERE key = ?",
+                                (key,)).rowcount == 1
+
+    def locked(self, key: str) -> bool:
+        """
+        Return True if a named lock is held and has not expired.
+        """
+        return self._connection().execute(
+            "SELECT 1 FROM locks WHERE key = ? AND expires > ?",
+            (key, time.time())).fetchone() is not None
+
+    def clear(self) -> bool:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("UPDATE stats SET value = 0")
+        return True
+
+    def stats(self) -> dict:
+        """
+        Return the hit, miss, eviction and rejection counters and the current
+        cache size, shared by all processes using this cache. The pending
+        counts of this process are written first.
+        """
+        self.flush()
+        conn = self._connection()
+        values = dict(conn.execute("SELECT name, value FROM stats").fetchall())
+        entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "backend": "shared",
+            "hits": values["hits"],
+            "misses": values["misses"],
+            "evictions": values["evictions"],
+            "rejections": values["rejections"],
+            "entries": entries,
+            "bytes": values["bytes"],
+            "max_bytes": self.max_bytes,
+        }
+
+
+class _Transaction:
+    """
+    Context manager running a block inside BEGIN IMMEDIATE ... COMMIT, after
+    an optional callback that receives the connection.
+    """
+    def __init__(self, conn: sqlite3.Connection, before=None):
+        self.conn = conn
+        self.before = before
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        if self.before is not None:
+            try:
+                self.before(self.conn)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Deduplication of identical in-flight computations.
+    The first request for a key becomes its leader and computes the value;
+    identical requests arriving before it finishes wait on the leader's future
+    instead of computing the value again, and get the same result or error.
+
+    With shared=True the deduplication also spans processes that share the
+    cache (such as gunicorn workers using SharedMemoryCache): before computing,
+    a leader takes a lock with the lock() method of the cache backend (see
+    SharedMemoryCache.lock), or an entry added with cache.add() on other
+    backends, and leaders in other processes wait until the value is cached or
+    the lock is released or expires. Values already cached skip the lock.
+    A leader that cannot take the lock, because the backend did not admit the
+    entry or it waited lock_timeout seconds, computes the value itself.
+    """
+    def __init__(self, cache=None, shared: bool = True, lock_timeout: int = 600,
+                 poll_interval: float = 0.05):
+        """
+        Initialize the registry.
+        :param cache: The Flask-Caching instance the values are cached in
+        :param shared: If True, also deduplicate across processes through the cache
+        :param lock_timeout: Seconds after which the lock of a leader that died
+            without releasing it expires, and the longest a leader waits for it
+        :param poll_interval: Seconds between checks while another process
+            computes the value
+        """
+        self.cache = cache
+        self.shared = shared
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+        self._futures = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.shared_waits = 0
+        self.shared_timeouts = 0
+
+    def init_app(self, app):
+        """
+        Read the SINGLE_FLIGHT_* settings of a Flask application.
+        """
+        self.shared = app.config.get("SINGLE_FLIGHT_SHARED", self.shared)
+        self.lock_timeout = app.config.get("SINGLE_FLIGHT_LOCK_TIMEOUT",
+                                           self.lock_timeout)
+        self.poll_interval = app.config.get("SINGLE_FLIGHT_POLL_INTERVAL",
+                                            self.poll_interval)
+
+    def claim(self, key: str) -> tuple:
+        """
+        Join the computation of a key in this process.
+        :return: A tuple (future, leader). The leader must compute the value and
+            call release(); the others wait on the future.
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._futures[key] = Future()
+            self.leaders += 1
+            return future, True
+
+    def release(self, key: str, future: Future, result=None, error=None):
+        """
+        Publish the result or error of a claimed key to its waiters.
+        """
+        with self._lock:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _lock_key(self, key: str) -> str:
+        return f"{key}:single-flight"
+
+    def _backend(self):
+        # The Flask-Caching extension wraps the backend, plain backends are used
+        # as they are
+        return getattr(self.cache, "cache", self.cache)
+
+    def _lead(self, key: str, deadline: float):
+        """
+        Decide whether this process may compute a key now.
+        :param deadline: time.monotonic() after which to stop waiting for the
+            lock of another process
+        :return: "cached" if the value is already cached, "locked" if this
+            process took the shared lock, "local" when computing without it, or
+            None if another process holds the lock
+        """
+        if not self.shared or self.cache is None:
+            return "local"
+        if self.cache.has(key):
+            return "cached"
+        lock_key = self._lock_key(key)
+        backend = self._backend()
+        if hasattr(backend, "lock"):
+            if backend.lock(lock_key, os.getpid(), self.lock_timeout):
+                return "locked"
+        elif self.cache.add(lock_key, os.getpid(), timeout=self.lock_timeout):
+            return "locked"
+        elif not self.cache.has(lock_key):
+            # The backend did not admit the lock entry, nobody holds it
+            return "local"
+        if time.monotonic() >= deadline:
+            self.shared_timeouts += 1
+            return "local"
+        return None
+
+    def _unlock(self, key: str, state):
+        if state != "locked":
+            return
+        backend = self._backend()
+        if hasattr(backend, "unlock"):
+            backend.unlock(self._lock_key(key))
+        else:
+            self.cache.delete(self._lock_key(key))
+
+    def do(self, key: str, fn, *args):
+        """
+        Return fn(*args), computed at most once at a time for a key.
+        """
+        future, leader = self.claim(key)
+        if not leader:
+            return future.result()
+        try:
+            deadline = time.monotonic() + self.lock_timeout
+            state = self._lead(key, deadline)
+            if state is None:
+                self.shared_waits += 1
+            while state is None:
+                time.sleep(self.poll_interval)
+                state = self._lead(key, deadline)
+            try:
+                result = fn(*args)
+            finally:
+                self._unlock(key, state)
+        except BaseException as e:
+            self.release(key, future, error=e)
+            raise
+        self.release(key, future, result)
+        return result
+
+    async def do_async(self, key: str, fn):
+        """
+        Coroutine variant of do(): return await fn(), computed at most once at a
+        time for a key, without blocking the event loop while waiting.
+        """
+        future, leader = self.claim(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            deadline = time.monotonic() + self.lock_timeout
+            state = self._lead(key, deadline)
+            if state is None:
+                self.shared_waits += 1
+            while state is None:
+                await asyncio.sleep(self.poll_interval)
+                state = self._lead(key, deadline)
+            try:
+                result = await fn()
+            finally:
+                self._unlock(key, state)
+        except BaseException as e:
+            self.release(key, future, error=e)
+            raise
+        self.release(key, future, result)
+        return result
+
+    def stats(self) -> dict:
+        """
+        Return the number of keys in flight and of deduplicated requests.
+        """
+        with self._lock:
+            in_flight = len(self._futures)
+        return {
+            "shared": self.shared,
+            "in_flight": in_flight,
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "shared_waits": self.shared_waits,
+            "shared_timeouts": self.shared_timeouts,
+        }
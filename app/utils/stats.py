@@ -0,0 +1,389 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+import orjson
+from app.utils.shared_cache import default_shared_path
+
+
+def run_id() -> str:
+    """
+    Identifier of the current run of the parent process: its PID and, where
+    /proc is available, its start time, so that a restarted server gets a new
+    identifier even if its PID is reused.
+    """
+    ppid = os.getppid()
+    try:
+        with open(f"/proc/{ppid}/stat") as f:
+            # The start time is field 22, the 20th after the command name
+            started = f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return str(ppid)
+    return f"{ppid}:{started}"
+
+
+def pid_alive(pid: int) -> bool:
+    """
+    Return True if a process with this PID is running.
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with a bounded relative error.
+    Values are counted in logarithmically spaced buckets, as in DDSketch and
+    HDR histograms: bucket i holds the values in (gamma^(i-1), gamma^i], so any
+    quantile is returned within relative_accuracy of the exact value. Merging
+    two sketches adds their bucket counts, which gives exactly the sketch of
+    the combined values, so per-worker sketches can be combined losslessly.
+    """
+    def __init__(self, relative_accuracy: float = 0.01, min_value: float = 1e-9):
+        """
+        Initialize an empty sketch.
+        :param relative_accuracy: Maximum relative error of the quantiles
+        :param min_value: Values at or below this are counted as zero
+        """
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value: float):
+        """
+        Count a value.
+        """
+        self.count += 1
+        if value <= self.min_value:
+            self.zeros += 1
+            return
+        index = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+
+    def merge(self, other: "QuantileSketch"):
+        """
+        Add the values counted by another sketch with the same accuracy.
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different accuracies")
+        self.count += other.count
+        self.zeros += other.zeros
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+
+    def quantile(self, q: float):
+        """
+        Return the q-quantile (0 <= q <= 1) of the counted values, or None if
+        the sketch is empty.
+        """
+        if self.count == 0:
+            return None
+        # Nearest rank: the smallest value with at least q of the values at or
+        # below it
+        rank = max(math.ceil(q * self.count), 1)
+        seen = self.zeros
+        if seen >= rank:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # Midpoint of the bucket in relative terms
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+    def to_dict(self) -> dict:
+        return {"accuracy": self.relative_accuracy, "min": self.min_value,
+                "zeros": self.zeros, "buckets": list(self.buckets.items())}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "QuantileSketch":
+        sketch = cls(data["accuracy"], data["min"])
+        sketch.zeros = data["zeros"]
+        sketch.buckets = {index: count for index, count in data["buckets"]}
+        sketch.count = sketch.zeros + sum(sketch.buckets.values())
+        return sketch
+
+
+class OperationStats:
+    """
+    Streaming aggregates of one operation: counters and a processing time sketch.
+    """
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.count = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def record(self, duration: float):
+        self.count += 1
+        self.total_time += duration
+        self.max_time = max(self.max_time, duration)
+        self.sketch.add(duration)
+
+    def merge(self, other: "OperationStats"):
+        self.count += other.count
+        self.errors += other.errors
+        self.total_time += other.total_time
+        self.max_time = max(self.max_time, other.max_time)
+        self.sketch.merge(other.sketch)
+
+    def summary(self) -> dict:
+        requests = self.count + self.errors
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "error_rate": self.errors / requests if requests else 0.0,
+            "avg_time": self.total_time / self.count if self.count else None,
+            "max_time": self.max_time if self.count else None,
+            "p50": self.sketch.quantile(0.50),
+            "p90": self.sketch.quantile(0.90),
+            "p95": self.sketch.quantile(0.95),
+            "p99": self.sketch.quantile(0.99),
+        }
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "errors": self.errors,
+                "total_time": self.total_time, "max_time": self.max_time,
+                "sketch": self.sketch.to_dict()}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "OperationStats":
+        stats = cls()
+        stats.count = data["count"]
+        stats.errors = data["errors"]
+        stats.total_time = data["total_time"]
+        stats.max_time = data["max_time"]
+        stats.sketch = QuantileSketch.from_dict(data["sketch"])
+        return stats
+
+
+class StreamingStats:
+    """
+    Per-operation request statistics, updated in memory on every request.
+    Each process publishes a snapshot of its aggregates to a small SQLite
+    database on tmpfs at most every publish_interval seconds (and from a
+    background thread, so idle workers are not left behind). Reading the
+    statistics merges the snapshots of every process in the same group, by
+    default the children of one run of a parent process such as the gunicorn
+    master (see run_id), and deletes the snapshots of processes that exited.
+    """
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path: str = None, publish_interval: float = 1.0,
+                 relative_accuracy: float = 0.01, group: str = None,
+                 shared: bool = True):
+        """
+        Initialize the statistics.
+        :param path: Path of the shared snapshot database (defaults to
+            default_shared_path("stats"), scoped to the application instance by
+            init_app)
+        :param publish_interval: Seconds between snapshots of this process
+        :param relative_accuracy: Relative error of the latency percentiles
+        :param group: Identifier of the processes whose statistics are merged
+            (defaults to run_id())
+        :param shared: If False, only this process' statistics are reported
+        """
+        self.path = path
+        self.publish_interval = publish_interval
+        self.relative_accuracy = relative_accuracy
+        self.group = group
+        self.shared = shared
+        self._operations = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._run_group = None
+        self._published = 0.0
+        self._dirty = False
+        self._thread = None
+
+    def init_app(self, app):
+        """
+        Read the STATS_* settings of a Flask application.
+        """
+        self.shared = app.config.get("STATS_SHARED", self.shared)
+        self.path = app.config.get("STATS_SHARED_PATH") or self.path or \
+            default_shared_path("stats", app.instance_path)
+        self.publish_interval = app.config.get("STATS_PUBLISH_INTERVAL",
+                                               self.publish_interval)
+        self.relative_accuracy = app.config.get("STATS_RELATIVE_ACCURACY",
+                                                self.relative_accuracy)
+
+    def _reset_after_fork(self):
+        """
+        Drop the aggregates inherited from the parent process, which publishes
+        them itself.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._operations = {}
+            self._thread = None
+            self._published = 0.0
+            self._dirty = False
+
+    def _stats(self, operation: str) -> OperationStats:
+        stats = self._operations.get(operation)
+        if stats is None:
+            stats = self._operations[operation] = OperationStats(self.relative_accuracy)
+        return stats
+
+    def record(self, operation: str, duration: float):
+        """
+        Count a successful request and its processing time.
+        """
+        with self._lock:
+            self._reset_after_fork()
+            self._stats(operation).record(duration)
+            self._dirty = True
+        self._maybe_publish()
+
+    def record_error(self, operation: str):
+        """
+        Count a failed request.
+        """
+        with self._lock:
+            self._reset_after_fork()
+            self._stats(operation).errors += 1
+            self._dirty = True
+        self._maybe_publish()
+
+    def snapshot(self) -> dict:
+        """
+        Return a serializable copy of this process' aggregates.
+        """
+        with self._lock:
+            self._reset_after_fork()
+            return {operation: stats.to_dict()
+                    for operation, stats in self._operations.items()}
+
+    def _maybe_publish(self):
+        if not self.shared:
+            return
+        self._ensure_thread()
+        if time.monotonic() - self._published >= self.publish_interval:
+            self.publish()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path or default_shared_path("stats"),
+                                   timeout=30, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != \
+                    self.SCHEMA_VERSION:
+                # Snapshots are disposable, so older layouts are simply dropped
+                conn.execute("DROP TABLE IF EXISTS snapshots")
+                conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            conn.execute("CREATE TABLE IF NOT EXISTS snapshots ("
+                         "grp TEXT NOT NULL, pid INTEGER NOT NULL, "
+                         "updated REAL NOT NULL, data BLOB NOT NULL, "
+                         "PRIMARY KEY (grp, pid))")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _group(self) -> str:
+        if self.group is not None:
+            return str(self.group)
+        if self._run_group is None or self._run_group[0] != os.getpid():
+            self._run_group = (os.getpid(), run_id())
+        return self._run_group[1]
+
+    def _expire(self, conn):
+        """
+        Delete the snapshots of processes that are no longer running, in any
+        group, so that neither restarted workers nor earlier runs are counted.
+        """
+        pids = [row[0] for row in conn.execute("SELECT DISTINCT pid FROM snapshots")]
+        dead = [(pid,) for pid in pids if not pid_alive(pid)]
+        if dead:
+            conn.executemany("DELETE FROM snapshots WHERE pid = ?", dead)
+
+    def publish(self):
+        """
+        Write the snapshot of this process to the shared database.
+        """
+        self._published = time.monotonic()
+        self._dirty = False
+        data = orjson.dumps(self.snapshot())
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?)",
+                (self._group(), os.getpid(), time.time(), data))
+        except sqlite3.Error as e:
+            print(f"[Stats Error] Failed to publish statistics: {e}")
+
+    def _snapshots(self) -> list:
+        """
+        Return the snapshot of this process followed by those published by the
+        other processes of the group.
+        """
+        snapshots = [self.snapshot()]
+        if self.shared:
+            self.publish()
+            conn = self._connection()
+            self._expire(conn)
+            rows = conn.execute(
+                "SELECT data FROM snapshots WHERE grp = ? AND pid != ?",
+                (self._group(), os.getpid())).fetchall()
+            snapshots += [orjson.loads(row[0]) for row in rows]
+        return snapshots
+
+    @staticmethod
+    def _merge(snapshots: list) -> dict:
+        merged = {}
+        for snapshot in snapshots:
+            for operation, data in snapshot.items():
+                stats = OperationStats.from_dict(data)
+                if operation in merged:
+                    merged[operation].merge(stats)
+                else:
+                    merged[operation] = stats
+        return merged
+
+    def collect(self) -> dict:
+        """
+        Return the aggregates merged over every process of the group, as a
+        dict of operation to OperationStats.
+        """
+        return self._merge(self._snapshots())
+
+    def summary(self) -> dict:
+        """
+        Return the merged statistics of every operation, ready for JSON.
+        """
+        snapshots = self._snapshots()
+        return {
+            "workers": len(snapshots),
+            "operations": {operation: stats.summary() for operation, stats
+                           in sorted(self._merge(snapshots).items())},
+        }
+
+    def _ensure_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name="stats-publisher")
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.publish_interval)
+            if self._dirty:
+                self.publish()
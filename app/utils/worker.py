@@ -1,28 +1,301 @@
-from concurrent.futures import ThreadPoolExecutor, Future
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from app.utils.stats import QuantileSketch
+
+
+def timed(func, *args, **kwargs):
+    """
+    Run a function and return its result along with the time it took.
+    Defined at module level so it can be sent to a process pool.
+    :return: A tuple (result, duration in seconds)
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
 
 
 class AsyncWorker:
     """
-    A simple asynchronous worker using ThreadPoolExecutor.
+    An asynchronous worker with a pluggable execution backend.
+    - "thread": every task runs on a ThreadPoolExecutor.
+    - "process": every task runs on a ProcessPoolExecutor, escaping the GIL.
+    - "hybrid": tasks are routed by their estimated cost. Tiny tasks run inline,
+      expensive ones go to the process pool and the rest to the thread pool.
+
+    Pooled tasks are not queued in the executors, which run them in FIFO order,
+    but in lanes by estimated cost: "interactive", "standard" and "bulk". A task
+    is handed to its pool only when a worker of the pool is free, choosing the
+    task with the earliest enqueue time plus aging seconds per lane rank, so
+    cheap tasks overtake queued expensive ones but a bulk task that waited more
+    than 2 * aging seconds goes first. lane_limits caps the tasks of a lane
+    running at once, keeping workers free for the other lanes. Queue wait and
+    run time are recorded per operation (see stats()).
     """
-    def __init__(self, max_workers: int = 1):
+    BACKENDS = ("thread", "process", "hybrid")
+    LANES = ("interactive", "standard", "bulk")
+    POOLS = ("thread", "process")
+
+    def __init__(self, max_workers: int = 1, backend: str = "thread",
+                 process_workers: int = None, inline_cost: float = 0,
+                 process_cost: float = float("inf"), start_method: str = "spawn",
+                 interactive_cost: float = 0, bulk_cost: float = float("inf"),
+                 lane_limits: dict = None, aging: float = 2.0):
         """
-        Initialize the AsyncWorker with a ThreadPoolExecutor.
+        Initialize the AsyncWorker. Pools are created lazily on first use.
+        :param max_workers: Number of threads in the thread pool
+        :param backend: One of "thread", "process" or "hybrid"
+        :param process_workers: Number of processes in the process pool
+            (defaults to max_workers)
+        :param inline_cost: In hybrid mode, tasks cheaper than this run inline
+        :param process_cost: In hybrid mode, tasks at least this expensive run
+            on the process pool
+        :param start_method: multiprocessing start method for the process pool
+        :param interactive_cost: Tasks cheaper than this use the interactive lane
+        :param bulk_cost: Tasks at least this expensive use the bulk lane; the
+            others, and tasks without a cost, use the standard lane
+        :param lane_limits: Maximum number of running tasks per lane name
+            (no limit for lanes not listed)
+        :param aging: Seconds of queue wait that make up for one lane of
+            priority; 0 runs tasks in FIFO order
+        :raises ValueError: If the backend is not recognized
         """
-        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown worker backend: {backend}")
+        self.backend = backend
+        self.max_workers = max_workers
+        self.process_workers = process_workers or max_workers
+        self.inline_cost = inline_cost
+        self.process_cost = process_cost
+        self.start_method = start_method
+        self.interactive_cost = interactive_cost
+        self.bulk_cost = bulk_cost
+        self.lane_limits = dict(lane_limits or {})
+        self.aging = aging
+        self._thread_executor = None
+        self._process_executor = None
+        self._lock = threading.Lock()
+        self._queues = {(pool, lane): deque() for pool in self.POOLS
+                        for lane in self.LANES}
+        self._busy = dict.fromkeys(self.POOLS, 0)
+        self._running = dict.fromkeys(self.LANES, 0)
+        self._histograms = {}
+        self._scheduler_lock = threading.Lock()
 
-    def run(self, func, *args, **kwargs) -> Future:
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """
+        The thread pool, created on first access.
+        """
+        with self._lock:
+            if self._thread_executor is None:
+                self._thread_executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers)
+            return self._thread_executor
+
+    @property
+    def process_executor(self) -> ProcessPoolExecutor:
+        """
+        The process pool, created on first access.
         """
-        Submit a task to the thread pool for asynchronous execution.
+        with self._lock:
+            if self._process_executor is None:
+                self._process_executor = ProcessPoolExecutor(
+                    max_workers=self.process_workers,
+                    mp_context=multiprocessing.get_context(self.start_method))
+            return self._process_executor
+
+    def run(self, func, *args, cost: float = None, operation: str = None,
+            **kwargs) -> Future:
+        """
+        Submit a task for asynchronous execution on the configured backend.
+        Tasks sent to the process pool must be picklable (module-level functions).
         :param func: Function to run
         :param args: Positional arguments for the function
+        :param cost: Estimated cost of the task, used for routing in hybrid mode
+            and to choose its lane
+        :param operation: Name the queue wait and run time are recorded under
+            (defaults to the function name)
         :param kwargs: Keyword arguments for the function
-        :return: Future object
+        :return: Future object. Its started_at attribute is the time.time() at
+            which the task left the queue, None while it is queued.
+        """
+        operation = operation or getattr(func, "__name__", "task")
+        if self.backend == "hybrid" and cost is not None and cost < self.inline_cost:
+            start = time.perf_counter()
+            started_at = time.time()
+            future = self._run_inline(func, *args, **kwargs)
+            future.started_at = started_at
+            with self._scheduler_lock:
+                self._record(operation, 0.0, time.perf_counter() - start)
+            return future
+
+        pool = "thread"
+        if self.backend == "process" or (self.backend == "hybrid" and cost is not None
+                                         and cost >= self.process_cost):
+            pool = "process"
+        lane = self.lane(cost)
+        future = Future()
+        future.started_at = None
+        with self._scheduler_lock:
+            self._queues[(pool, lane)].append(
+                (time.perf_counter(), operation, future, func, args, kwargs))
+        self._dispatch()
+        return future
+
+    def lane(self, cost: float = None) -> str:
+        """
+        Return the lane of a task with the given estimated cost.
+        """
+        if cost is None:
+            return "standard"
+        if cost < self.interactive_cost:
+            return "interactive"
+        if cost >= self.bulk_cost:
+            return "bulk"
+        return "standard"
+
+    def _capacity(self, pool: str) -> int:
+        return self.max_workers if pool == "thread" else self.process_workers
+
+    def _next_task(self, pool: str):
+        """
+        Pop the queued task of a pool to run next, or return None if there is
+        none or all lanes with queued tasks are at their limit. Must hold the
+        scheduler lock.
+        """
+        best = None
+        for rank, lane in enumerate(self.LANES):
+            queue = self._queues[(pool, lane)]
+            limit = self.lane_limits.get(lane)
+            if not queue or (limit is not None and self._running[lane] >= limit):
+                continue
+            # Tasks of a lane are in enqueue order, so its head goes first
+            key = queue[0][0] + rank * self.aging
+            if best is None or key < best[0]:
+                best = (key, lane)
+        if best is None:
+            return None
+        return best[1], self._queues[(pool, best[1])].popleft()
+
+    def _dispatch(self):
+        """
+        Hand queued tasks to the pools with free workers.
+        """
+        ready = []
+        with self._scheduler_lock:
+            for pool in self.POOLS:
+                while self._busy[pool] < self._capacity(pool):
+                    item = self._next_task(pool)
+                    if item is None:
+                        break
+                    lane, task = item
+                    # Cancelled while queued
+                    if not task[2].set_running_or_notify_cancel():
+                        continue
+                    self._busy[pool] += 1
+                    self._running[lane] += 1
+                    ready.append((pool, lane, task))
+        # Submitted without the lock, a task finishing at once dispatches again
+        for pool, lane, task in ready:
+            self._start(pool, lane, task)
+
+    def _start(self, pool: str, lane: str, task: tuple):
+        queued_at, operation, future, func, args, kwargs = task
+        started = time.perf_counter()
+        future.started_at = time.time()
+
+        def done(inner):
+            with self._scheduler_lock:
+                self._busy[pool] -= 1
+                self._running[lane] -= 1
+                self._record(operation, started - queued_at,
+                             time.perf_counter() - started)
+            try:
+                future.set_result(inner.result())
+            except BaseException as e:
+                future.set_exception(e)
+            self._dispatch()
+
+        try:
+            executor = self.executor if pool == "thread" else self.process_executor
+            inner = executor.submit(func, *args, **kwargs)
+        except BaseException as e:
+            inner = Future()
+            inner.set_exception(e)
+        inner.add_done_callback(done)
+
+    def _record(self, operation: str, wait: float, run_time: float):
+        """
+        Count the queue wait and run time of a task. Must hold the scheduler lock.
+        """
+        histograms = self._histograms.get(operation)
+        if histograms is None:
+            histograms = self._histograms[operation] = (QuantileSketch(0.05),
+                                                        QuantileSketch(0.05))
+        histograms[0].add(wait)
+        histograms[1].add(run_time)
+
+    @staticmethod
+    def _histogram(sketch: QuantileSketch) -> dict:
+        """
+        Summarize a sketch as quantiles and (upper bound in seconds, count) buckets.
+        """
+        buckets = [[sketch.min_value, sketch.zeros]] if sketch.zeros else []
+        buckets += [[sketch.gamma ** index, sketch.buckets[index]]
+                    for index in sorted(sketch.buckets)]
+        return {"count": sketch.count, "p50": sketch.quantile(0.50),
+                "p90": sketch.quantile(0.90), "p99": sketch.quantile(0.99),
+                "buckets": buckets}
+
+    def stats(self) -> dict:
+        """
+        Return the queued and running tasks per lane, the busy workers per pool,
+        and the queue wait and run time histograms per operation.
+        """
+        with self._scheduler_lock:
+            lanes = {lane: {"queued": sum(len(self._queues[(pool, lane)])
+                                          for pool in self.POOLS),
+                            "running": self._running[lane],
+                            "limit": self.lane_limits.get(lane)}
+                     for lane in self.LANES}
+            pools = {pool: {"busy": self._busy[pool],
+                            "workers": self._capacity(pool)}
+                     for pool in self.POOLS}
+            operations = {operation: {"queue_wait": self._histogram(wait),
+                                      "run_time": self._histogram(run_time)}
+                          for operation, (wait, run_time) in self._histograms.items()}
+        return {"backend": self.backend, "aging": self.aging, "lanes": lanes,
+                "pools": pools, "operations": operations}
+
+    @staticmethod
+    def _run_inline(func, *args, **kwargs) -> Future:
+        """
+        Run a task in the calling thread and wrap its outcome in a Future.
         """
-        return self.executor.submit(func, *args, **kwargs)
+        future = Future()
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
 
     def shutdown(self, wait=True):
         """
-        Shutdown the executor gracefully.
+        Shutdown the executors gracefully. Tasks still queued are cancelled.
         """
-        self.executor.shutdown(wait=wait)
+        with self._scheduler_lock:
+            queued = [task for queue in self._queues.values() for task in queue]
+            for queue in self._queues.values():
+                queue.clear()
+        for task in queued:
+            task[2].cancel()
+        with self._lock:
+            executors = [self._thread_executor, self._process_executor]
+            self._thread_executor = None
+            self._process_executor = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=wait)
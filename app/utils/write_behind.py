@@ -0,0 +1,230 @@
+import atexit
+import os
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+
+class WriteBehindQueue:
+    """
+    Write-behind persistence for database rows.
+    Rows are queued in memory and a background thread flushes them with one
+    bulk insert per model once the batch size or the flush interval is reached,
+    keeping database round trips off the request path. The queue is flushed on
+    shutdown. When it is full, the caller flushes synchronously instead of
+    dropping rows.
+    A row that cannot be prepared or that the database rejects is dropped and
+    counted, and the rest of its batch is still written. Batches failing on
+    the database itself (OperationalError) are kept for the next flush.
+    """
+    def __init__(self, db, batch_size: int = 200, flush_interval: float = 1.0,
+                 max_queue: int = 10_000, enabled: bool = True):
+        """
+        Initialize the queue.
+        :param db: The SQLAlchemy extension instance
+        :param batch_size: Number of queued rows that triggers a flush
+        :param flush_interval: Maximum seconds a row waits before being flushed
+        :param max_queue: Number of queued rows above which callers flush inline
+        :param enabled: If False, rows are written synchronously on add
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.enabled = enabled
+        self.app = None
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.rows_dropped = 0
+        self.last_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    def init_app(self, app):
+        """
+        Bind the queue to a Flask application and register the shutdown flush.
+        """
+        self.app = app
+        self.batch_size = app.config.get("PERSIST_BATCH_SIZE", self.batch_size)
+        self.flush_interval = app.config.get("PERSIST_FLUSH_INTERVAL",
+                                             self.flush_interval)
+        self.max_queue = app.config.get("PERSIST_MAX_QUEUE", self.max_queue)
+        self.enabled = app.config.get("PERSIST_WRITE_BEHIND", self.enabled)
+        atexit.register(self.close)
+
+    def add(self, model, row: dict, prepare=None):
+        """
+        Queue one row for insertion.
+        :param model: The SQLAlchemy model class of the row
+        :param row: Column values of the row
+        :param prepare: Optional function turning the row into its final column
+            values, called right before the insert. It must return prepared
+            rows unchanged, since rows are retried after a failed flush.
+        """
+        self.add_many(model, [row], prepare)
+
+    def add_many(self, model, rows: list, prepare=None):
+        """
+        Queue many rows of the same model for insertion.
+        """
+        if not rows:
+            return
+        if not self.enabled or self._closed:
+            self._write([(model, row, prepare) for row in rows])
+            return
+
+        with self._lock:
+            self._rows.extend((model, row, prepare) for row in rows)
+            depth = len(self._rows)
+        self._ensure_thread()
+        if depth >= self.max_queue:
+            self.flush()
+        elif depth >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Write every queued row now.
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return
+            try:
+                self._write(rows)
+            except Exception as e:
+                self.failures += 1
+                print(f"[WriteBehind Error] Failed to flush {len(rows)} rows: {e}")
+                with self._lock:
+                    # Keep the rows for the next attempt, within the queue bound
+                    self._rows = (rows + self._rows)[-self.max_queue:]
+
+    def _write(self, rows: list):
+        """
+        Insert rows with one bulk insert per model, inside an app context.
+        If the bulk insert fails, the rows are inserted one by one so that only
+        those the database rejects are dropped. Rows that were written or
+        dropped are removed from rows, which only keeps the ones to retry when
+        an OperationalError is raised.
+        """
+        start = time.perf_counter()
+        self._prepare(rows)
+        by_model = {}
+        for model, row, _ in rows:
+            by_model.setdefault(model, []).append(row)
+
+        with self.app.app_context():
+            try:
+                for model, model_rows in by_model.items():
+                    self.db.session.execute(self.db.insert(model), model_rows)
+                self.db.session.commit()
+                self.rows_written += len(rows)
+                rows.clear()
+            except OperationalError:
+                self.db.session.rollback()
+                raise
+            except Exception:
+                self.db.session.rollback()
+                self._write_each(rows)
+
+        self.last_flush_latency = time.perf_counter() - start
+        self.total_flush_latency += self.last_flush_latency
+        self.flushes += 1
+
+    def _prepare(self, rows: list):
+        """
+        Replace each row of rows by its prepared values, dropping the rows
+        whose prepare function fails.
+        """
+        prepared = []
+        for model, row, prepare in rows:
+            if prepare is not None:
+                try:
+                    row = prepare(row)
+                except Exception as e:
+                    self._drop(model, e)
+                    continue
+            prepared.append((model, row, prepare))
+        rows[:] = prepared
+
+    def _write_each(self, rows: list):
+        """
+        Insert rows one at a time, dropping the ones the database rejects.
+        """
+        while rows:
+            model, row, _ = rows[0]
+            try:
+                self.db.session.execute(self.db.insert(model), [row])
+                self.db.session.commit()
+                self.rows_written += 1
+            except OperationalError:
+                self.db.session.rollback()
+                raise
+            except Exception as e:
+                self.db.session.rollback()
+                self._drop(model, e)
+            rows.pop(0)
+
+    def _drop(self, model, error: Exception):
+        self.rows_dropped += 1
+        print(f"[WriteBehind Error] Dropped a {model.__name__} row: {error}")
+
+    def _ensure_thread(self):
+        """
+        Start the flusher thread, again after a fork since threads do not
+        survive it.
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name="write-behind")
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        """
+        Stop the flusher thread and durably write the remaining rows.
+        """
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive() \
+                and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        if self.app is not None:
+            self.flush()
+
+    def stats(self) -> dict:
+        """
+        Return queue depth and flush metrics.
+        """
+        with self._lock:
+            depth = len(self._rows)
+        return {
+            "enabled": self.enabled,
+            "queue_depth": depth,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "failures": self.failures,
+            "rows_dropped": self.rows_dropped,
+            "last_flush_latency": self.last_flush_latency,
+            "avg_flush_latency": (self.total_flush_latency / self.flushes
+                                  if self.flushes else 0.0),
+        }
@@ -1,34 +1,159 @@
+import atexit
+import os
+import threading
+import time
+from collections import deque
 import zmq
-import orjson
 import socket
+from app.utils.log_wire import batch_topic, dump_json, encode_batch
+
+POLICIES = ("drop_new", "drop_old", "sample")
+WIRE_FORMATS = ("json", "batch")
 
 
 class ZMQLogger:
     """
     A ZeroMQ-based logger that sends structured log messages over a PUB socket.
+    log() never blocks and never touches the socket: it appends the raw record
+    to an in-process deque (appends and pops are atomic, so request threads
+    need no lock) and a dedicated sender thread, the only owner of the
+    socket, serializes the records and publishes them. When the queue is full,
+    records are dropped according to the policy and counted, so logging can
+    never add latency to a response; only these counters take a lock, which
+    is held for the increment alone:
+    - "drop_new" drops the incoming record
+    - "drop_old" drops the oldest queued record
+    - "sample" additionally keeps only one in sample_rate non-error records
+      once the queue is more than half full, then drops new records when full
+
+    In the "json" wire format every record is sent as a two-frame message
+    (level topic, JSON payload). In the "batch" format the sender waits up to
+    linger seconds and packs up to batch_size records into compact frames, one
+    per level under the "<LEVEL>.BATCH" topic, so that subscribers filter them
+    by level as they do JSON messages, see app/utils/log_wire.py.
     """
-    def __init__(self, address="tcp://localhost:5555"):
+    def __init__(self, address="tcp://localhost:5555", queue_size: int = 10_000,
+                 hwm: int = 100_000, policy: str = "drop_new",
+                 sample_rate: int = 10, wire: str = "json", batch_size: int = 500,
+                 linger: float = 0.05):
         """
-        Initialize the ZMQLogger with a PUB socket.
+        Initialize the ZMQLogger. The socket is created by the sender thread on
+        the first message, so the logger is safe to create before forking.
         :param address: The ZeroMQ address to connect to (default: tcp://localhost:5555)
+        :param queue_size: Maximum number of records waiting for the sender thread
+        :param hwm: Send high-water mark of the PUB socket, in messages
+        :param policy: What to do with records when the queue is full, see POLICIES
+        :param sample_rate: Under the "sample" policy, keep one in this many
+            non-error records while the queue is more than half full
+        :param wire: "json" or "batch", see WIRE_FORMATS
+        :param batch_size: Maximum number of records per batch frame
+        :param linger: Maximum seconds a record waits to be batched
         """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown log policy: {policy!r}")
+        if wire not in WIRE_FORMATS:
+            raise ValueError(f"Unknown log wire format: {wire!r}")
         self.address = address
         self.hostname = socket.gethostname()
-        self.context = zmq.Context()
-        self.publisher = self.context.socket(zmq.PUB)
-        self.publisher.connect(self.address)
+        self.queue_size = queue_size
+        self.hwm = hwm
+        self.policy = policy
+        self.sample_rate = sample_rate
+        self.wire = wire
+        self.batch_size = batch_size
+        self.linger = linger
+        self._queue = deque()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._sampled = 0
+        self.sent = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.failures = 0
+
+    def init_app(self, app):
+        """
+        Read the LOG_* settings of a Flask application and register the
+        shutdown flush.
+        """
+        self.address = app.config.get("LOG_FRONTEND_ADDRESS", self.address)
+        self.queue_size = app.config.get("LOG_QUEUE_SIZE", self.queue_size)
+        self.hwm = app.config.get("LOG_SNDHWM", self.hwm)
+        self.policy = app.config.get("LOG_DROP_POLICY", self.policy)
+        self.sample_rate = app.config.get("LOG_SAMPLE_RATE", self.sample_rate)
+        self.wire = app.config.get("LOG_WIRE_FORMAT", self.wire)
+        self.batch_size = app.config.get("LOG_SEND_BATCH_SIZE", self.batch_size)
+        self.linger = app.config.get("LOG_SEND_LINGER", self.linger)
+        if self.policy not in POLICIES:
+            raise ValueError(f"Unknown log policy: {self.policy!r}")
+        if self.wire not in WIRE_FORMATS:
+            raise ValueError(f"Unknown log wire format: {self.wire!r}")
+        atexit.register(self.close)
 
     def log(self, level: str, message: str, context: dict = None,
             operation: str = None):
         """
-        Send a structured log message.
+        Queue a structured log message for sending.
         :param level: Log level (e.g., "info", "warning", "error")
         :param message: Log message
         :param context: Additional context for the log message (optional)
         :param operation: The operation being logged (optional)
-        :raises ValueError: If the log level is not recognized
-        :raises Exception: If sending the message fails
         """
+        if self._closed:
+            return
+        depth = len(self._queue)
+        if depth >= self.queue_size:
+            if self.policy != "drop_old":
+                self._count_dropped(1)
+                return
+            try:
+                self._queue.popleft()
+                self._count_dropped(1)
+            except IndexError:
+                pass
+        elif self.policy == "sample" and depth > self.queue_size // 2 \
+                and level.upper() != "ERROR":
+            with self._lock:
+                self._sampled += 1
+                sampled_out = self._sampled % self.sample_rate != 0
+                self.sampled_out += sampled_out
+            if sampled_out:
+                return
+
+        self._queue.append((time.time(), level, message, context, operation))
+        self._ensure_thread()
+        if not self._wakeup.is_set() and (self.wire == "json"
+                                          or depth + 1 >= self.batch_size):
+            self._wakeup.set()
+
+    def _count_dropped(self, count: int):
+        # Incremented by the request threads and the sender thread
+        with self._lock:
+            self.dropped += count
+
+    def _ensure_thread(self):
+        """
+        Start the sender thread, again after a fork since threads do not
+        survive it.
+        """
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Records queued by the parent are the parent's to send
+                self._queue.clear()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name="zmq-logger")
+            self._thread.start()
+
+    def _encode(self, record) -> list:
+        _, level, message, context, operation = record
         payload = {
             "level": level.lower(),
             "message": message,
@@ -36,18 +161,98 @@ class ZMQLogger:
             "source": self.hostname,
             "operation": operation
         }
+        return [level.upper().encode(), dump_json(payload)]
 
+    def _run(self):
+        """
+        Sender thread: own the PUB socket and publish the queued records until
+        the logger is closed, then send what is left.
+        """
+        context = zmq.Context()
+        publisher = context.socket(zmq.PUB)
+        publisher.setsockopt(zmq.SNDHWM, self.hwm)
+        publisher.connect(self.address)
+        try:
+            while True:
+                closed = self._closed
+                self._drain(publisher)
+                if closed:
+                    break
+                self._wakeup.wait(self.linger if self.wire == "batch" else 0.1)
+                self._wakeup.clear()
+        finally:
+            publisher.close(linger=1000)
+            context.term()
+
+    def _drain(self, publisher):
+        if self.wire == "batch":
+            self._drain_batches(publisher)
+            return
+        while True:
+            try:
+                record = self._queue.popleft()
+            except IndexError:
+                return
+            try:
+                publisher.send_multipart(self._encode(record), flags=zmq.NOBLOCK)
+                self.sent += 1
+            except zmq.Again:
+                self._count_dropped(1)
+            except Exception as e:
+                self.failures += 1
+                print(f"[ZMQ Logger Error] Failed to send log message: {e}")
+
+    def _drain_batches(self, publisher):
+        while self._queue:
+            levels = {}
+            try:
+                for _ in range(self.batch_size):
+                    record = self._queue.popleft()
+                    levels.setdefault(record[1].upper(), []).append(record)
+            except IndexError:
+                pass
+            for level, records in levels.items():
+                self._send_batch(publisher, level, records)
+
+    def _send_batch(self, publisher, level: str, records: list):
+        frame, skipped = encode_batch(records, self.hostname)
+        if skipped:
+            self.failures += skipped
+            print(f"[ZMQ Logger Error] Failed to encode {skipped} log messages")
+        count = len(records) - skipped
+        if not count:
+            return
         try:
-            self.publisher.send_multipart([
-                level.upper().encode(),
-                orjson.dumps(payload)
-            ])
+            publisher.send_multipart([batch_topic(level), frame], flags=zmq.NOBLOCK)
+            self.sent += count
+        except zmq.Again:
+            self._count_dropped(count)
         except Exception as e:
-            print(f"[ZMQ Logger Error] Failed to send log message: {e}")
+            self.failures += count
+            print(f"[ZMQ Logger Error] Failed to send {count} log messages: {e}")
+
+    def stats(self) -> dict:
+        """
+        Return the queue depth and the sent and dropped record counters.
+        """
+        return {
+            "policy": self.policy,
+            "wire": self.wire,
+            "queue_depth": len(self._queue),
+            "queue_size": self.queue_size,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out,
+            "failures": self.failures,
+        }
 
-    def close(self):
+    def close(self, timeout: float = 5):
         """
-        Close the ZeroMQ publisher and terminate the context.
+        Send the queued records, then close the publisher and terminate its
+        context.
         """
-        self.publisher.close()
-        self.context.term()
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None and self._thread.is_alive() \
+                and self._pid == os.getpid():
+            self._thread.join(timeout=timeout)
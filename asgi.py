@@ -0,0 +1,10 @@
+from app import create_app
+from app.asgi import AsyncMathApp
+import sys
+
+# ASGI entry point, e.g. `uvicorn asgi:application`
+# or `gunicorn -k uvicorn.workers.UvicornWorker asgi:application`
+app = create_app()
+sys.set_int_max_str_digits(100_000)
+
+application = AsyncMathApp(app)
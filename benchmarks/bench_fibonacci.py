@@ -0,0 +1,54 @@
+"""
+Benchmark comparing the fast-doubling Fibonacci engine in MathService with the
+previous O(n) iterative loop.
+
+Run from the repository root:
+    python -m benchmarks.bench_fibonacci
+"""
+import time
+from app.services.math_service import MathService
+
+SIZES = [10, 100, 1_000, 10_000, 100_000, 1_000_000]
+
+
+def fibonacci_iterative(n: int) -> int:
+    """
+    The original iterative implementation, kept here as the baseline.
+    """
+    if n <= 1:
+        return n
+    a, b = 0, 1
+    for _ in range(2, n + 1):
+        a, b = b, a + b
+    return b
+
+
+def measure(func, n, repeat=3):
+    """
+    Return the best wall-clock time of `repeat` runs and the computed value.
+    """
+    best = float("inf")
+    value = None
+    for _ in range(repeat):
+        # Measure cold computations, not checkpoint hits from the previous run
+        MathService.fibonacci_checkpoints.clear()
+        start = time.perf_counter()
+        value = func(n)
+        best = min(best, time.perf_counter() - start)
+    return best, value
+
+
+def main():
+    print(f"{'n':>10} | {'iterative (s)':>14} | {'doubling (s)':>13} | {'speedup':>8}")
+    print("-" * 56)
+    for n in SIZES:
+        repeat = 1 if n >= 100_000 else 3
+        t_iter, v_iter = measure(fibonacci_iterative, n, repeat)
+        t_fast, v_fast = measure(MathService.calculate_fibonacci, n, repeat)
+        assert v_iter == v_fast, f"Mismatch for n={n}"
+        print(f"{n:>10} | {t_iter:>14.6f} | {t_fast:>13.6f} | "
+              f"{t_iter / t_fast:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark for the math_requests and log_entries indexes: latency of the filtered
+/api/requests and /api/logs queries on a SQLite database before and after
+upgrade_db() adds the model indexes, and the time it takes to build them.
+
+Run from the repository root (row counts are optional, default 1M and 10M):
+    python -m benchmarks.bench_indexes 1000000 10000000
+
+Each table gets the given number of rows, so the database file for 10M rows is
+several GB.
+"""
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DB_FD, DB_PATH = tempfile.mkstemp(suffix=".sqlite3")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+
+from sqlalchemy import text  # noqa: E402
+from app import create_app, db, limiter  # noqa: E402
+from app.database import upgrade_db  # noqa: E402
+
+START = datetime(2024, 1, 1)
+SPAN = timedelta(days=30)
+OPERATIONS = ["fibonacci"] * 6 + ["power"] * 3 + ["factorial"]
+REPEAT = 5
+
+
+def fill(rows):
+    """
+    Insert rows into both tables, with timestamps increasing over 30 days and
+    the operation and level mix of a busy service.
+    """
+    step = SPAN / rows
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA journal_mode=OFF")
+    rng = random.Random(0)
+    conn.executemany(
+        "INSERT INTO math_requests (operation, input_value, result, timestamp, "
+        "processing_time) VALUES (?, ?, ?, ?, ?)",
+        ((rng.choice(OPERATIONS), str(i % 5000), "0", str(START + step * i),
+          0.001) for i in range(rows)))
+    conn.executemany(
+        "INSERT INTO log_entries (level, message, details, operation, created_at) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (("ERROR" if rng.random() < 0.02 else "INFO", "calculated", "{}",
+          rng.choice(OPERATIONS), str(START + step * i)) for i in range(rows)))
+    conn.commit()
+    conn.close()
+
+
+def queries(rows):
+    """
+    The listing requests dashboards make, as (label, URL) pairs.
+    """
+    end = START + SPAN
+    hour = (START + SPAN / 2).isoformat()
+    hour_end = (START + SPAN / 2 + timedelta(hours=1)).isoformat()
+    day_end = (START + SPAN / 2 + timedelta(days=1)).isoformat()
+    recent = (end - timedelta(minutes=5)).isoformat()
+    return [
+        ("requests by operation", "/api/requests?operation=power&limit=100"),
+        ("requests by operation, deep page",
+         f"/api/requests?operation=factorial&limit=100&cursor={int(rows * 0.9)}"),
+        ("requests by operation in one day",
+         f"/api/requests?operation=factorial&since={hour}&until={day_end}"),
+        ("requests in one hour", f"/api/requests?since={hour}&until={hour_end}"),
+        ("errors, last 5 minutes", f"/api/logs?level=error&since={recent}&order=desc"),
+        ("logs by operation, newest",
+         "/api/logs?operation=factorial&order=desc&limit=100"),
+    ]
+
+
+def measure(client, url):
+    """
+    Return the median latency of a request in milliseconds.
+    """
+    latencies = []
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.get_json()
+    return statistics.median(latencies) * 1000
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1_000_000, 10_000_000]
+    app = create_app()
+    limiter.enabled = False
+    client = app.test_client()
+    try:
+        for rows in sizes:
+            with app.app_context():
+                db.drop_all()
+                db.create_all()
+                # Start from a database created before the indexes existed
+                for table in db.metadata.sorted_tables:
+                    for index in table.indexes:
+                        db.session.execute(text(f"DROP INDEX {index.name}"))
+                db.session.commit()
+                db.engine.dispose()
+
+            start = time.perf_counter()
+            fill(rows)
+            print(f"\n{rows:,} rows per table (filled in "
+                  f"{time.perf_counter() - start:.0f}s)")
+
+            before = {label: measure(client, url) for label, url in queries(rows)}
+            with app.app_context():
+                start = time.perf_counter()
+                upgrade_db()
+                build_time = time.perf_counter() - start
+            after = {label: measure(client, url) for label, url in queries(rows)}
+
+            print(f"upgrade_db() built the indexes in {build_time:.1f}s")
+            print(f"{'query':>34} | {'no index':>11} | {'indexed':>9} | {'speedup':>8}")
+            print("-" * 72)
+            for label, _ in queries(rows):
+                speedup = before[label] / after[label]
+                print(f"{label:>34} | {before[label]:>8.1f} ms | "
+                      f"{after[label]:>6.2f} ms | {speedup:>7.0f}x")
+    finally:
+        os.close(DB_FD)
+        os.unlink(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
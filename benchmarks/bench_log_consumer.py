@@ -0,0 +1,109 @@
+"""
+Benchmark for the ZMQ log consumer: messages per second stored by the previous
+per-message handler (a new app and one commit per message) and by the batched
+consumer, fed end to end over a TCP PUB/SUB socket.
+
+Run from the repository root:
+    python -m benchmarks.bench_log_consumer
+"""
+import os
+import tempfile
+import threading
+import time
+
+DB_FD, DB_PATH = tempfile.mkstemp(suffix=".sqlite3")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+
+import orjson  # noqa: E402
+import zmq  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.consumers.zmq_log_consumer import ZMQLogConsumer  # noqa: E402
+from app.models.log import LogEntry  # noqa: E402
+
+ADDRESS = "tcp://127.0.0.1:5599"
+LEGACY_MESSAGES = 200
+MESSAGES = 50_000
+
+
+def make_messages(count):
+    return [(b"INFO", orjson.dumps({
+        "level": "INFO",
+        "message": f"Fibonacci calculated for n={i}",
+        "source": "math_controller",
+        "context": {"n": i, "processing_time": 0.0001},
+        "operation": "fibonacci",
+    })) for i in range(count)]
+
+
+def legacy_handle(topic, payload):
+    """
+    The previous handler: parse, then build an app and commit one row.
+    """
+    log = orjson.loads(payload)
+    with create_app().app_context():
+        db.session.add(LogEntry(level=log["level"], message=log["message"],
+                                details=log["context"],
+                                operation=log["operation"]))
+        db.session.commit()
+
+
+def measure_legacy(messages):
+    start = time.perf_counter()
+    for topic, payload in messages:
+        legacy_handle(topic, payload)
+    return len(messages) / (time.perf_counter() - start)
+
+
+def measure_batched(app, messages, batch_size):
+    """
+    Publish the messages over TCP and return the rate at which the consumer
+    stored them.
+    """
+    consumer = ZMQLogConsumer(address=ADDRESS, app=app, batch_size=batch_size,
+                              poll_timeout=100)
+    consumer.subscriber.setsockopt(zmq.RCVHWM, 0)
+    thread = threading.Thread(target=consumer.run, daemon=True)
+    thread.start()
+
+    publisher = zmq.Context.instance().socket(zmq.PUB)
+    publisher.setsockopt(zmq.SNDHWM, 0)
+    publisher.connect(ADDRESS)
+    time.sleep(0.5)  # let the subscription propagate
+
+    start = time.perf_counter()
+    for message in messages:
+        publisher.send_multipart(message)
+    deadline = time.time() + 120
+    while consumer.stored < len(messages) and time.time() < deadline:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+
+    consumer.stop()
+    thread.join()
+    publisher.close()
+    return consumer.stored, consumer.stored / elapsed
+
+
+def main():
+    app = create_app()
+    try:
+        with app.app_context():
+            db.create_all()
+
+        legacy_rate = measure_legacy(make_messages(LEGACY_MESSAGES))
+        print(f"{'consumer':>22} | {'messages':>8} | {'msg/s':>10}")
+        print("-" * 48)
+        print(f"{'per-message (before)':>22} | {LEGACY_MESSAGES:>8} | "
+              f"{legacy_rate:>10,.0f}")
+
+        messages = make_messages(MESSAGES)
+        for batch_size in (1, 100, 500, 2000):
+            stored, rate = measure_batched(app, messages, batch_size)
+            print(f"{f'batched ({batch_size})':>22} | {stored:>8} | {rate:>10,.0f}")
+    finally:
+        os.close(DB_FD)
+        os.unlink(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark of the ZMQLogger wire formats: bytes per event on the wire and
+events per second from log() calls to decoded records, for JSON messages
+(one per event) and batch frames (app/utils/log_wire.py).
+
+Run from the repository root:
+    python -m benchmarks.bench_log_wire
+"""
+import threading
+import time
+import orjson
+import zmq
+from app.utils.log_wire import batch_topic, decode_batch, encode_batch, \
+    is_batch_topic
+from app.utils.zmq_logger import ZMQLogger
+
+EVENTS = 100_000
+
+
+def make_records(count):
+    return [(time.time(), "info" if i % 20 else "error",
+             f"Fibonacci({i}) calculated in 0.0001s", {"n": i}, "Fibonacci")
+            for i in range(count)]
+
+
+def measure_encoding(records, wire):
+    """
+    Return the bytes per event and the events encoded per second.
+    """
+    logger = ZMQLogger(wire=wire)
+    start = time.perf_counter()
+    if wire == "json":
+        size = sum(len(topic) + len(payload)
+                   for topic, payload in map(logger._encode, records))
+    else:
+        size = sum(len(batch_topic("info")) + len(encode_batch(records[i:i + 500],
+                                                               logger.hostname)[0])
+                   for i in range(0, len(records), 500))
+    return size / len(records), len(records) / (time.perf_counter() - start)
+
+
+def measure_end_to_end(records, wire):
+    """
+    Log the records through a ZMQLogger and return the rate at which a
+    subscriber received and decoded them.
+    """
+    context = zmq.Context()
+    subscriber = context.socket(zmq.SUB)
+    subscriber.setsockopt(zmq.SUBSCRIBE, b"")
+    subscriber.setsockopt(zmq.RCVHWM, 0)
+    port = subscriber.bind_to_random_port("tcp://127.0.0.1")
+    logger = ZMQLogger(f"tcp://127.0.0.1:{port}", queue_size=len(records) * 2,
+                       hwm=0, wire=wire)
+    while True:
+        logger.log("info", "warmup")
+        if subscriber.poll(100):
+            break
+    while subscriber.poll(100):
+        subscriber.recv_multipart()
+
+    received = 0
+
+    def receive():
+        nonlocal received
+        while received < len(records):
+            topic, payload = subscriber.recv_multipart()
+            if is_batch_topic(topic):
+                received += len(decode_batch(payload))
+            else:
+                orjson.loads(payload)
+                received += 1
+
+    thread = threading.Thread(target=receive)
+    thread.start()
+    start = time.perf_counter()
+    for _, level, message, log_context, operation in records:
+        logger.log(level, message, context=log_context, operation=operation)
+    thread.join()
+    elapsed = time.perf_counter() - start
+    logger.close()
+    subscriber.close(linger=0)
+    context.term()
+    return len(records) / elapsed
+
+
+def main():
+    records = make_records(EVENTS)
+    print(f"{'wire':>6} | {'bytes/event':>11} | {'encoded/s':>10} | "
+          f"{'delivered/s':>11}")
+    print("-" * 48)
+    for wire in ("json", "batch"):
+        size, encode_rate = measure_encoding(records, wire)
+        rate = measure_end_to_end(records, wire)
+        print(f"{wire:>6} | {size:>11.1f} | {encode_rate:>10,.0f} | {rate:>11,.0f}")
+
+
+if __name__ == "__main__":
+    main()
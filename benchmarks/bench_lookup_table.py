@@ -0,0 +1,95 @@
+"""
+Benchmark for the precomputed lookup tables: the one-off startup cost of
+building and memory-mapping the table file, and the p50 request latency of
+/api/fibonacci and /api/factorial for small inputs with and without the tables.
+
+Run from the repository root:
+    python -m benchmarks.bench_lookup_table
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from app import create_app, db, limiter, lookup_tables  # noqa: E402
+from app.services.math_service import MathService  # noqa: E402
+from app.utils.cache import cache  # noqa: E402
+from app.utils.lookup_table import LookupTables, build_table  # noqa: E402
+
+REQUESTS = 500
+
+
+def measure_startup(path, fibonacci_count, factorial_count):
+    """
+    Return the time to build the table file and the time to memory-map it.
+    """
+    start = time.perf_counter()
+    build_table(path, fibonacci_count, factorial_count)
+    build_time = time.perf_counter() - start
+
+    tables = LookupTables()
+    start = time.perf_counter()
+    tables.load(path)
+    load_time = time.perf_counter() - start
+    tables.close()
+    return build_time, load_time
+
+
+def measure_latency(client, endpoint, inputs):
+    """
+    Return the p50 latency in milliseconds of one request per input.
+    """
+    latencies = []
+    for n in inputs:
+        start = time.perf_counter()
+        response = client.post(endpoint, json={"n": n})
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.get_json()
+    return statistics.median(latencies) * 1000
+
+
+def main():
+    app = create_app()
+    limiter.enabled = False
+    sys.set_int_max_str_digits(100_000)
+    fibonacci_count = app.config["LOOKUP_FIBONACCI_COUNT"]
+    factorial_count = app.config["LOOKUP_FACTORIAL_COUNT"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "tables.bin")
+        build_time, load_time = measure_startup(path, fibonacci_count,
+                                                factorial_count)
+        size = os.path.getsize(path)
+    print(f"Table file: {size / 1e6:.1f} MB "
+          f"(fibonacci n < {fibonacci_count}, factorial n < {factorial_count})")
+    print(f"Build once: {build_time:.3f}s | mmap at startup: {load_time * 1e6:.0f}us")
+    print()
+
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        print(f"{'endpoint':>16} | {'p50 with table':>15} | {'p50 without':>12}")
+        print("-" * 50)
+        for endpoint, count in (("/api/fibonacci", fibonacci_count),
+                                ("/api/factorial", factorial_count)):
+            inputs = random.sample(range(count), min(REQUESTS, count))
+
+            lookup_tables.init_app(app)
+            with_table = measure_latency(client, endpoint, inputs)
+
+            # Without the table every request is a cache miss computed on the worker
+            lookup_tables.close()
+            cache.clear()
+            MathService.fibonacci_checkpoints.clear()
+            MathService.factorial_checkpoints.clear()
+            without_table = measure_latency(client, endpoint, inputs)
+
+            print(f"{endpoint:>16} | {with_table:>12.3f} ms | {without_table:>9.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark of the AsyncWorker lanes under mixed load: small computations arrive
+steadily while large powers keep a one-process pool busy. Reports the latency
+percentiles (submit to result) of the small tasks with FIFO scheduling
+(aging=0, no lane limits) and with the lanes, and the completion time of the
+large ones.
+
+Run from the repository root:
+    python -m benchmarks.bench_scheduler
+"""
+import statistics
+import threading
+import time
+from app.services.math_service import MathService
+from app.utils.worker import AsyncWorker, timed
+
+SMALL = 200
+SMALL_INTERVAL = 0.01
+LARGE = 8
+LARGE_EXPONENT = 1_000_000
+
+
+def measure(worker):
+    """
+    Submit the mixed load to a worker and return the sorted latencies of the
+    small tasks and the time until the last large task finished.
+    """
+    latencies = []
+    lock = threading.Lock()
+    start = time.perf_counter()
+    # Distinct bases, so no result is reused
+    large = [worker.run(timed, MathService.power, base, LARGE_EXPONENT, True,
+                        operation="power",
+                        cost=MathService.estimate_cost("power", base, LARGE_EXPONENT,
+                                                       True))
+             for base in range(3, 3 + LARGE)]
+
+    small = []
+    for i in range(SMALL):
+        submitted = time.perf_counter()
+        future = worker.run(timed, MathService.power, 3, 2_000 + i, True,
+                            operation="power",
+                            cost=MathService.estimate_cost("power", 3, 2_000 + i, True))
+
+        def done(_, submitted=submitted):
+            with lock:
+                latencies.append(time.perf_counter() - submitted)
+        future.add_done_callback(done)
+        small.append(future)
+        time.sleep(SMALL_INTERVAL)
+
+    for future in small + large:
+        future.result()
+    return sorted(latencies), time.perf_counter() - start
+
+
+def percentile(values, q):
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def main():
+    print(f"{'scheduling':>10} | {'p50 (ms)':>9} | {'p99 (ms)':>9} | "
+          f"{'mean (ms)':>9} | {'total (s)':>9}")
+    print("-" * 58)
+    for name, options in (("fifo", {"aging": 0}),
+                          ("lanes", {"interactive_cost": 200_000,
+                                     "bulk_cost": 2_000_000, "aging": 2.0})):
+        worker = AsyncWorker(backend="process", process_workers=1, **options)
+        # Start the process pool before measuring
+        worker.run(MathService.factorial, 1).result()
+        latencies, total = measure(worker)
+        worker.shutdown()
+        print(f"{name:>10} | {percentile(latencies, 0.5) * 1000:>9.1f} | "
+              f"{percentile(latencies, 0.99) * 1000:>9.1f} | "
+              f"{statistics.mean(latencies) * 1000:>9.1f} | {total:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,15 @@
-from app import create_app
+from app import create_app, db
 from app.database import init_db
+from app.utils.retention import RetentionManager
 import sys
-from threading import Thread
-from app.consumers.zmq_log_consumer import ZMQLogConsumer
+from app.consumers.log_broker import LogIngestion
 
 
-# Start the ZMQ log consumer in a separate thread
+# Start the log broker and the consumer processes
 def start_zmq_consumer():
-    consumer = ZMQLogConsumer()
-    zmq_consumer_thread = Thread(target=consumer.run, daemon=True)
-    zmq_consumer_thread.start()
+    ingestion = LogIngestion.from_config(app.config)
+    ingestion.start()
+    return ingestion
 
 
 app = create_app()
@@ -17,5 +17,12 @@ sys.set_int_max_str_digits(100_000)
 
 if __name__ == "__main__":
     init_db(app)
-    start_zmq_consumer()
-    app.run()
+    ingestion = start_zmq_consumer()
+    if app.config["RETENTION_ENABLED"]:
+        retention = RetentionManager(db)
+        retention.init_app(app)
+        retention.start()
+    try:
+        app.run()
+    finally:
+        ingestion.stop()
@@ -1,5 +1,6 @@
 import pytest
-from app import create_app
+import shutil
+from app import create_app, results
 from app.database import db as _db
 import os
 import tempfile
@@ -11,12 +12,15 @@ def app():
     Create a Flask application for testing.
     """
     db_fd, db_path = tempfile.mkstemp()
-    app = create_app()
-    app.config.update({
+    shared_dir = tempfile.mkdtemp()
+    app = create_app({
         'TESTING': True,
         'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
         'SQLALCHEMY_TRACK_MODIFICATIONS': False,
+        'STATS_SHARED_PATH': os.path.join(shared_dir, 'stats.sqlite3'),
+        'CACHE_SHARED_PATH': os.path.join(shared_dir, 'cache.sqlite3'),
     })
+    results.path = tempfile.mkdtemp()
 
     with app.app_context():
         _db.create_all()
@@ -25,6 +29,8 @@ def app():
 
     os.close(db_fd)
     os.unlink(db_path)
+    shutil.rmtree(results.path, ignore_errors=True)
+    shutil.rmtree(shared_dir, ignore_errors=True)
 
 
 @pytest.fixture(scope='session')
@@ -0,0 +1,141 @@
+import asyncio
+import time
+import orjson
+from flask import Flask
+from app.asgi import AsyncMathApp
+
+
+def call_asgi(application, method, path, body=b""):
+    """
+    Send a single HTTP request through an ASGI application and collect the
+    response status and body.
+    """
+    return asyncio.run(request_asgi(application, method, path, body))
+
+
+async def request_asgi(application, method, path, body=b""):
+    """
+    Coroutine variant of call_asgi, for concurrent requests on one event loop.
+    """
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-type", b"application/json"),
+                    (b"host", b"localhost")],
+        "client": ("127.0.0.1", 12345),
+        "server": ("localhost", 80),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await application(scope, receive, send)
+    status = next(m["status"] for m in sent if m["type"] == "http.response.start")
+    payload = b"".join(m.get("body", b"") for m in sent
+                       if m["type"] == "http.response.body")
+    return status, payload
+
+
+def test_asgi_fibonacci(app):
+    """
+    Test that the ASGI entry point serves the Fibonacci endpoint natively.
+    """
+    application = AsyncMathApp(app)
+    status, payload = call_asgi(application, "POST", "/api/fibonacci",
+                                orjson.dumps({"n": 20}))
+    assert status == 200
+    data = orjson.loads(payload)
+    assert data["operation"] == "fibonacci"
+    assert data["result"] == "6765"
+
+
+def test_asgi_validation_error(app):
+    """
+    Test that validation errors on the async path return a 400 status code.
+    """
+    application = AsyncMathApp(app)
+    status, payload = call_asgi(application, "POST", "/api/factorial",
+                                orjson.dumps({"n": -1}))
+    assert status == 400
+    assert orjson.loads(payload)["type"] == "validation"
+
+
+def test_asgi_delegates_to_wsgi(app):
+    """
+    Test that routes without an async handler are served by the Flask app.
+    """
+    application = AsyncMathApp(app)
+    status, payload = call_asgi(application, "GET", "/ping")
+    assert status == 200
+    assert orjson.loads(payload) == {"message": "pong"}
+
+
+def test_asgi_delegated_requests_run_concurrently():
+    """
+    Test that a slow request delegated to Flask does not hold up /ping.
+    """
+    flask_app = Flask(__name__)
+
+    @flask_app.route("/slow")
+    def slow():
+        time.sleep(1.0)
+        return "done"
+
+    @flask_app.route("/ping")
+    def ping():
+        return "pong"
+
+    application = AsyncMathApp(flask_app)
+
+    async def ping_during_slow():
+        slow_request = asyncio.create_task(request_asgi(application, "GET", "/slow"))
+        await asyncio.sleep(0.1)
+        start = time.perf_counter()
+        ping_response = await request_asgi(application, "GET", "/ping")
+        ping_time = time.perf_counter() - start
+        return ping_response, ping_time, await slow_request
+
+    (status, payload), ping_time, slow_response = asyncio.run(ping_during_slow())
+    assert (status, payload) == (200, b"pong")
+    assert ping_time < 0.5
+    assert slow_response == (200, b"done")
+
+
+def test_asgi_large_result_does_not_block_loop(app):
+    """
+    Test that formatting, caching and persisting a large native result happen
+    off the event loop, so it keeps serving /ping while they run.
+    """
+    application = AsyncMathApp(app)
+
+    async def ping_during_factorial():
+        factorial = asyncio.create_task(request_asgi(
+            application, "POST", "/api/factorial", orjson.dumps({"n": 300000})))
+        # A blocked event loop delays the wakeup of the pause past its deadline
+        longest_stall = 0.0
+        pings = 0
+        while not factorial.done():
+            start = time.perf_counter()
+            await asyncio.sleep(0.02)
+            longest_stall = max(longest_stall, time.perf_counter() - start - 0.02)
+            assert await request_asgi(application, "GET", "/ping") == \
+                (200, b'{"message":"pong"}\n')
+            pings += 1
+        return await factorial, longest_stall, pings
+
+    (status, _), longest_stall, pings = asyncio.run(ping_during_factorial())
+    assert status == 200
+    assert pings > 5
+    assert longest_stall < 0.3
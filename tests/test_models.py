@@ -123,3 +123,51 @@ def test_delete_request(app):
 
         deleted_request = MathRequest.query.get(request.id)
         assert deleted_request is None, "Expected the request to be deleted"
+
+
+def test_upgrade_db_adds_missing_indexes(app):
+    """
+    Test that upgrade_db creates the model indexes missing from an existing
+    database, and that the filtered listing queries use them.
+    """
+    from sqlalchemy import text
+    from app.database import upgrade_db
+
+    with app.app_context():
+        db.session.execute(text("DROP INDEX ix_math_requests_operation_id"))
+        db.session.execute(text("DROP INDEX ix_log_entries_level_created_at"))
+        db.session.commit()
+
+        created = sorted(upgrade_db())
+        assert created == ["ix_log_entries_level_created_at",
+                           "ix_math_requests_operation_id"]
+        assert upgrade_db() == []
+
+        def plan(sql):
+            rows = db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+            return " ".join(row[-1] for row in rows)
+
+        assert "ix_math_requests_operation_id" in plan(
+            "SELECT * FROM math_requests WHERE operation = 'power' AND id > 10 "
+            "ORDER BY id LIMIT 100")
+        assert "ix_log_entries_level_created_at" in plan(
+            "SELECT * FROM log_entries WHERE level = 'ERROR' "
+            "AND created_at >= '2024-01-01' ORDER BY id DESC LIMIT 100")
+
+
+def test_upgrade_db_adds_missing_columns(app):
+    """
+    Test that upgrade_db adds the nullable columns missing from a table
+    created before they were added to the model.
+    """
+    from sqlalchemy import inspect, text
+    from app.database import upgrade_db
+
+    with app.app_context():
+        db.session.execute(text("ALTER TABLE math_requests DROP COLUMN result_hash"))
+        db.session.commit()
+
+        assert upgrade_db() == ["math_requests.result_hash"]
+        columns = {c["name"] for c in inspect(db.engine).get_columns("math_requests")}
+        assert "result_hash" in columns
+        assert upgrade_db() == []
@@ -1,3 +1,6 @@
+import time
+
+
 def test_health(client):
     """
     Test the health check endpoint to ensure it returns a 200 status code.
@@ -16,11 +19,43 @@ def test_pow_valid(client):
     data = response.get_json()
 
     assert data['operation'] == 'power'
-    assert data['input_value'] == '2.0^5'
+    assert data['input_value'] == '2^5'
     assert data['result'] == str(32.0)
     assert isinstance(data['processing_time'], float)
 
 
+def test_pow_exact(client):
+    """
+    Test the power endpoint in exact mode to ensure decimal bases give an exact
+    rational result.
+    """
+    response = client.post('/api/power', json={'base': 0.5, 'exponent': 3,
+                                               'exact': True})
+    assert response.status_code == 200
+    data = response.get_json()
+
+    assert data['input_value'] == '0.5^3'
+    assert data['result'] == '1/8'
+
+
+def test_pow_exact_large_integer_base(client):
+    """
+    Test that integer bases beyond the precision of a float stay exact and are
+    echoed as given.
+    """
+    base = 12345678901234567891
+    response = client.post('/api/power', json={'base': base, 'exponent': 2,
+                                               'exact': True})
+    assert response.status_code == 200
+    data = response.get_json()
+
+    assert data['input_value'] == f'{base}^2'
+    assert data['result'] == str(base ** 2)
+
+    response = client.post('/api/power', json={'base': 10 ** 400, 'exponent': 2})
+    assert response.status_code == 400
+
+
 def test_pow_invalid(client):
     """
     Test the power endpoint with invalid input (negative exponent) to ensure
@@ -114,3 +149,447 @@ def test_factorial_invalid_type(client):
 
     assert data['status'] == "error"
     assert data['type'] == "validation"
+
+
+def wait_for_job(client, job_id, timeout=10):
+    """
+    Poll a job until it leaves the pending and running states.
+    """
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        data = client.get(f'/api/jobs/{job_id}').get_json()
+        if data['status'] not in ('pending', 'running'):
+            return data
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} did not finish in {timeout}s")
+
+
+def test_job_lifecycle(client):
+    """
+    Test submitting a job, polling it until done and fetching its result.
+    """
+    response = client.post('/api/jobs', json={'operation': 'factorial',
+                                              'params': {'n': 10}})
+    assert response.status_code == 202
+    job = response.get_json()
+    assert response.headers['Location'] == f"/api/jobs/{job['job_id']}"
+    assert job['operation'] == 'factorial'
+    assert job['input_value'] == '10'
+
+    data = wait_for_job(client, job['job_id'])
+    assert data['status'] == 'done'
+    assert data['progress'] == 1.0
+    assert data['result'] == '3628800'
+
+    response = client.delete(f"/api/jobs/{job['job_id']}")
+    assert response.status_code == 409
+    assert response.get_json()['type'] == 'conflict'
+
+
+def test_job_invalid(client):
+    """
+    Test that invalid job submissions return 400 and unknown jobs return 404.
+    """
+    response = client.post('/api/jobs', json={'operation': 'sqrt',
+                                              'params': {'n': 4}})
+    assert response.status_code == 400
+
+    response = client.post('/api/jobs', json={'operation': 'fibonacci',
+                                              'params': {'n': -4}})
+    assert response.status_code == 400
+    assert response.get_json()['type'] == 'validation'
+
+    response = client.get('/api/jobs/does-not-exist')
+    assert response.status_code == 404
+    assert response.get_json()['type'] == 'not_found'
+
+
+def test_batch_valid(client, app):
+    """
+    Test the batch endpoint with mixed and duplicated operations to ensure the
+    results come back in order and are persisted.
+    """
+    from app import persistence
+    from app.models.request import MathRequest
+
+    persistence.flush()
+    with app.app_context():
+        before = MathRequest.query.count()
+
+    response = client.post('/api/batch', json={'operations': [
+        {'operation': 'fibonacci', 'params': {'n': 12}},
+        {'operation': 'power', 'params': {'base': 3, 'exponent': 4}},
+        {'operation': 'fibonacci', 'params': {'n': 12}},
+        {'operation': 'power', 'params': {'base': 0, 'exponent': -1}},
+        {'operation': 'factorial', 'params': {'n': 6}},
+    ]})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+
+    operations = [r['operation'] for r in results]
+    assert operations == ['fibonacci', 'power', 'fibonacci', 'power', 'factorial']
+    assert results[0]['result'] == '144'
+    assert results[1]['result'] == '81.0'
+    assert results[2]['result'] == '144'
+    assert results[3]['status'] == 'error'
+    assert results[3]['type'] == 'calculation'
+    assert results[4]['result'] == '720'
+
+    persistence.flush()
+    with app.app_context():
+        assert MathRequest.query.count() == before + 4
+
+
+def test_large_result_stored_out_of_line(client, app):
+    """
+    Test that a result too large for the result column is persisted in the
+    result store and served by /api/results.
+    """
+    import math
+    from app import persistence
+
+    response = client.post('/api/factorial', json={'n': 1500})
+    assert response.status_code == 200
+    persistence.flush()
+
+    rows = client.get('/api/requests?operation=factorial&order=desc&limit=1')
+    row = rows.get_json()[0]
+    assert row['input_value'] == '1500'
+    assert row['result'] is None
+    assert row['result_digits'] == len(str(math.factorial(1500)))
+    assert row['result_ref'].endswith(f"{row['result_hash']}.bin")
+
+    response = client.get(f"/api/results/{row['result_hash']}")
+    assert response.status_code == 200
+    assert response.get_json()['result'] == str(math.factorial(1500))
+    assert client.get(f"/api/results/{'0' * 64}").status_code == 404
+
+    # An exact fraction beyond the digit limit of str() is persisted as well
+    from fractions import Fraction
+    from app.utils.formatting import to_text
+    response = client.post('/api/power', json={'base': 3.3, 'exponent': 20000,
+                                               'exact': True})
+    assert response.status_code == 200
+    persistence.flush()
+    row = client.get('/api/requests?operation=power&order=desc&limit=1') \
+        .get_json()[0]
+    assert row['input_value'] == '3.3^20000' and row['result'] is None
+    response = client.get(f"/api/results/{row['result_hash']}")
+    assert response.get_json()['result'] == to_text(Fraction(33, 10) ** 20000)
+
+    # An integer base longer than the input_value column is stored shortened
+    base = 7 ** 400
+    response = client.post('/api/power', json={'base': base, 'exponent': 1,
+                                               'exact': True})
+    assert response.status_code == 200
+    assert response.get_json()['input_value'] == f"{base}^1"
+    persistence.flush()
+    row = client.get('/api/requests?operation=power&order=desc&limit=1') \
+        .get_json()[0]
+    assert len(row['input_value']) == 255
+    assert row['input_value'] == f"{base}"[:252] + "..."
+
+
+def test_result_formats(client):
+    """
+    Test that results can be returned in hex or base64 instead of decimal.
+    """
+    import base64
+    import math
+
+    response = client.post('/api/factorial?format=hex', json={'n': 30})
+    assert response.status_code == 200
+    assert response.get_json()['format'] == 'hex'
+    assert int(response.get_json()['result'], 16) == math.factorial(30)
+
+    response = client.post('/api/batch?format=base64', json={'operations': [
+        {'operation': 'fibonacci', 'params': {'n': 90}},
+        {'operation': 'power', 'params': {'base': 2.5, 'exponent': 2}},
+    ]})
+    fibonacci, power = response.get_json()['results']
+    data = base64.b64decode(fibonacci['result'])
+    assert int.from_bytes(data, 'big', signed=True) == 2880067194370816120
+    assert power['format'] == 'decimal' and power['result'] == '6.25'
+
+    response = client.post('/api/factorial', json={'n': 30})
+    assert response.get_json()['format'] == 'decimal'
+    response = client.post('/api/factorial?format=octal', json={'n': 30})
+    assert response.status_code == 400
+
+
+def test_batch_invalid(client):
+    """
+    Test that the batch endpoint rejects the whole batch when an item is invalid.
+    """
+    response = client.post('/api/batch', json={'operations': [
+        {'operation': 'fibonacci', 'params': {'n': 12}},
+        {'operation': 'factorial', 'params': {'n': 'a'}},
+    ]})
+    assert response.status_code == 400
+    data = response.get_json()
+    assert data['type'] == 'validation'
+    assert "'index': 1" in data['details']
+
+    response = client.post('/api/batch', json={'operations': []})
+    assert response.status_code == 400
+
+
+def test_cache_stats(client):
+    """
+    Test that the cache statistics endpoint reports hit and miss counters.
+    """
+    # Above the lookup table range, so the second call is a cache hit
+    client.post('/api/fibonacci', json={'n': 20_000})
+    client.post('/api/fibonacci', json={'n': 20_000})
+
+    response = client.get('/api/cache/stats')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['backend'] == 'shared'
+    assert data['hits'] >= 1
+    assert data['entries'] >= 1
+    assert data['single_flight']['leaders'] >= 1
+    assert data['single_flight']['in_flight'] == 0
+
+
+def test_requests_pagination(client, app, db):
+    """
+    Test keyset pagination, time-range filters, ordering and NDJSON streaming of
+    the /api/requests endpoint.
+    """
+    import json
+    from datetime import datetime, timedelta
+    from app.models.request import MathRequest
+
+    start = datetime(2024, 1, 1)
+    with app.app_context():
+        db.session.execute(db.insert(MathRequest), [
+            {"operation": "paging", "input_value": str(i), "result": str(i),
+             "processing_time": 0.0, "timestamp": start + timedelta(minutes=i)}
+            for i in range(5)])
+        db.session.commit()
+
+    seen = []
+    url = '/api/requests?operation=paging&limit=2'
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        seen += [row['input_value'] for row in response.get_json()]
+        cursor = response.headers.get('X-Next-Cursor')
+        url = f'/api/requests?operation=paging&limit=2&cursor={cursor}' \
+            if cursor else None
+        if cursor:
+            assert f'cursor={cursor}' in response.headers['Link']
+    assert seen == ['0', '1', '2', '3', '4']
+
+    response = client.get('/api/requests?operation=paging&order=desc&limit=2')
+    assert [row['input_value'] for row in response.get_json()] == ['4', '3']
+
+    response = client.get('/api/requests?operation=paging'
+                          '&since=2024-01-01T00:01:00&until=2024-01-01T00:03:00Z')
+    assert [row['input_value'] for row in response.get_json()] == ['1', '2']
+
+    response = client.get('/api/requests?operation=paging&format=ndjson')
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data().splitlines()
+    assert [json.loads(line)['input_value'] for line in lines] == \
+        ['0', '1', '2', '3', '4']
+
+    response = client.get('/api/requests?limit=0')
+    assert response.status_code == 400
+    assert response.get_json()['type'] == 'validation'
+
+
+def test_logs_filters_and_streaming(client, app, db):
+    """
+    Test the level, operation and time-range filters, keyset pagination and
+    NDJSON streaming of the /api/logs endpoint.
+    """
+    import json
+    from datetime import datetime, timedelta
+    from app.models.log import LogEntry
+
+    start = datetime(2024, 2, 1)
+    with app.app_context():
+        db.session.execute(db.insert(LogEntry), [
+            {"level": "ERROR" if i % 2 else "INFO", "message": str(i),
+             "details": {"i": i}, "operation": "log-paging",
+             "created_at": start + timedelta(minutes=i)}
+            for i in range(6)])
+        db.session.commit()
+
+    response = client.get('/api/logs?operation=log-paging&level=error')
+    assert [log['message'] for log in response.get_json()] == ['1', '3', '5']
+    assert response.get_json()[0]['details'] == {'i': 1}
+
+    response = client.get('/api/logs?operation=log-paging&level=error&order=desc'
+                          '&since=2024-02-01T00:02:00')
+    assert [log['message'] for log in response.get_json()] == ['5', '3']
+
+    response = client.get('/api/logs?operation=log-paging&limit=4')
+    assert len(response.get_json()) == 4
+    cursor = response.headers['X-Next-Cursor']
+    response = client.get(f'/api/logs?operation=log-paging&limit=4&cursor={cursor}')
+    assert [log['message'] for log in response.get_json()] == ['4', '5']
+    assert 'X-Next-Cursor' not in response.headers
+
+    response = client.get('/api/logs?operation=log-paging&until=2024-02-01T00:03:00',
+                          headers={'Accept': 'application/x-ndjson'})
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line)['message'] for line in
+            response.get_data().splitlines()] == ['0', '1', '2']
+
+    response = client.get('/api/logs?since=yesterday')
+    assert response.status_code == 400
+
+
+def test_logs_operation_filter_matches_labels(client, app, db):
+    """
+    Test that the operation filter of /api/logs matches the labels the
+    controller logs (e.g. "Factorial") whatever the case of the query.
+    """
+    import orjson
+    from app.consumers.zmq_log_consumer import ZMQLogConsumer
+    from app.controllers.math_controller import MathController
+
+    consumer = ZMQLogConsumer(app=app)
+    payload = {"level": "info", "message": "Factorial of 5 calculated",
+               "operation": MathController.LABELS["factorial"]}
+    try:
+        with app.app_context():
+            consumer.handle_messages([(b"INFO", orjson.dumps(payload))])
+    finally:
+        consumer.subscriber.close()
+
+    for operation in ("factorial", "Factorial", "FACTORIAL"):
+        response = client.get(f'/api/logs?operation={operation}&order=desc')
+        logs = response.get_json()
+        assert logs and logs[0]['message'] == "Factorial of 5 calculated"
+        assert logs[0]['operation'] == "factorial"
+
+
+def test_hourly_stats(client, app, db):
+    """
+    Test that /api/stats/hourly lists the hourly aggregates with their filters.
+    """
+    from datetime import datetime
+    from app.models.rollup import HourlyRollup
+
+    with app.app_context():
+        db.session.add_all([
+            HourlyRollup(hour=datetime(2020, 1, 1, h), operation="power",
+                         requests=4, errors=1, logs=5, total_time=2.0,
+                         p50=0.5, p95=0.9, p99=0.9, max_time=0.9)
+            for h in range(3)])
+        db.session.commit()
+
+    response = client.get('/api/stats/hourly?operation=Power'
+                          '&since=2020-01-01T01:00:00&until=2020-01-02')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [row['hour'] for row in data] == ['2020-01-01T01:00:00',
+                                             '2020-01-01T02:00:00']
+    assert data[0]['avg_time'] == 0.5
+    assert data[0]['errors'] == 1
+
+
+def test_stats(client):
+    """
+    Test that /api/stats counts successful and failed requests per operation.
+    """
+    def power_stats():
+        response = client.get('/api/stats')
+        assert response.status_code == 200
+        return response.get_json()['operations'].get('power', {})
+
+    before = power_stats()
+    client.post('/api/power', json={'base': 3, 'exponent': 4})
+    client.post('/api/power', json={'base': 'x', 'exponent': 4})
+    after = power_stats()
+    assert after['count'] == before.get('count', 0) + 1
+    assert after['errors'] == before.get('errors', 0) + 1
+    assert after['p99'] is not None
+
+
+def test_admission_rejects_over_budget(client):
+    """
+    Test that a computation that does not fit in the compute budget is rejected
+    with 503 and a Retry-After header, while cheap ones are still served.
+    """
+    from app import admission
+
+    max_wait = admission.max_wait
+    admission.max_wait = 0
+    ticket = admission.acquire(admission.budget - 0.1)
+    try:
+        response = client.post('/api/factorial', json={'n': 299_998})
+        assert response.status_code == 503
+        assert response.get_json()['type'] == 'unavailable'
+        assert 1 <= int(response.headers['Retry-After']) <= admission.budget
+        assert client.post('/api/power', json={'base': 2, 'exponent': 8}) \
+            .status_code == 200
+    finally:
+        admission.release(ticket)
+        admission.max_wait = max_wait
+
+    response = client.get('/api/admission/stats')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['rejected'] >= 1 and data['in_flight'] == 0
+    assert set(data['model']) == {'fibonacci', 'factorial', 'power'}
+
+
+def test_cost_weighted_rate_limit(client, app):
+    """
+    Test that the per-client compute limit charges requests by their estimated
+    cost and answers 429 with a Retry-After header once it is exhausted.
+    """
+    limit = app.config['RATELIMIT_COST_LIMIT']
+    app.config['RATELIMIT_COST_LIMIT'] = '2/hour'
+    try:
+        assert client.post('/api/power', json={'base': 2, 'exponent': 9}) \
+            .status_code == 200
+        response = client.post('/api/factorial', json={'n': 299_999})
+        assert response.status_code == 429
+        assert response.get_json()['type'] == 'rate_limited'
+        assert 1 <= int(response.headers['Retry-After']) <= 3600
+    finally:
+        app.config['RATELIMIT_COST_LIMIT'] = limit
+
+
+def test_worker_stats(client):
+    """
+    Test that /api/worker/stats reports the lanes of the worker and the queue
+    wait and run time histograms of the operations it ran.
+    """
+    response = client.post('/api/jobs', json={'operation': 'factorial',
+                                              'params': {'n': 3000}})
+    assert response.status_code == 202
+    assert wait_for_job(client, response.get_json()['job_id'])['status'] == 'done'
+
+    response = client.get('/api/worker/stats')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert set(data['lanes']) == {'interactive', 'standard', 'bulk'}
+    factorial = data['operations']['factorial']
+    assert factorial['queue_wait']['count'] >= 1
+    assert factorial['run_time']['p99'] is not None
+
+
+def test_oversized_request_does_not_exhaust_compute_limit(client, app):
+    """
+    Test that a computation too large for the compute budget is rejected by
+    admission (503, pointing to the job API) without using up the client's
+    compute limit, so cheap requests keep being served.
+    """
+    limit = app.config['RATELIMIT_COST_LIMIT']
+    app.config['RATELIMIT_COST_LIMIT'] = '40/hour'
+    try:
+        for _ in range(3):
+            response = client.post('/api/fibonacci', json={'n': 1_000_000_000})
+            assert response.status_code == 503
+            assert '/api/jobs' in response.get_json()['details']
+        assert client.post('/api/fibonacci', json={'n': 10}).status_code == 200
+        assert client.post('/api/factorial', json={'n': 5}).status_code == 200
+    finally:
+        app.config['RATELIMIT_COST_LIMIT'] = limit
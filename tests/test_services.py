@@ -1,5 +1,10 @@
+import math
+import sys
+from decimal import Decimal
+from fractions import Fraction
 import pytest
 from app.services.math_service import MathService
+from app.services.checkpoints import CheckpointStore
 
 
 @pytest.mark.parametrize(
@@ -23,6 +28,28 @@ def test_calculate_fibonacci(n, expected):
     assert result == expected, f"Expected {expected} but got {result} for n={n}"
 
 
+def test_fibonacci_matches_iterative():
+    """
+    Test that the fast-doubling Fibonacci engine returns exactly the same values
+    as the straightforward iterative loop, including large inputs.
+    """
+    a, b = 0, 1
+    for n in range(0, 2001):
+        assert MathService.calculate_fibonacci(n) == a, f"Mismatch for n={n}"
+        a, b = b, a + b
+
+
+def test_fibonacci_pair():
+    """
+    Test that fibonacci_pair returns consecutive Fibonacci numbers and rejects
+    negative input.
+    """
+    assert MathService.fibonacci_pair(0) == (0, 1)
+    assert MathService.fibonacci_pair(10) == (55, 89)
+    with pytest.raises(ValueError):
+        MathService.fibonacci_pair(-1)
+
+
 @pytest.mark.parametrize(
     "n, expected",
     [
@@ -69,3 +96,126 @@ def test_power(base, exponent, expected):
     result = MathService.power(base, exponent)
     assert result == expected, (f"Expected {expected} but got {result} "
                                 f"for base={base}, exponent={exponent}")
+
+
+def test_power_large_exponent():
+    """
+    Test that large exponents are handled without recursion errors and match
+    the built-in power operator.
+    """
+    assert MathService.power(2, 5000) == 2 ** 5000
+    assert MathService.power(1.0001, 100_000) == pytest.approx(1.0001 ** 100_000)
+
+
+def test_power_zero_negative_exponent():
+    """
+    Test that raising zero to a negative exponent raises a ValueError.
+    """
+    with pytest.raises(ValueError):
+        MathService.power(0.0, -2)
+    with pytest.raises(ValueError):
+        MathService.power(0, -2, exact=True)
+
+
+def test_power_negative_exponent_out_of_range():
+    """
+    Test that a negative exponent whose positive power underflows gives an
+    infinite result, not the error for a zero base.
+    """
+    assert MathService.power(0.5, -1100) == float("inf")
+    assert MathService.power(-0.5, -1101) == float("-inf")
+    assert MathService.power(2.0, -1100) == 2.0 ** -1100
+    with pytest.raises(ValueError):
+        MathService.power(-0.0, -1)
+
+
+@pytest.mark.parametrize(
+    "base, exponent, expected",
+    [
+        (2, 100, 2 ** 100),
+        (2.0, 10, 1024),
+        (-3, 3, -27),
+        (2, -3, Fraction(1, 8)),
+        (0.1, 3, Fraction(1, 1000)),
+        ("1/3", 2, Fraction(1, 9)),
+        (Decimal("1.5"), 2, Fraction(9, 4)),
+        (Fraction(2, 3), -2, Fraction(9, 4)),
+    ]
+)
+def test_exact_power(base, exponent, expected):
+    """
+    Test the exact power mode: integer results are returned as int and
+    non-integral results as an exact Fraction.
+    :param base: The base number.
+    :param exponent: The exponent to raise the base to.
+    :param expected: The exact expected result.
+    """
+    result = MathService.power(base, exponent, exact=True)
+    assert result == expected
+    assert type(result) is type(expected)
+
+
+def test_estimate_cost():
+    """
+    Test that the cost estimate grows with the input size and rejects unknown
+    operations.
+    """
+    assert MathService.estimate_cost("fibonacci", 10) < \
+        MathService.estimate_cost("fibonacci", 10_000)
+    assert MathService.estimate_cost("factorial", 0) == 1
+    assert MathService.estimate_cost("power", 2.0, 10 ** 6) < 32
+    assert MathService.estimate_cost("power", 3, 1000, True) == 3000
+    with pytest.raises(ValueError):
+        MathService.estimate_cost("sqrt", 4)
+
+
+def test_fibonacci_resumes_from_checkpoints():
+    """
+    Test that Fibonacci numbers resumed from checkpoints (by stepping forward
+    or by doubling from a bit prefix) match cold computations.
+    """
+    store = MathService.fibonacci_checkpoints
+    store.clear()
+    expected = {}
+    for n in (10_000, 10_040, 20_001, 40_003, 9_000):
+        store.clear()
+        expected[n] = MathService.calculate_fibonacci(n)
+
+    store.clear()
+    for n in (10_000, 10_040, 20_001, 40_003, 9_000):
+        assert MathService.calculate_fibonacci(n) == expected[n]
+    assert len(store) == 5
+    store.clear()
+
+
+def test_factorial_resumes_from_checkpoints():
+    """
+    Test that factorials resumed from a checkpoint with a range product match
+    math.factorial.
+    """
+    store = MathService.factorial_checkpoints
+    store.clear()
+    for n in (3_000, 4_500, 4_501, 2_000, 12_000):
+        assert MathService.factorial(n) == math.factorial(n)
+    assert store.floor(4_600) == (4_501, math.factorial(4_501))
+    store.clear()
+
+
+def test_checkpoint_store_memory_cap():
+    """
+    Test that the checkpoint store evicts least recently used entries to stay
+    within its memory cap and ignores small inputs.
+    """
+    store = CheckpointStore(max_bytes=3 * sys.getsizeof(2 ** 8000), min_n=10)
+    store.put(5, 1)
+    assert len(store) == 0
+
+    for n in (100, 200, 300):
+        store.put(n, 2 ** 8000 + n)
+    store.get(100)
+    store.put(400, 2 ** 8000 + 400)
+
+    assert store.get(200) is None
+    assert store.floor(350) == (300, 2 ** 8000 + 300)
+    assert store.floor(99) == (None, None)
+    assert store.bytes <= store.max_bytes
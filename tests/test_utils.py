@@ -1,8 +1,21 @@
+import asyncio
+import math
+import multiprocessing
+import os
+import threading
 import time
-from app.utils.cache import cache
+import pytest
+from app.utils.cache import cache, hint_cost
 from app import worker
 from flask import Flask
+from flask_caching import Cache
 from app.utils.worker import AsyncWorker
+from app.services.math_service import MathService
+from app.utils.jobs import JobManager
+from app.utils.errors import QueueFullAppError
+from app.utils.shared_cache import SharedMemoryCache
+from app.utils.lookup_table import LookupTables, build_table
+from app.utils.write_behind import WriteBehindQueue
 
 
 def test_memoize_cache():
@@ -82,3 +95,1262 @@ def test_async_worker_parallel_vs_serial():
     assert time_parallel < time_serial, \
         "Parallel execution should be faster than serial execution"
     print(f"Serial: {time_serial:.2f}s | Parallel: {time_parallel:.2f}s")
+
+
+def current_pid(_):
+    """
+    Return the id of the process the task runs in.
+    """
+    return os.getpid()
+
+
+def test_async_worker_hybrid_routing():
+    """
+    Test that the hybrid backend runs cheap tasks inline, medium tasks on the
+    thread pool and expensive tasks on the process pool.
+    """
+    hybrid = AsyncWorker(max_workers=2, backend="hybrid", process_workers=1,
+                         inline_cost=10, process_cost=1000)
+    try:
+        inline = hybrid.run(threading.get_ident, cost=1)
+        assert inline.done()
+        assert inline.result() == threading.get_ident()
+
+        threaded = hybrid.run(current_pid, None, cost=100)
+        assert threaded.result(timeout=5) == os.getpid()
+        assert hybrid._process_executor is None
+
+        spawned = hybrid.run(current_pid, None, cost=10_000)
+        assert spawned.result(timeout=30) != os.getpid()
+    finally:
+        hybrid.shutdown()
+
+
+def test_async_worker_process_errors():
+    """
+    Test that exceptions raised in the process pool and inline are propagated
+    through the returned futures.
+    """
+    hybrid = AsyncWorker(backend="hybrid", inline_cost=10, process_cost=100)
+    try:
+        with pytest.raises(ValueError):
+            hybrid.run(MathService.factorial, -1, cost=1).result()
+        with pytest.raises(ValueError):
+            hybrid.run(MathService.factorial, -1, cost=1000).result(timeout=30)
+    finally:
+        hybrid.shutdown()
+
+    with pytest.raises(ValueError):
+        AsyncWorker(backend="gpu")
+
+
+def test_job_manager_queue_and_cancel():
+    """
+    Test that the JobManager bounds the number of unfinished jobs and can cancel
+    jobs that have not started.
+    """
+    release = threading.Event()
+    single = AsyncWorker(max_workers=1)
+    manager = JobManager(single, max_pending=2)
+    try:
+        running = manager.submit("factorial", "5", release.wait, 5)
+        queued = manager.submit("factorial", "6", MathService.factorial, 6)
+        with pytest.raises(QueueFullAppError):
+            manager.submit("factorial", "7", MathService.factorial, 7)
+
+        assert manager.cancel(queued.id)
+        assert queued.status == "cancelled"
+        assert not manager.cancel("unknown")
+
+        release.set()
+        running.future.result(timeout=5)
+        deadline = time.time() + 5
+        while running.finished_at is None and time.time() < deadline:
+            time.sleep(0.01)
+        assert running.status == "done"
+        assert running.result == "True"
+    finally:
+        release.set()
+        single.shutdown()
+
+
+def test_job_progress_excludes_queue_time():
+    """
+    Test that the progress of a running job is measured from when it started
+    running, not from when it was submitted.
+    """
+    release_first = threading.Event()
+    release_second = threading.Event()
+    single = AsyncWorker(max_workers=1)
+    manager = JobManager(single)
+    try:
+        first = manager.submit("factorial", "5", release_first.wait, 5)
+        second = manager.submit("factorial", "6", release_second.wait, 5,
+                                cost=1.0)
+        time.sleep(0.5)
+        assert second.status == "pending" and second.started_at is None
+        assert second.to_dict(seconds_per_cost=1.0)["progress"] == 0.0
+
+        release_first.set()
+        first.future.result(timeout=5)
+        deadline = time.time() + 5
+        while second.status != "running" and time.time() < deadline:
+            time.sleep(0.01)
+        assert second.started_at >= second.created_at + 0.5
+        assert second.to_dict(seconds_per_cost=1.0)["progress"] < 0.4
+    finally:
+        release_first.set()
+        release_second.set()
+        single.shutdown()
+
+
+def store_in_shared_cache(path, key, value):
+    """
+    Store a value in a SharedMemoryCache from another process.
+    """
+    SharedMemoryCache(path=path).set(key, value)
+
+
+def test_shared_cache_basic(tmp_path):
+    """
+    Test that the shared cache stores, expires and deletes entries and counts
+    hits and misses.
+    """
+    shared = SharedMemoryCache(path=str(tmp_path / "cache.sqlite3"))
+    assert shared.get("missing") is None
+    assert shared.set("big", 10 ** 500)
+    assert shared.get("big") == 10 ** 500
+    assert not shared.add("big", 1)
+    assert shared.has("big")
+
+    assert shared.set("short", 1, timeout=1)
+    time.sleep(1.1)
+    assert shared.get("short") is None
+
+    assert shared.delete("big")
+    assert not shared.has("big")
+
+    stats = shared.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["entries"] == 0
+    assert stats["bytes"] == 0
+
+
+def test_shared_cache_reads_do_not_take_the_write_lock(tmp_path):
+    """
+    Test that reads proceed while another process holds the write lock, and
+    that their priority refreshes and counts are written in batches.
+    """
+    import sqlite3
+
+    path = str(tmp_path / "cache.sqlite3")
+    shared = SharedMemoryCache(path=path, touch_batch=2, touch_interval=60)
+    assert shared.set("a", 1) and shared.set("b", 2)
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("UPDATE stats SET value = 1 WHERE name = 'inflation'")
+
+    def priority(key):
+        return writer.execute("SELECT priority FROM entries WHERE key = ?",
+                              (key,)).fetchone()[0]
+
+    writer.execute("BEGIN IMMEDIATE")
+    start = time.monotonic()
+    assert shared.get("a") == 1 and shared.has("b")
+    assert shared.get("missing") is None
+    assert time.monotonic() - start < 1
+    writer.execute("COMMIT")
+    assert priority("a") < 1
+
+    # The second distinct hit writes both refreshes and the counts
+    assert shared.get("b") == 2
+    assert priority("a") > 1 and priority("b") > 1
+    stats = shared.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    writer.close()
+
+
+def test_shared_cache_cost_aware_eviction(tmp_path):
+    """
+    Test that the shared cache evicts the entries that are cheapest to recompute
+    per byte first.
+    """
+    shared = SharedMemoryCache(path=str(tmp_path / "cache.sqlite3"), max_bytes=3000)
+    for key, cost in (("slow", 5.0), ("fast", 0.001), ("medium", 1.0)):
+        hint_cost(cost)
+        shared.set(key, b"x" * 900)
+
+    hint_cost(2.0)
+    assert shared.set("new", b"x" * 900)
+    assert not shared.has("fast")
+    assert shared.has("slow") and shared.has("medium") and shared.has("new")
+
+    assert shared.get("medium") == b"x" * 900
+    hint_cost(1.5)
+    assert shared.set("other", b"x" * 900)
+    assert not shared.has("medium")
+    assert shared.has("slow") and shared.has("new") and shared.has("other")
+
+    stats = shared.stats()
+    assert stats["evictions"] == 2
+    assert stats["bytes"] <= 3000
+
+
+def test_shared_cache_admission(tmp_path):
+    """
+    Test that a large, cheap result is not admitted when it would push out
+    results that are more expensive to recompute per byte.
+    """
+    shared = SharedMemoryCache(path=str(tmp_path / "cache.sqlite3"), max_bytes=3000)
+    for key in ("a", "b", "c"):
+        hint_cost(1.0)
+        shared.set(key, b"x" * 900)
+
+    hint_cost(0.01)
+    assert not shared.set("huge", b"x" * 2500)
+    assert not shared.has("huge")
+    assert shared.has("a") and shared.has("b") and shared.has("c")
+    assert shared.stats()["rejections"] == 1
+
+    assert not shared.set("too_big", b"x" * 4000)
+    assert shared.stats()["rejections"] == 2
+
+
+def test_shared_cache_across_processes(tmp_path):
+    """
+    Test that a value stored by another process is visible to this one, and
+    that memoize works on top of the shared backend.
+    """
+    path = str(tmp_path / "cache.sqlite3")
+    process = multiprocessing.get_context("spawn").Process(
+        target=store_in_shared_cache, args=(path, "answer", 42))
+    process.start()
+    process.join(timeout=30)
+    assert SharedMemoryCache(path=path).get("answer") == 42
+
+    app = Flask(__name__)
+    app.config.update(CACHE_TYPE="app.utils.shared_cache.SharedMemoryCache",
+                      CACHE_SHARED_PATH=path)
+    shared = Cache(app)
+    calls = []
+
+    with app.app_context():
+        @shared.memoize()
+        def double(x):
+            calls.append(x)
+            return x * 2
+
+        assert double(21) == 42
+        assert double(21) == 42
+        assert calls == [21]
+
+
+def test_lookup_tables(tmp_path):
+    """
+    Test building, memory-mapping and querying the precomputed lookup tables.
+    """
+    path = str(tmp_path / "tables.bin")
+    build_table(path, 500, 100)
+
+    tables = LookupTables()
+    tables.load(path)
+    try:
+        assert tables.counts == {"fibonacci": 500, "factorial": 100}
+        for n in (0, 1, 2, 10, 499):
+            assert tables.get("fibonacci", n) == MathService.calculate_fibonacci(n)
+        for n in (0, 1, 5, 99):
+            assert tables.get("factorial", n) == MathService.factorial(n)
+        assert tables.get("fibonacci", 500) is None
+        assert tables.get("factorial", -1) is None
+        assert tables.get("power", 2.0, 3, False) is None
+    finally:
+        tables.close()
+
+    app = Flask(__name__)
+    app.config.update(LOOKUP_TABLE_PATH=path, LOOKUP_FIBONACCI_COUNT=50,
+                      LOOKUP_FACTORIAL_COUNT=100)
+    tables.init_app(app)
+    try:
+        assert tables.counts["fibonacci"] == 50
+        assert tables.get("fibonacci", 49) == MathService.calculate_fibonacci(49)
+    finally:
+        tables.close()
+
+
+def test_write_behind_queue(app, db):
+    """
+    Test that the write-behind queue batches rows, flushes them on the size and
+    time thresholds and on close, and reports its metrics.
+    """
+    from app.models.request import MathRequest
+
+    queue = WriteBehindQueue(db, batch_size=3, flush_interval=0.2)
+    queue.init_app(app)
+
+    def count():
+        with app.app_context():
+            return MathRequest.query.filter_by(operation="write-behind").count()
+
+    def row(i):
+        return {"operation": "write-behind", "input_value": str(i),
+                "result": str(i), "processing_time": 0.0}
+
+    try:
+        queue.add(MathRequest, row(1))
+        assert queue.stats()["queue_depth"] == 1
+        assert count() == 0
+
+        deadline = time.time() + 5
+        while count() < 1 and time.time() < deadline:
+            time.sleep(0.02)
+        assert count() == 1
+
+        queue.flush_interval = 60
+        time.sleep(0.3)
+        queue.add_many(MathRequest, [row(i) for i in range(2, 5)])
+        deadline = time.time() + 5
+        while count() < 4 and time.time() < deadline:
+            time.sleep(0.02)
+        assert count() == 4
+
+        queue.add(MathRequest, row(5))
+    finally:
+        queue.close()
+
+    assert count() == 5
+    stats = queue.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["rows_written"] == 5
+    assert stats["flushes"] >= 3
+    assert stats["failures"] == 0
+
+
+def test_write_behind_drops_bad_rows(app, db):
+    """
+    Test that one row that cannot be prepared or that the database rejects is
+    dropped and counted, while the rest of its batch is written.
+    """
+    from app.models.request import MathRequest
+
+    queue = WriteBehindQueue(db, batch_size=100, flush_interval=60)
+    queue.init_app(app)
+
+    def prepare(row):
+        if row["input_value"] == "unprepared":
+            raise ValueError("cannot prepare")
+        return row
+
+    def row(value):
+        return {"operation": "write-behind-drop", "input_value": value,
+                "result": "1", "processing_time": 0.0}
+
+    try:
+        queue.add_many(MathRequest, [row("1"), row("unprepared"), row("2")],
+                       prepare=prepare)
+        queue.flush()
+        # input_value is not nullable, so the bulk insert of this batch fails
+        queue.add_many(MathRequest, [row("3"), row(None), row("4")])
+        queue.flush()
+    finally:
+        queue.close()
+
+    with app.app_context():
+        values = [value for value, in db.session.execute(
+            db.select(MathRequest.input_value)
+            .filter_by(operation="write-behind-drop")
+            .order_by(MathRequest.id))]
+    assert values == ["1", "2", "3", "4"]
+    stats = queue.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["rows_written"] == 4
+    assert stats["rows_dropped"] == 2
+    assert stats["failures"] == 0
+
+
+def test_zmq_log_consumer_batches(app, db):
+    """
+    Test that the log consumer drains queued messages without blocking and
+    stores each batch with one insert, skipping invalid payloads.
+    """
+    import orjson
+    import zmq
+    from app.consumers.zmq_log_consumer import ZMQLogConsumer
+    from app.models.log import LogEntry
+
+    address = "inproc://test-log-consumer"
+    consumer = ZMQLogConsumer(address=address, app=app, batch_size=3)
+    consumer.setup()
+    publisher = consumer.context.socket(zmq.PUB)
+    publisher.connect(address)
+    try:
+        # Wait for the subscription to reach the publisher
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            publisher.send_multipart([b"INFO", b"{}"])
+            if consumer.subscriber.poll(50):
+                break
+        while consumer.drain():
+            pass
+
+        for i in range(4):
+            payload = {"level": "info", "message": f"batch {i}",
+                       "operation": "consumer-test"}
+            publisher.send_multipart([b"INFO", orjson.dumps(payload)])
+        publisher.send_multipart([b"ERROR", b"not json"])
+        assert consumer.subscriber.poll(1000)
+        time.sleep(0.1)
+
+        first = consumer.drain()
+        second = consumer.drain()
+        assert len(first) == 3 and len(second) == 2
+        assert consumer.drain() == []
+
+        with app.app_context():
+            consumer.handle_messages(first + second)
+            entries = LogEntry.query.filter_by(operation="consumer-test").all()
+        assert sorted(entry.message for entry in entries) == [
+            f"batch {i}" for i in range(4)]
+        assert all(entry.level == "INFO" for entry in entries)
+        assert consumer.stored == 4
+    finally:
+        publisher.close()
+        consumer.subscriber.close()
+
+
+def test_log_broker_distributes_without_duplicates(app, db, tmp_path):
+    """
+    Test that the broker spreads messages over its consumers, that every
+    message is stored exactly once and that stopping drains what was received.
+    """
+    import orjson
+    import zmq
+    from app.consumers.log_broker import LogBroker
+    from app.consumers.zmq_log_consumer import ZMQLogConsumer
+    from app.models.log import LogEntry
+
+    broker = LogBroker(frontend=f"ipc://{tmp_path}/front",
+                       backend=f"ipc://{tmp_path}/back")
+    broker_thread = broker.start()
+    consumers = [ZMQLogConsumer(address=broker.backend, app=app, mode="pull",
+                                batch_size=50, poll_timeout=50) for _ in range(2)]
+    threads = [threading.Thread(target=consumer.run) for consumer in consumers]
+    for thread in threads:
+        thread.start()
+
+    context = zmq.Context()
+    publisher = context.socket(zmq.PUB)
+    publisher.connect(broker.frontend)
+    try:
+        # Wait for the broker subscription and for both consumers to connect
+        deadline = time.time() + 5
+        while min(c.received for c in consumers) == 0 and time.time() < deadline:
+            publisher.send_multipart([b"INFO", orjson.dumps({"operation": "warmup"})])
+            time.sleep(0.02)
+
+        for i in range(400):
+            payload = {"level": "info", "message": str(i), "operation": "broker-test"}
+            publisher.send_multipart([b"INFO", orjson.dumps(payload)])
+        time.sleep(0.5)
+    finally:
+        broker.stop()
+        broker_thread.join(5)
+        for consumer in consumers:
+            consumer.stop()
+        for thread in threads:
+            thread.join(5)
+        publisher.close()
+        context.term()
+
+    def stored():
+        with app.app_context():
+            return [entry.message for entry in
+                    LogEntry.query.filter_by(operation="broker-test").all()]
+
+    deadline = time.time() + 5
+    while len(stored()) < 400 and time.time() < deadline:
+        time.sleep(0.05)
+    assert sorted(stored(), key=int) == [str(i) for i in range(400)]
+    assert all(consumer.stored > 0 for consumer in consumers)
+
+
+def test_retention_rollup_and_prune(app, db):
+    """
+    Test that the retention rolls old rows into hourly aggregates, prunes them
+    in batches, keeps recent rows and does not count an hour twice.
+    """
+    from datetime import datetime, timedelta
+    from app.models.log import LogEntry
+    from app.models.request import MathRequest
+    from app.models.rollup import HourlyRollup
+    from app.utils.retention import RetentionManager
+
+    hour = datetime(2023, 3, 1, 10)
+    now = datetime(2024, 6, 1)
+    with app.app_context():
+        db.session.execute(db.insert(MathRequest), [
+            {"operation": "retained", "input_value": str(i), "result": "0",
+             "processing_time": float(i), "timestamp": hour + timedelta(seconds=i)}
+            for i in range(1, 101)] + [
+            {"operation": "retained", "input_value": "late", "result": "0",
+             "processing_time": 1.0, "timestamp": hour + timedelta(hours=2)},
+            {"operation": "retained", "input_value": "recent", "result": "0",
+             "processing_time": 1.0, "timestamp": now - timedelta(days=1)}])
+        db.session.execute(db.insert(LogEntry), [
+            {"level": level, "message": "m", "operation": "Retained",
+             "created_at": hour + timedelta(minutes=1)}
+            for level in ("INFO", "INFO", "ERROR")])
+        db.session.commit()
+
+    manager = RetentionManager(db)
+    manager.init_app(app)
+    manager.retention_days, manager.batch_size, manager.batch_pause = 30, 7, 0
+    result = manager.run_once(now=now)
+    assert result["requests_pruned"] >= 101
+    assert result["logs_pruned"] >= 3
+
+    with app.app_context():
+        rollups = HourlyRollup.query.filter_by(operation="retained") \
+            .order_by(HourlyRollup.hour).all()
+        assert [r.hour for r in rollups] == [hour, hour + timedelta(hours=2)]
+        first = rollups[0]
+        assert (first.requests, first.logs, first.errors) == (100, 3, 1)
+        assert (first.p50, first.p95, first.p99, first.max_time) == \
+            (50.0, 95.0, 99.0, 100.0)
+        assert first.total_time == 5050.0
+        assert MathRequest.query.filter_by(operation="retained").count() == 1
+
+    assert manager.run_once(now=now)["hours_rolled_up"] == 0
+    with app.app_context():
+        assert HourlyRollup.query.filter_by(operation="retained").count() == 2
+
+
+def test_retention_collects_unreferenced_result_files(app, db, tmp_path):
+    """
+    Test that the retention deletes the result files no row references, and
+    keeps referenced files and recently written ones.
+    """
+    from app.models.request import MathRequest
+    from app.utils.result_store import ResultStore
+    from app.utils.retention import RetentionManager
+
+    store = ResultStore(str(tmp_path), inline_bits=64)
+    kept, orphan, fresh = (store.put(7 ** (500 + i)) for i in range(3))
+    stale = os.path.join(os.path.dirname(store._file(orphan)), "x.tmp")
+    open(stale, "wb").close()
+    old = time.time() - 2 * 3600
+    for path in (store._file(kept), store._file(orphan), stale):
+        os.utime(path, (old, old))
+    with app.app_context():
+        db.session.add(MathRequest(operation="collected", input_value="7^500",
+                                   result=None, result_hash=kept,
+                                   processing_time=0.1))
+        db.session.commit()
+
+    manager = RetentionManager(db, results=store)
+    manager.init_app(app)
+    with app.app_context():
+        assert manager.collect_results() == 2
+    assert store.get(kept) == 7 ** 500
+    assert store.get(orphan) is None and not os.path.exists(stale)
+    assert store.get(fresh) == 7 ** 502
+
+    # Reusing a file marks it as fresh until its row is inserted
+    os.utime(store._file(fresh), (old, old))
+    store.put(7 ** 502)
+    with app.app_context():
+        assert manager.collect_results() == 0
+
+
+def record_stats_in_process(path, group, published, done):
+    """
+    Record statistics in another process, publish them, and keep running until
+    done is set.
+    """
+    from app.utils.stats import StreamingStats
+
+    stats = StreamingStats(path=path, group=group)
+    for duration in (0.1, 0.2, 0.3):
+        stats.record("power", duration)
+    stats.record_error("power")
+    stats.publish()
+    published.set()
+    done.wait(30)
+
+
+def test_quantile_sketch_accuracy_and_merge():
+    """
+    Test that the sketch quantiles stay within the relative accuracy, and that
+    merging two sketches gives the sketch of all their values.
+    """
+    import random
+    from app.utils.stats import QuantileSketch
+
+    rng = random.Random(1)
+    values = [rng.lognormvariate(-6, 1.5) for _ in range(10_000)]
+    left, right, whole = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for i, value in enumerate(values):
+        (left if i % 2 else right).add(value)
+        whole.add(value)
+    left.merge(right)
+    assert left.buckets == whole.buckets and left.count == whole.count
+
+    ordered = sorted(values)
+    for q in (0.5, 0.9, 0.95, 0.99):
+        exact = ordered[math.ceil(q * len(ordered)) - 1]
+        assert abs(left.quantile(q) - exact) <= 0.01 * exact
+
+    restored = QuantileSketch.from_dict(left.to_dict())
+    assert restored.quantile(0.99) == left.quantile(0.99)
+    assert QuantileSketch().quantile(0.5) is None
+
+    # Nearest rank on a few values: the p99 of four values is the largest
+    small = QuantileSketch()
+    for value in (1.0, 2.0, 3.0, 4.0):
+        small.add(value)
+    for q, expected in ((0.0, 1.0), (0.25, 1.0), (0.5, 2.0), (0.51, 3.0),
+                        (0.99, 4.0), (1.0, 4.0)):
+        assert abs(small.quantile(q) - expected) <= 0.01 * expected
+    small.add(0.0)
+    assert small.quantile(0.2) == 0.0 and small.quantile(0.21) > 0
+
+
+def test_streaming_stats_background_publish(tmp_path):
+    """
+    Test that records not yet published are published by the background
+    thread, without any further record() call.
+    """
+    import sqlite3
+    import orjson
+    from app.utils.stats import StreamingStats
+
+    path = str(tmp_path / "stats.sqlite3")
+    stats = StreamingStats(path=path, group="idle", publish_interval=0.05)
+    stats.record("power", 0.1)
+    stats.record("power", 0.2)
+
+    def published():
+        row = sqlite3.connect(path).execute(
+            "SELECT data FROM snapshots WHERE grp = 'idle' AND pid = ?",
+            (os.getpid(),)).fetchone()
+        return orjson.loads(row[0])["power"]["count"] if row else 0
+
+    deadline = time.monotonic() + 5
+    while published() < 2 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert published() == 2
+
+
+def test_streaming_stats_merge_across_processes(tmp_path):
+    """
+    Test that the statistics of every running process of a group are merged,
+    and that those of processes that exited are dropped.
+    """
+    from app.utils.stats import StreamingStats
+
+    path = str(tmp_path / "stats.sqlite3")
+    context = multiprocessing.get_context("spawn")
+    published, done = context.Event(), context.Event()
+    process = context.Process(target=record_stats_in_process,
+                              args=(path, "4242", published, done))
+    process.start()
+    assert published.wait(30)
+
+    stats = StreamingStats(path=path, group="4242")
+    stats.record("power", 0.4)
+    stats.record("fibonacci", 0.001)
+    summary = stats.summary()
+    assert summary["workers"] == 2
+    power = summary["operations"]["power"]
+    assert power["count"] == 4 and power["errors"] == 1
+    assert power["error_rate"] == 0.2
+    assert abs(power["avg_time"] - 0.25) < 1e-9
+    assert power["max_time"] == 0.4
+    assert abs(power["p50"] - 0.2) <= 0.01 * 0.2
+    assert summary["operations"]["fibonacci"]["count"] == 1
+
+    other_group = StreamingStats(path=path, group="1")
+    assert other_group.summary()["workers"] == 1
+
+    done.set()
+    process.join(timeout=30)
+    assert stats.summary()["workers"] == 1
+    assert stats.summary()["operations"]["power"]["count"] == 1
+
+
+def test_result_store_roundtrip_and_prepare_row(tmp_path):
+    """
+    Test that large results are stored once, read back exactly, and that small
+    ones stay inline.
+    """
+    import math
+    from app.utils.result_store import ResultStore, decimal_digits
+
+    for value in (0, 9, 10, 10 ** 18 - 1, 10 ** 18, 10 ** 400 - 1, 10 ** 400,
+                  -(3 ** 1000), math.factorial(1000)):
+        assert decimal_digits(value) == len(str(abs(value)))
+
+    store = ResultStore(str(tmp_path), inline_bits=64, inline_chars=10)
+    big = -(7 ** 500)
+    digest = store.put(big)
+    assert store.put(big) == digest
+    assert store.get(digest) == big
+    assert store.get("0" * 64) is None
+    assert store.get("../" * 22) is None
+
+    small = store.prepare_row({"operation": "power", "value": 2 ** 63})
+    assert small == {"operation": "power", "result": str(2 ** 63)}
+    row = store.prepare_row({"operation": "power", "value": big})
+    assert row["result"] is None and "value" not in row
+    assert row["result_digits"] == len(str(big)) - 1
+    assert row["result_hash"] == digest
+    assert os.path.isfile(os.path.join(str(tmp_path), row["result_ref"]))
+    assert store.prepare_row(row) == row
+    text = store.prepare_row({"value": "1/3" * 10})
+    assert store.get(text["result_hash"]) == "1/3" * 10
+
+    # Exact fractions are stored without a decimal conversion, even beyond the
+    # digit limit of str()
+    from fractions import Fraction
+    assert store.prepare_row({"value": Fraction(-1, 3)})["result"] == "-1/3"
+    fraction = Fraction(33, 10) ** 20_000
+    row = store.prepare_row({"operation": "power", "value": fraction})
+    assert row["result"] is None
+    assert row["result_digits"] == decimal_digits(fraction.numerator) + 1 + \
+        decimal_digits(fraction.denominator)
+    assert store.get(row["result_hash"]) == fraction
+
+
+def test_int_to_decimal_and_result_formats():
+    """
+    Test the divide-and-conquer decimal conversion against str() and the
+    binary result formats.
+    """
+    import base64
+    import math
+    from fractions import Fraction
+    from app.utils.formatting import int_to_decimal, format_result, to_text
+
+    for value in (0, 7, -12345, 2 ** 12_000, 10 ** 4000 - 1, -(10 ** 4000),
+                  math.factorial(1400), 3 ** 8000 + 1):
+        assert int_to_decimal(value) == str(value)
+    huge = 7 ** 40_000
+    digits = int_to_decimal(huge)
+    assert len(digits) == 33_804 and int(digits[:40]) == huge // 10 ** 33_764
+    assert to_text(Fraction(-(3 ** 9000), 2 ** 14_000)) == \
+        f"{-(3 ** 9000)}/{2 ** 14_000}"
+
+    assert format_result(-31, "hex") == ("-0x1f", "hex")
+    text, fmt = format_result(-(2 ** 70), "base64")
+    assert fmt == "base64"
+    assert int.from_bytes(base64.b64decode(text), "big", signed=True) == -(2 ** 70)
+    assert format_result(0.5, "hex") == ("0.5", "decimal")
+
+
+def test_zmq_logger_overflow_policies():
+    """
+    Test that a full logger queue drops or samples records according to its
+    policy and counts them, without blocking the caller.
+    """
+    from app.utils.zmq_logger import ZMQLogger
+
+    class PausedLogger(ZMQLogger):
+        def _ensure_thread(self):
+            pass
+
+    newest = PausedLogger(queue_size=10, policy="drop_new")
+    oldest = PausedLogger(queue_size=10, policy="drop_old")
+    for i in range(15):
+        newest.log("info", str(i))
+        oldest.log("info", str(i))
+    assert [record[2] for record in newest._queue] == [str(i) for i in range(10)]
+    assert [record[2] for record in oldest._queue] == [str(i) for i in range(5, 15)]
+    assert newest.stats()["dropped"] == oldest.stats()["dropped"] == 5
+
+    sampled = PausedLogger(queue_size=10, policy="sample", sample_rate=2)
+    for i in range(10):
+        sampled.log("info", str(i))
+    sampled.log("error", "kept")
+    assert [record[2] for record in sampled._queue] == \
+        ["0", "1", "2", "3", "4", "5", "7", "9", "kept"]
+    assert sampled.sampled_out == 2
+
+    # Counters stay exact when many threads drop and sample at once
+    for policy in ("drop_new", "drop_old", "sample"):
+        crowded = PausedLogger(queue_size=100, policy=policy, sample_rate=3)
+        threads = [threading.Thread(target=lambda: [crowded.log("info", "x")
+                                                    for _ in range(5000)])
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = crowded.stats()
+        assert stats["queue_depth"] + stats["dropped"] + stats["sampled_out"] == 40_000
+    with pytest.raises(ValueError):
+        ZMQLogger(policy="block")
+
+
+@pytest.mark.parametrize("wire", ["json", "batch"])
+def test_zmq_logger_sends_from_many_threads(wire):
+    """
+    Test that records logged concurrently by many threads are all published by
+    the sender thread, one per message or packed in batch frames.
+    """
+    import zmq
+    import orjson
+    from app.utils.log_wire import decode_batch, is_batch_topic
+    from app.utils.zmq_logger import ZMQLogger
+
+    def receive(subscriber):
+        topic, payload = subscriber.recv_multipart()
+        if is_batch_topic(topic):
+            return [(record["level"], record["message"])
+                    for record in decode_batch(payload)]
+        return [(topic.decode(), orjson.loads(payload)["message"])]
+
+    context = zmq.Context()
+    subscriber = context.socket(zmq.SUB)
+    subscriber.setsockopt(zmq.SUBSCRIBE, b"")
+    subscriber.setsockopt(zmq.RCVTIMEO, 5000)
+    port = subscriber.bind_to_random_port("tcp://127.0.0.1")
+    logger = ZMQLogger(f"tcp://127.0.0.1:{port}", wire=wire, batch_size=64,
+                       linger=0.01)
+    try:
+        # Wait for the subscription to reach the publisher
+        while True:
+            logger.log("info", "warmup")
+            if subscriber.poll(100):
+                break
+        while subscriber.poll(100):
+            subscriber.recv_multipart()
+        warmup = logger.stats()["sent"]
+
+        def log_many(thread):
+            for i in range(250):
+                logger.log("error" if i % 50 == 0 else "info", f"{thread}-{i}",
+                           context={"i": i}, operation="Test")
+
+        threads = [threading.Thread(target=log_many, args=(t,)) for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        logger.close()
+
+        messages = []
+        while len(messages) < 1000:
+            messages += receive(subscriber)
+        assert len({message for _, message in messages}) == 1000
+        assert sum(level == "ERROR" for level, _ in messages) == 20
+        stats = logger.stats()
+        assert stats["sent"] - warmup == 1000 and stats["dropped"] == 0
+    finally:
+        logger.close()
+        subscriber.close(linger=0)
+        context.term()
+
+
+@pytest.mark.parametrize("wire", ["json", "batch"])
+def test_zmq_logger_levels_filtered_by_topic(wire):
+    """
+    Test that a subscriber to the INFO and ERROR topics, like the log broker,
+    receives the records of these levels only, in both wire formats.
+    """
+    import zmq
+    import orjson
+    from app.utils.log_wire import decode_batch, is_batch_topic
+    from app.utils.zmq_logger import ZMQLogger
+
+    context = zmq.Context()
+    subscriber = context.socket(zmq.SUB)
+    for topic in (b"INFO", b"ERROR"):
+        subscriber.setsockopt(zmq.SUBSCRIBE, topic)
+    port = subscriber.bind_to_random_port("tcp://127.0.0.1")
+    logger = ZMQLogger(f"tcp://127.0.0.1:{port}", wire=wire, linger=0.01)
+    try:
+        while True:
+            logger.log("info", "warmup")
+            if subscriber.poll(100):
+                break
+        while subscriber.poll(100):
+            subscriber.recv_multipart()
+
+        for level in ("debug", "info", "warning", "error", "info"):
+            logger.log(level, level)
+        logger.close()
+
+        received = []
+        while subscriber.poll(500):
+            topic, payload = subscriber.recv_multipart()
+            if is_batch_topic(topic):
+                received += [record["message"] for record in decode_batch(payload)]
+            else:
+                received.append(orjson.loads(payload)["message"])
+        assert sorted(received) == ["error", "info", "info"]
+    finally:
+        logger.close()
+        subscriber.close(linger=0)
+        context.term()
+
+
+def test_log_wire_batch_roundtrip():
+    """
+    Test that batch frames keep every field of the records, including contexts
+    orjson cannot encode and timestamps far apart, that records whose context
+    cannot be encoded are left out alone, and that invalid frames are rejected.
+    """
+    from app.utils.log_wire import encode_batch, decode_batch
+
+    circular = {}
+    circular["self"] = circular
+    records = [
+        (1700000000.000001, "info", "première", {"n": 5}, "Factorial"),
+        (1700000000.25, "ERROR", "failed", None, None),
+        (1699999999.5, "notice", "clock went back", {"a": [1, 2]}, "Factorial"),
+        (1700000001.0, "info", "circular", circular, None),
+        (1700100000.0, "info", "huge", {"base": 10 ** 20}, "Power"),
+    ]
+    frame, skipped = encode_batch(records, "host-1")
+    assert skipped == 1
+    decoded = decode_batch(frame)
+    assert [(r["level"], r["message"], r["context"], r["operation"], r["source"])
+            for r in decoded] == [
+        ("INFO", "première", {"n": 5}, "Factorial", "host-1"),
+        ("ERROR", "failed", {}, None, "host-1"),
+        ("NOTICE", "clock went back", {"a": [1, 2]}, "Factorial", "host-1"),
+        ("INFO", "huge", {"base": 10 ** 20}, "Power", "host-1"),
+    ]
+    assert [round(r["timestamp"], 6) for r in decoded] == \
+        [1700000000.000001, 1700000000.25, 1699999999.5, 1700100000.0]
+    assert decode_batch(encode_batch([], "host-1")[0]) == []
+    for invalid in (b"", b"{}", frame[:-3], b"LB\x09" + frame[3:]):
+        with pytest.raises(ValueError):
+            decode_batch(invalid)
+
+
+def test_zmq_log_consumer_reads_batch_and_json_frames(app):
+    """
+    Test that the consumer stores records from batch frames, with the time
+    they were logged, alongside JSON frames.
+    """
+    import orjson
+    from datetime import datetime
+    from app.consumers.zmq_log_consumer import ZMQLogConsumer
+    from app.models.log import LogEntry
+    from app.utils.log_wire import batch_topic, encode_batch
+
+    logged_at = datetime(2021, 5, 4, 3, 2, 1).timestamp()
+    frame, _ = encode_batch([(logged_at, "info", f"wire {i}", {"i": i}, "wire-test")
+                             for i in range(3)], "host-1")
+    consumer = ZMQLogConsumer(address="inproc://unused", app=app)
+    try:
+        with app.app_context():
+            consumer.handle_messages([
+                (batch_topic("info"), frame),
+                (b"ERROR", orjson.dumps({"level": "error", "message": "wire json",
+                                         "operation": "wire-test"})),
+                (batch_topic("info"), b"garbage"),
+            ])
+            entries = LogEntry.query.filter_by(operation="wire-test") \
+                .order_by(LogEntry.id).all()
+        assert [entry.message for entry in entries] == [
+            "wire 0", "wire 1", "wire 2", "wire json"]
+        assert entries[1].details == {"i": 1}
+        assert entries[0].created_at == datetime.utcfromtimestamp(logged_at)
+        assert consumer.received == 4 and consumer.stored == 4
+    finally:
+        consumer.subscriber.close()
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    """
+    Test that concurrent calls for the same key run the function once and all
+    get its result or its error.
+    """
+    from app.utils.single_flight import SingleFlight
+
+    flights = SingleFlight(shared=False)
+    calls = []
+    started = threading.Event()
+
+    def compute(n):
+        calls.append(n)
+        started.set()
+        time.sleep(0.2)
+        if n < 0:
+            raise ValueError("negative")
+        return n * 2
+
+    def run(n, results):
+        try:
+            results.append(flights.do(f"key-{n}", compute, n))
+        except ValueError as e:
+            results.append(str(e))
+
+    for n, expected in ((21, 42), (-1, "negative")):
+        results = []
+        started.clear()
+        leader = threading.Thread(target=run, args=(n, results))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=run, args=(n, results))
+                     for _ in range(7)]
+        for thread in followers:
+            thread.start()
+        for thread in [leader] + followers:
+            thread.join()
+        assert results == [expected] * 8
+    assert calls == [21, -1]
+    assert flights.stats() == {"shared": False, "in_flight": 0, "leaders": 2,
+                               "coalesced": 14, "shared_waits": 0,
+                               "shared_timeouts": 0}
+    assert flights.do("key-21", compute, 21) == 42 and len(calls) == 3
+
+
+def test_single_flight_across_processes_through_cache(tmp_path):
+    """
+    Test that a leader waits while another process holds the lock of a key,
+    then uses the value it cached instead of computing it again.
+    """
+    from app.utils.single_flight import SingleFlight
+
+    shared_cache = SharedMemoryCache(path=str(tmp_path / "cache.sqlite3"))
+    first = SingleFlight(shared_cache, poll_interval=0.01)
+    second = SingleFlight(shared_cache, poll_interval=0.01)
+    computed = []
+    started = threading.Event()
+
+    def memoized(key, delay):
+        value = shared_cache.get(key)
+        if value is None:
+            computed.append(key)
+            started.set()
+            time.sleep(delay)
+            value = len(computed)
+            shared_cache.set(key, value)
+        return value
+
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(first.do("fact", memoized, "fact", 0.3)))
+    thread.start()
+    started.wait(5)
+    assert shared_cache.locked("fact:single-flight")
+    results.append(second.do("fact", memoized, "fact", 0))
+    thread.join()
+    assert results == [1, 1] and computed == ["fact"]
+    assert second.stats()["shared_waits"] == 1
+    assert not shared_cache.locked("fact:single-flight")
+
+    # A failed leader releases the lock so that the next one can compute
+    with pytest.raises(ZeroDivisionError):
+        first.do("broken", lambda: 1 / 0)
+    assert second.do("broken", lambda: "recovered") == "recovered"
+
+
+def test_single_flight_lock_not_admitted_or_held_too_long(tmp_path):
+    """
+    Test that a full cache does not keep a leader from taking the lock, that a
+    leader computes the value itself when a backend does not admit the lock
+    entry, and that waiting for a lock that is never released is bounded.
+    """
+    from app.utils.single_flight import SingleFlight
+
+    # Entries of the full cache are worth more than a lock entry would be
+    shared_cache = SharedMemoryCache(path=str(tmp_path / "cache.sqlite3"),
+                                     max_bytes=1000)
+    hint_cost(10.0)
+    assert shared_cache.set("large", b"x" * 975)
+    assert not shared_cache.add("probe", os.getpid())
+    flights = SingleFlight(shared_cache, poll_interval=0.01)
+    assert flights.do("fact", lambda: 42) == 42
+    assert not shared_cache.locked("fact:single-flight")
+
+    class RejectingCache:
+        def __init__(self):
+            self.store = {}
+
+        def has(self, key):
+            return key in self.store
+
+        def add(self, key, value, timeout=None):
+            return False
+
+        def delete(self, key):
+            return self.store.pop(key, None) is not None
+
+    flights = SingleFlight(RejectingCache(), poll_interval=0.01)
+    assert flights.do("fact", lambda: 42) == 42
+    assert flights.stats()["shared_waits"] == 0
+
+    # A lock left by a holder that never releases it
+    assert shared_cache.lock("slow:single-flight", 0, timeout=600)
+    flights = SingleFlight(shared_cache, lock_timeout=0.2, poll_interval=0.01)
+    start = time.monotonic()
+    assert flights.do("slow", lambda: "computed") == "computed"
+    assert 0.2 <= time.monotonic() - start < 2
+    assert asyncio.run(flights.do_async("slow", _async_value)) == "computed"
+    assert flights.stats()["shared_timeouts"] == 2
+
+
+async def _async_value():
+    return "computed"
+
+
+def test_cost_model_calibrates_to_measured_times():
+    """
+    Test that the cost model converges to the power law of the observed compute
+    times, ignores observations dominated by overhead, and calibrates from
+    recorded requests.
+    """
+    from app.utils.admission import CostModel
+
+    model = CostModel()
+    prior = model.estimate("factorial", 100_000)
+    for n in (20_000, 50_000, 100_000, 200_000, 400_000) * 30:
+        model.observe("factorial", (n,), 3e-12 * MathService.estimate_cost(
+            "factorial", n) ** 1.8)
+    model.observe("factorial", (10,), 5.0)
+    model.observe("factorial", (300_000,), 1e-4)
+    expected = 3e-12 * MathService.estimate_cost("factorial", 1_000_000) ** 1.8
+    assert model.estimate("factorial", 1_000_000) == pytest.approx(expected, rel=0.05)
+    assert model.stats()["factorial"]["exponent"] == pytest.approx(1.8, abs=0.02)
+    assert model.stats()["factorial"]["observations"] == 150
+
+    # Inputs of a single size calibrate the scale only
+    fresh = CostModel()
+    fresh.calibrate([("factorial", "100000", prior * 3), ("factorial", "x", 1.0),
+                     ("power", "2^10", 1.0)])
+    assert fresh.estimate("factorial", 100_000) == pytest.approx(prior * 3)
+    assert fresh.stats()["factorial"]["exponent"] == CostModel.PRIORS["factorial"][1]
+    assert fresh.stats()["power"]["observations"] == 0
+
+
+def test_admission_controller_budget():
+    """
+    Test that the admission controller bypasses cheap computations, queues ones
+    that do not fit until the budget frees up, and rejects the rest with a
+    Retry-After estimate.
+    """
+    from app.utils.admission import AdmissionController
+    from app.utils.errors import OverloadedAppError
+
+    admission = AdmissionController(budget=10.0, cheap_cost=0.1, max_wait=0.2)
+    assert admission.acquire(0.01) is None
+    first = admission.acquire(6.0)
+    with pytest.raises(OverloadedAppError) as error:
+        admission.acquire(5.0)
+    assert error.value.retry_after == 6
+    body, status, headers = error.value.to_response()
+    assert status == 503 and headers == {"Retry-After": "6"}
+    with pytest.raises(OverloadedAppError) as error:
+        admission.acquire(11.0)
+    assert error.value.retry_after is None
+
+    admitted = []
+    thread = threading.Thread(target=lambda: admitted.append(admission.acquire(
+        5.0, timeout=5)))
+    thread.start()
+    time.sleep(0.05)
+    assert not admitted
+    admission.release(first)
+    thread.join()
+    with admission.admit(4.0):
+        assert admission.stats()["in_flight"] == pytest.approx(9.0)
+    admission.release(admitted[0])
+
+    stats = admission.stats()
+    assert stats["in_flight"] == 0 and stats["running"] == 0
+    assert (stats["admitted"], stats["queued"], stats["rejected"],
+            stats["bypassed"]) == (3, 1, 2, 1)
+
+
+def test_async_worker_lanes_priority_aging_and_limits():
+    """
+    Test that queued cheap tasks overtake expensive ones, that a task waiting
+    long enough overtakes cheaper ones, that lane limits keep workers free for
+    other lanes, and that queue wait and run time are recorded per operation.
+    """
+    def blocked(gate, name, order):
+        gate.wait(5)
+        order.append(name)
+
+    lanes = AsyncWorker(max_workers=1, interactive_cost=10, bulk_cost=100, aging=60)
+    try:
+        gate, order = threading.Event(), []
+        lanes.run(blocked, gate, "gate", order, cost=50, operation="gate")
+        bulk = lanes.run(order.append, "bulk", cost=1000, operation="bulk")
+        standard = lanes.run(order.append, "standard", operation="standard")
+        cheap = lanes.run(order.append, "cheap", cost=1, operation="cheap")
+        assert lanes.stats()["lanes"]["bulk"]["queued"] == 1
+        gate.set()
+        bulk.result(timeout=5)
+        assert order == ["gate", "cheap", "standard", "bulk"]
+        assert cheap.done() and standard.done()
+        stats = lanes.stats()
+        assert stats["lanes"]["bulk"] == {"queued": 0, "running": 0, "limit": None}
+        bulk_wait = stats["operations"]["bulk"]["queue_wait"]
+        assert bulk_wait["count"] == 1 and bulk_wait["p50"] > 0
+        assert sum(count for _, count in bulk_wait["buckets"]) == 1
+        assert stats["operations"]["gate"]["run_time"]["p50"] > 0
+    finally:
+        lanes.shutdown()
+
+    aged = AsyncWorker(max_workers=1, interactive_cost=10, bulk_cost=100, aging=0.05)
+    try:
+        gate, order = threading.Event(), []
+        aged.run(blocked, gate, "gate", order, cost=50)
+        aged.run(order.append, "bulk", cost=1000)
+        time.sleep(0.2)
+        aged.run(order.append, "cheap", cost=1).cancel()
+        last = aged.run(order.append, "cheap", cost=1)
+        gate.set()
+        last.result(timeout=5)
+        assert order == ["gate", "bulk", "cheap"]
+    finally:
+        aged.shutdown()
+
+    limited = AsyncWorker(max_workers=2, bulk_cost=100, lane_limits={"bulk": 1})
+    try:
+        gate, order = threading.Event(), []
+        first = limited.run(blocked, gate, "bulk-1", order, cost=1000)
+        second = limited.run(blocked, gate, "bulk-2", order, cost=1000)
+        assert limited.run(order.append, "standard", cost=50).result(timeout=5) \
+            is None
+        assert order == ["standard"] and not second.running()
+        gate.set()
+        first.result(timeout=5)
+        second.result(timeout=5)
+        assert order == ["standard", "bulk-1", "bulk-2"]
+    finally:
+        limited.shutdown()
+
+
+def test_admission_calibrates_from_recent_history_in_background(app, db):
+    """
+    Test that the first estimate calibrates the cost model from the latest
+    recorded requests in a background thread, using the slowest record of each
+    input and at most `history` rows per operation.
+    """
+    from app.models.request import MathRequest
+    from app.utils.admission import AdmissionController
+
+    with app.app_context():
+        db.session.execute(db.insert(MathRequest), [
+            {"operation": "factorial", "input_value": str(n), "result": "0",
+             "processing_time": seconds}
+            for n, seconds in ((900_001, 9.0), (100_001, 0.5), (100_001, 1e-5),
+                               (200_001, 2.0))])
+        db.session.commit()
+
+        admission = AdmissionController(db, history=3)
+        assert admission.calibrate(app) >= 2
+        fit = admission.model.stats()["factorial"]
+        assert fit["observations"] == 2
+
+        admission = AdmissionController(db, history=3)
+        admission.estimate("factorial", 10)
+        admission._calibration.join(5)
+        assert admission.model.stats()["factorial"] == fit
+        admission.estimate("factorial", 10)
+        assert not admission._calibration.is_alive()